@@ -0,0 +1,205 @@
+import hashlib
+import mimetypes
+import sys
+import urllib.request
+from pathlib import Path
+
+import flask
+
+import bitacora
+
+# ========== RECURSOS ESTÁTICOS PROPIOS (FUENTES, LOGOS Y HOJA DE ESTILOS) ==========
+# Los archivos de estaticos/ se sirven desde la propia app con el hash del contenido en el
+# nombre (logo_imss.3f9a1c2b7e.svg) y caché inmutable de un año: una nueva versión del archivo
+# tiene otra URL, así que el navegador nunca revalida. Se preparan una vez con
+#
+#   python activos.py
+#
+# que descarga logos y Bootstrap, y recorta Montserrat a los caracteres que usa la aplicación.
+# Mientras un archivo no exista se usa su origen remoto, como antes.
+
+DIRECTORIO = Path(__file__).parent / 'estaticos'
+
+# Ruta (bajo url_base_pathname) desde la que se sirven los recursos
+RUTA = 'recursos/'
+
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+# Archivo local -> origen remoto (respaldo en tiempo de ejecución y fuente de la descarga)
+ORIGENES = {
+    'logo_gobierno.svg': 'https://framework-gb.cdn.gob.mx/landing/img/logoheader.svg',
+    'logo_imss.svg': 'https://imss.gob.mx/assets/img/logo_imss.svg',
+    'bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.5/dist/css/bootstrap.min.css',
+}
+
+# Pesos de Montserrat que usa el layout (normal y las negritas de fw-bold/fontWeight 'bold')
+FUENTES = {
+    'montserrat-400.woff2': (400, 'https://github.com/JulietaUla/Montserrat/raw/master/fonts/ttf/Montserrat-Regular.ttf'),
+    'montserrat-700.woff2': (700, 'https://github.com/JulietaUla/Montserrat/raw/master/fonts/ttf/Montserrat-Bold.ttf'),
+}
+FUENTES_REMOTAS = 'https://fonts.googleapis.com/css2?family=Montserrat:wght@400;700&display=swap'
+
+# Hoja de estilos con los @font-face; se genera al cargar para apuntar a las fuentes con hash
+HOJA_FUENTES = 'fuentes.css'
+
+
+def _huella(nombre, contenido):
+    ruta = Path(nombre)
+    return f"{ruta.stem}.{hashlib.sha256(contenido).hexdigest()[:10]}{ruta.suffix}"
+
+
+class Recursos:
+    def __init__(self, base, archivos):
+        self.base = base
+        # nombre original -> nombre con hash; nombre con hash -> (bytes, mimetype)
+        self._huellas = {}
+        self._contenidos = {}
+        for nombre, contenido in archivos.items():
+            self._agregar(nombre, contenido)
+
+        caras = [
+            "@font-face{font-family:'Montserrat';font-style:normal;font-weight:%d;font-display:swap;"
+            "src:url('%s') format('woff2')}" % (peso, self.url(nombre))
+            for nombre, (peso, _) in FUENTES.items() if nombre in self._huellas
+        ]
+        if caras:
+            self._agregar(HOJA_FUENTES, "\n".join(caras).encode())
+
+    def _agregar(self, nombre, contenido):
+        huella = _huella(nombre, contenido)
+        self._huellas[nombre] = huella
+        self._contenidos[huella] = (contenido, mimetypes.guess_type(nombre)[0] or 'application/octet-stream')
+
+    def url(self, nombre):
+        if nombre in self._huellas:
+            return f"{self.base}{RUTA}{self._huellas[nombre]}"
+        return ORIGENES.get(nombre)
+
+    def hojas_estilo(self):
+        fuentes = self.url(HOJA_FUENTES) or FUENTES_REMOTAS
+        return [fuentes, self.url('bootstrap.min.css')]
+
+    # index_string de Dash con <link rel="preload"> de las fuentes locales, para que se
+    # descarguen junto con el CSS y no hasta que el navegador encuentre el primer texto
+    def index_con_precarga(self, index_string):
+        precargas = "".join(
+            f'<link rel="preload" href="{self.url(nombre)}" as="font" type="font/woff2" crossorigin>'
+            for nombre in FUENTES if nombre in self._huellas
+        )
+        return index_string.replace("{%css%}", precargas + "{%css%}", 1)
+
+    def faltantes(self):
+        return [nombre for nombre in (*ORIGENES, *FUENTES) if nombre not in self._huellas]
+
+    def registrar(self, server):
+        @server.route(f"{self.base}{RUTA}<nombre>")
+        def recurso_estatico(nombre):
+            encontrado = self._contenidos.get(nombre)
+            if encontrado is None:
+                flask.abort(404)
+            contenido, mimetype = encontrado
+            respuesta = flask.Response(contenido, mimetype=mimetype)
+            respuesta.headers['Cache-Control'] = CACHE_INMUTABLE
+            # Las fuentes se piden con crossorigin (preload y @font-face)
+            respuesta.headers['Access-Control-Allow-Origin'] = '*'
+            return respuesta
+
+        return recurso_estatico
+
+
+# Lee estaticos/ una sola vez al arrancar (son unos cuantos KB). Con estricto, un archivo
+# faltante detiene el arranque en vez de caer en silencio a su origen remoto
+def cargar(base, directorio=DIRECTORIO, estricto=False):
+    archivos = {}
+    if directorio.is_dir():
+        archivos = {
+            ruta.name: ruta.read_bytes()
+            for ruta in directorio.iterdir()
+            if ruta.name in ORIGENES or ruta.name in FUENTES
+        }
+    recursos = Recursos(base, archivos)
+    faltantes = recursos.faltantes()
+    if faltantes:
+        # Se generan con `python activos.py`
+        bitacora.advertencia('recursos_remotos', faltantes=faltantes)
+        if estricto:
+            raise RuntimeError(f"Faltan recursos en {directorio}: {', '.join(faltantes)}")
+    return recursos
+
+
+# ========== PREPARACIÓN (SE EJECUTA UNA VEZ, CON RED) ==========
+
+def _descargar(url):
+    with urllib.request.urlopen(url, timeout=60) as respuesta:
+        return respuesta.read()
+
+
+# Textos de un layout de Dash (children, labels, placeholders...)
+def _textos(nodo):
+    if isinstance(nodo, str):
+        yield nodo
+    elif isinstance(nodo, (list, tuple)):
+        for elemento in nodo:
+            yield from _textos(elemento)
+    elif isinstance(nodo, dict):
+        for valor in nodo.values():
+            yield from _textos(valor)
+    elif hasattr(nodo, 'to_plotly_json'):
+        yield from _textos(nodo.to_plotly_json().get('props', {}))
+
+
+# Caracteres que puede mostrar la aplicación: textos del layout y del catálogo vigente
+# (entidades y nombres de unidades), más ASCII imprimible
+def caracteres_usados():
+    import app
+    import datos
+
+    datos.esperar_carga()
+    snapshot = datos.snapshot_actual()
+    caracteres = {chr(codigo) for codigo in range(0x20, 0x7F)}
+    for texto in _textos(app.construir_layout()):
+        caracteres.update(texto)
+    for texto in (*snapshot.indice_busqueda.nombres, *snapshot.indice_busqueda.entidades):
+        caracteres.update(texto or '')
+    return ''.join(sorted(caracteres))
+
+
+def recortar_fuente(ttf, caracteres):
+    try:
+        from fontTools import subset
+        from fontTools.ttLib import TTFont
+    except ImportError:
+        sys.exit("Para recortar las fuentes instale fonttools: pip install fonttools brotli")
+    from io import BytesIO
+
+    fuente = TTFont(BytesIO(ttf))
+    opciones = subset.Options()
+    opciones.flavor = 'woff2'
+    opciones.layout_features = ['kern', 'liga']
+    opciones.name_IDs = []
+    recortador = subset.Subsetter(opciones)
+    recortador.populate(text=caracteres)
+    recortador.subset(fuente)
+    salida = BytesIO()
+    fuente.save(salida)
+    return salida.getvalue()
+
+
+def preparar(directorio=DIRECTORIO):
+    directorio.mkdir(exist_ok=True)
+    for nombre, url in ORIGENES.items():
+        contenido = _descargar(url)
+        (directorio / nombre).write_bytes(contenido)
+        print(f"{nombre}: {len(contenido) / 1024:.1f} KB")
+
+    caracteres = caracteres_usados()
+    print(f"Glifos usados: {len(caracteres)}")
+    for nombre, (_, url) in FUENTES.items():
+        original = _descargar(url)
+        recortada = recortar_fuente(original, caracteres)
+        (directorio / nombre).write_bytes(recortada)
+        print(f"{nombre}: {len(original) / 1024:.1f} KB -> {len(recortada) / 1024:.1f} KB")
+
+
+if __name__ == '__main__':
+    preparar()
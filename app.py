@@ -1,15 +1,42 @@
-from dash import Dash, html, dcc, dash_table, Input, Output, State, callback_context
-import polars as pl
-import pandas as pd
+# Antes de las demás importaciones, para medir también cuánto tardan
+import time
+INICIO_ARRANQUE = time.perf_counter()
+
+from dash import Dash, html, dcc, dash_table, Input, Output, State, ALL, ClientsideFunction, no_update
 import os
 import re
 from dash.exceptions import PreventUpdate
-import dash_bootstrap_components as dbc
-from io import BytesIO
-from datetime import datetime
+import dash_bootstrap_components as dbc  # noqa: F401 (las alertas se arman en assets/clientside.js)
+from datetime import datetime, timezone
 from pathlib import Path
 import flask
+import hmac
+import activos
+import bitacora
+import cobertura
+import datos
+import compresion
+import metricas
+import persistencia
+import exportacion
+import resumenes
+import sesiones
+import sincronizacion
+import horarios
+from horarios import servicios_options, dias_semana, turnos
 BASE_DIR = Path(__file__).parent
+
+# Duración de cada fase del arranque (segundos), para la bitácora
+fases_arranque = {'importaciones': time.perf_counter() - INICIO_ARRANQUE}
+_ultima_fase = time.perf_counter()
+
+
+def _fin_de_fase(nombre):
+    global _ultima_fase
+    ahora = time.perf_counter()
+    fases_arranque[nombre] = ahora - _ultima_fase
+    _ultima_fase = ahora
+
 # ========== CONFIGURACIÓN INICIAL ==========
 COLOR_PRIMARIO = '#611232'  # Verde oscuro
 COLOR_SECUNDARIO = '#AE8640'  # Dorado
@@ -18,159 +45,214 @@ COLOR_BORDE = '#7A1737'  # Bordó
 COLOR_TEXTO = '#000000'  # Negro
 COLOR_TITULO = '#AE8640'  # Dorado
 
-# Crear una aplicación Flask para Dash
-flask_server = flask.Flask(__name__)
-
+URL_BASE = "/infraestructura/"
 
+# Fuentes, logos y Bootstrap servidos por la propia app con hash en el nombre (activos.py).
+# Con INFRA_RECURSOS_ESTRICTO=1 no arranca si falta alguno en estaticos/
+recursos = activos.cargar(URL_BASE, estricto=os.environ.get("INFRA_RECURSOS_ESTRICTO") == "1")
+_fin_de_fase('recursos')
 
+# Crear una aplicación Flask para Dash
+flask_server = flask.Flask(__name__)
 
-# Inicialización de la app Dash
-app = Dash(__name__, server=flask_server, suppress_callback_exceptions=True)
-
-# Esto es necesario para Ploomber
-server = app.server
+# Inicialización de la app Dash (una sola instancia sobre el servidor Flask)
 app = Dash(
     __name__,
     server=flask_server,
-    url_base_pathname="/infraestructura/",
+    url_base_pathname=URL_BASE,
     suppress_callback_exceptions=True,
-    external_stylesheets=[
-        'https://fonts.googleapis.com/css2?family=Montserrat:wght@400;600&display=swap',
-        dbc.themes.BOOTSTRAP,
-    ]
+    external_stylesheets=recursos.hojas_estilo()
 )
+app.index_string = recursos.index_con_precarga(app.index_string)
+
+# Esto es necesario para Ploomber
 server = app.server
-# Cargar bases de datos
-try:
-    # Cargar bases
-    df_infra = pl.read_excel(BASE_DIR / "data/infraestructura.xlsx")
-    df_clues = pl.read_excel(BASE_DIR / "data/clues_julio.xlsx")
+recursos.registrar(server)
 
-    # Merge
-    df_merged = df_infra.join(df_clues.select(['clues_imb','entidad']), on='clues_imb', how='left')
+# Id de traza por sesión del navegador (cookie) en cada línea de la bitácora
+bitacora.registrar_traza(server, URL_BASE)
+# Id de sesión (cookie) para la captura en curso guardada en el servidor
+sesiones.registrar(server, URL_BASE)
 
-    # Lista de entidades
-    entidades_options = [{'label': e, 'value': e} for e in df_merged['entidad'].unique().sort().to_list()]
-    
-    print(f"Datos cargados correctamente. {len(df_merged)} registros encontrados.")
-    print(f"Entidades disponibles: {[e['label'] for e in entidades_options]}")
-
-except Exception as e:
-    print(f"Error al cargar archivos: {e}")
-    # Datos de ejemplo en caso de error
-    datos_ejemplo = [
-        {'clues_imb': '01ABC123', 'entidad': 'Aguascalientes', 'nombre_de_la_unidad': 'Hospital General de Aguascalientes', 
-         'consultorios_generales_habilitados': 12, 'consultorios_generales_inhabilitados': 3, 'total_consultorios_generales': 15,
-         'consultorios_de_especialidad_habilitados': 8, 'consultorios_de_especialidad_inhabilitados': 2, 'total_consultorios_de_especialidad': 10,
-         'quirofanos_habilitados': 4, 'quirofanos_inhabilitados': 1, 'total_de_quirofanos': 5},
-        {'clues_imb': '02DEF456', 'entidad': 'Baja California', 'nombre_de_la_unidad': 'Hospital General de Tijuana', 
-         'consultorios_generales_habilitados': 15, 'consultorios_generales_inhabilitados': 5, 'total_consultorios_generales': 20,
-         'consultorios_de_especialidad_habilitados': 10, 'consultorios_de_especialidad_inhabilitados': 2, 'total_consultorios_de_especialidad': 12,
-         'quirofanos_habilitados': 5, 'quirofanos_inhabilitados': 1, 'total_de_quirofanos': 6},
-    ]
-    df_merged = pl.DataFrame(datos_ejemplo)
-    entidades_options = [{'label': 'Aguascalientes', 'value': 'Aguascalientes'}, 
-                        {'label': 'Baja California', 'value': 'Baja California'}]
-
-# Servicios de consultorio
-servicios_options = [
-    {'label': 'Medicina General', 'value': 'medicina_general'},
-    {'label': 'Pediatría', 'value': 'pediatria'},
-    {'label': 'Ginecología', 'value': 'ginecologia'},
-    {'label': 'Cirugía General', 'value': 'cirugia_general'},
-    {'label': 'Traumatología', 'value': 'traumatologia'},
-    {'label': 'Oftalmología', 'value': 'oftalmologia'},
-    {'label': 'Otorrinolaringología', 'value': 'otorrinolaringologia'},
-    {'label': 'Dermatología', 'value': 'dermatologia'},
-    {'label': 'Psiquiatría', 'value': 'psiquiatria'},
-    {'label': 'Odontología', 'value': 'odontologia'},
-]
-
-# Días de la semana
-dias_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-turnos = ['Matutino', 'Vespertino', 'Nocturno']
-
-# Layout principal
-app.layout = html.Div([
-    # Encabezado con logos
-    html.Div([
-        html.Div(className='header-logo', children=[
-            html.Img(
-                src='https://framework-gb.cdn.gob.mx/landing/img/logoheader.svg',
-                style={'height': '50px', 'marginRight': '20px'}
-            ),
-            html.Img(
-                src='https://imss.gob.mx/assets/img/logo_imss.svg',
-                style={'height': '50px'}
-            )
-        ], style={'display': 'flex', 'alignItems': 'center'}),
-    ], style={'backgroundColor': COLOR_PRIMARIO, 'padding': '10px', 'display': 'flex', 'justifyContent': 'space-between', 'alignItems': 'center'}),
-    
-    # Contenido principal
-    html.Div([
+# Compresión gzip/brotli y revalidación (ETag/Last-Modified) de layout y dependencias
+compresion.configurar(
+    server,
+    app.config.url_base_pathname,
+    fecha_layout=lambda: datetime.fromisoformat(datos.snapshot_actual().cargado_en).astimezone(timezone.utc),
+    rutas_estaticas=(activos.RUTA,)
+)
+
+# Latencia, tamaño de payload y resultado de cada callback, expuestos en /metrics
+metricas.instrumentar(app)
+metricas.registro.agregar_colector(lambda: persistencia.obtener_almacen().indicadores())
+metricas.registro.agregar_colector(bitacora.manejador.indicadores)
+metricas.registro.agregar_colector(sesiones.almacen.indicadores)
+
+_fin_de_fase('dash')
+
+# Cargar bases de datos (los callbacks leen siempre el snapshot vigente: datos.snapshot_actual()).
+# Por defecto en un hilo: el servidor escucha de inmediato y /readyz avisa cuando los datos están
+# listos. Con INFRA_CARGA_DIFERIDA=0 se cargan aquí, antes de aceptar conexiones.
+# Con un servidor pre-fork (wsgi.py) aquí no se carga nada: el pool de hilos de Polars no
+# sobrevive al fork y los workers se quedarían bloqueados en su primera consulta. Cada worker
+# carga después del fork (wsgi.iniciar_worker), diferido o no según INFRA_CARGA_DIFERIDA.
+CARGA_DIFERIDA = os.environ.get("INFRA_CARGA_DIFERIDA", "1") == "1"
+PREFORK = os.environ.get("INFRA_PREFORK") == "1"
+
+# Recarga automática cuando cambian los Excel de origen (desactivada si es 0).
+INTERVALO_VIGILANCIA = int(os.environ.get("INFRA_VIGILAR_SEGUNDOS", "0"))
+
+if not PREFORK and not CARGA_DIFERIDA:
+    datos.cargar_inicial()
+    _fin_de_fase('datos')
+    if INTERVALO_VIGILANCIA > 0:
+        datos.iniciar_vigilancia(INTERVALO_VIGILANCIA)
+elif not PREFORK:
+    datos.cargar_en_segundo_plano(INTERVALO_VIGILANCIA, inicio=INICIO_ARRANQUE)
+
+# Mientras se cargan los datos la app responde 503 (salvo salud y métricas); la plataforma
+# no debería enviar tráfico antes de que /readyz responda 200
+@server.before_request
+def esperar_datos():
+    if not datos.listo() and flask.request.path.startswith(URL_BASE):
+        respuesta = flask.jsonify({'error': 'Cargando datos'})
+        respuesta.status_code = 503
+        respuesta.headers['Retry-After'] = '2'
+        return respuesta
+
+# Máximo de resultados que se envían al navegador por búsqueda
+LIMITE_BUSQUEDA = 20
+
+ESTILO_BOTON_HORARIOS = {
+    'backgroundColor': COLOR_PRIMARIO,
+    'color': 'white',
+    'border': 'none',
+    'padding': '8px 16px',
+    'borderRadius': '5px',
+    'cursor': 'pointer'
+}
+
+# Cada cuánto el navegador intenta enviar los cambios capturados sin conexión (ms)
+INTERVALO_SINCRONIZACION = int(os.environ.get("INFRA_SINCRONIZAR_MS", "10000"))
+
+# Layout principal (función: cada carga de página toma las entidades del snapshot vigente)
+def construir_layout():
+    snapshot = datos.snapshot_actual()
+    # Dash valida el layout en la primera petición, que puede llegar (/healthz) antes que los datos
+    entidades_options = snapshot.entidades_options if snapshot is not None else []
+    return html.Div([
+        # Encabezado con logos
         html.Div([
-            html.H1("Registro de Infraestructura Hospitalaria", 
-                   className='text-center', 
-                   style={'color': COLOR_PRIMARIO, 'marginBottom': '30px', 'fontWeight': 'bold'}),
-            
-            # Sección de selección de estado
-            html.Div(className='mb-3', children=[
-                html.Label("Entidad:", className='fw-bold', style={'fontSize': '18px'}),
-                dcc.Dropdown(
-                    id="dropdown-entidad",
-                    options=entidades_options,
-                    placeholder="Seleccione un estado...",
-                    style={'borderRadius': '15px', 'padding': '5px', 'border': f'1px solid {COLOR_BORDE}'}
+            html.Div(className='header-logo', children=[
+                html.Img(
+                    src=recursos.url('logo_gobierno.svg'),
+                    style={'height': '50px', 'marginRight': '20px'}
+                ),
+                html.Img(
+                    src=recursos.url('logo_imss.svg'),
+                    style={'height': '50px'}
                 )
-            ]),
-            
-            # Sección CLUES
-            html.Div(className='mb-3', children=[
-                html.Label("CLUES:", className='fw-bold', style={'fontSize': '18px'}),
-                dcc.Dropdown(
-                    id="dropdown-clues",
-                    options=[],
-                    placeholder="Primero seleccione entidad",
-                    disabled=True,
-                    style={'borderRadius': '15px', 'padding': '5px', 'border': f'1px solid {COLOR_BORDE}'}
-                )
-            ]),
-            
-            html.Div(id="info-clues", className='font-montserrat'),
-            html.Hr(style={'borderTop': f'2px solid {COLOR_BORDE}', 'marginBottom': '25px'}),
-            
-            # Sección de Consultorios
+            ], style={'display': 'flex', 'alignItems': 'center'}),
+        ], style={'backgroundColor': COLOR_PRIMARIO, 'padding': '10px', 'display': 'flex', 'justifyContent': 'space-between', 'alignItems': 'center'}),
+
+        # Contenido principal
+        html.Div([
             html.Div([
-                html.H3("Consultorios", className='mb-3', style={'color': COLOR_PRIMARIO}),
-                html.Div([
-                    html.Label("Total de consultorios según sistema:", className='fw-bold'),
-                    dcc.Input(
-                        id="total-consultorios-sistema",
-                        type="number",
+                html.H1("Registro de Infraestructura Hospitalaria", 
+                       className='text-center', 
+                       style={'color': COLOR_PRIMARIO, 'marginBottom': '30px', 'fontWeight': 'bold'}),
+        
+                # Búsqueda global de unidades
+                html.Div(className='mb-3', children=[
+                    html.Label("Buscar unidad (CLUES o nombre):", className='fw-bold', style={'fontSize': '18px'}),
+                    dcc.Dropdown(
+                        id="dropdown-busqueda",
+                        options=[],
+                        placeholder="Escriba al menos 2 caracteres...",
+                        style={'borderRadius': '15px', 'padding': '5px', 'border': f'1px solid {COLOR_BORDE}'}
+                    )
+                ]),
+        
+                # Sección de selección de estado
+                html.Div(className='mb-3', children=[
+                    html.Label("Entidad:", className='fw-bold', style={'fontSize': '18px'}),
+                    dcc.Dropdown(
+                        id="dropdown-entidad",
+                        options=entidades_options,
+                        placeholder="Seleccione un estado...",
+                        style={'borderRadius': '15px', 'padding': '5px', 'border': f'1px solid {COLOR_BORDE}'}
+                    )
+                ]),
+        
+                # Sección CLUES
+                html.Div(className='mb-3', children=[
+                    html.Label("CLUES:", className='fw-bold', style={'fontSize': '18px'}),
+                    dcc.Dropdown(
+                        id="dropdown-clues",
+                        options=[],
+                        placeholder="Primero seleccione entidad",
                         disabled=True,
-                        className='mb-2',
-                        style={'width': '100%', 'padding': '8px', 'borderRadius': '5px', 'border': f'1px solid {COLOR_BORDE}'}
-                    ),
-                    html.Label("¿Coincide con la realidad?", className='fw-bold mt-3'),
-                    dcc.RadioItems(
-                        id="coincide-consultorios",
-                        options=[
-                            {'label': 'Sí', 'value': 'si'},
-                            {'label': 'No', 'value': 'no'}
-                        ],
-                        value=None,
-                        labelStyle={'display': 'inline-block', 'marginRight': '15px'}
-                    ),
-                    html.Div(id="input-consultorios-real", style={'display': 'none'}, children=[
-                        html.Label("Número actualizado de consultorios:", className='fw-bold mt-2'),
+                        style={'borderRadius': '15px', 'padding': '5px', 'border': f'1px solid {COLOR_BORDE}'}
+                    )
+                ]),
+        
+                html.Div(id="info-clues", className='font-montserrat'),
+                html.Hr(style={'borderTop': f'2px solid {COLOR_BORDE}', 'marginBottom': '25px'}),
+        
+                # Sección de Consultorios
+                html.Div([
+                    html.H3("Consultorios", className='mb-3', style={'color': COLOR_PRIMARIO}),
+                    html.Div([
+                        html.Label("Total de consultorios según sistema:", className='fw-bold'),
                         dcc.Input(
-                            id="consultorios-real",
+                            id="total-consultorios-sistema",
                             type="number",
+                            disabled=True,
+                            className='mb-2',
                             style={'width': '100%', 'padding': '8px', 'borderRadius': '5px', 'border': f'1px solid {COLOR_BORDE}'}
-                        )
-                    ]),
+                        ),
+                        html.Label("¿Coincide con la realidad?", className='fw-bold mt-3'),
+                        dcc.RadioItems(
+                            id="coincide-consultorios",
+                            options=[
+                                {'label': 'Sí', 'value': 'si'},
+                                {'label': 'No', 'value': 'no'}
+                            ],
+                            value=None,
+                            labelStyle={'display': 'inline-block', 'marginRight': '15px'}
+                        ),
+                        html.Div(id="input-consultorios-real", style={'display': 'none'}, children=[
+                            html.Label("Número actualizado de consultorios:", className='fw-bold mt-2'),
+                            dcc.Input(
+                                id="consultorios-real",
+                                type="number",
+                                style={'width': '100%', 'padding': '8px', 'borderRadius': '5px', 'border': f'1px solid {COLOR_BORDE}'}
+                            )
+                        ]),
+                        html.Button("Guardar y Continuar", 
+                                   id="btn-guardar-consultorios", 
+                                   className='mt-3',
+                                   style={
+                                       'backgroundColor': COLOR_SECUNDARIO,
+                                       'color': 'white',
+                                       'border': 'none',
+                                       'padding': '10px 20px',
+                                       'borderRadius': '5px',
+                                       'cursor': 'pointer',
+                                       'display': 'none'
+                                   })
+                    ])
+                ], className='mb-4 p-3', style={'border': f'2px solid {COLOR_BORDE}', 'borderRadius': '10px', 'backgroundColor': 'white'}),
+        
+                # Sección de Servicios por Consultorio (inicialmente oculta)
+                html.Div(id="seccion-servicios", style={'display': 'none'}, children=[
+                    html.H3("Servicios por Consultorio", className='mb-3', style={'color': COLOR_PRIMARIO}),
+            
+                    # Un bloque por consultorio, según el número de consultorios de la unidad
+                    html.Div(id="contenedor-servicios-consultorios"),
+            
                     html.Button("Guardar y Continuar", 
-                               id="btn-guardar-consultorios", 
+                               id="btn-guardar-servicios", 
                                className='mt-3',
                                style={
                                    'backgroundColor': COLOR_SECUNDARIO,
@@ -178,166 +260,204 @@ app.layout = html.Div([
                                    'border': 'none',
                                    'padding': '10px 20px',
                                    'borderRadius': '5px',
-                                   'cursor': 'pointer',
-                                   'display': 'none'
+                                   'cursor': 'pointer'
                                })
-                ])
-            ], className='mb-4 p-3', style={'border': f'2px solid {COLOR_BORDE}', 'borderRadius': '10px', 'backgroundColor': 'white'}),
+                ]),
+        
+                # Sección de Horarios por Consultorio (inicialmente oculta)
+                html.Div(id="seccion-horarios", style={'display': 'none'}, children=[
+                    html.H3("Horarios por Consultorio", className='mb-3', style={'color': COLOR_PRIMARIO}),
             
-            # Sección de Servicios por Consultorio (inicialmente oculta)
-            html.Div(id="seccion-servicios", style={'display': 'none'}, children=[
-                html.H3("Servicios por Consultorio", className='mb-3', style={'color': COLOR_PRIMARIO}),
-                
-                # Consultorio 1
-                html.Div([
-                    html.H4("Consultorio 1", style={'color': COLOR_PRIMARIO, 'marginBottom': '15px'}),
-                    html.Label("Seleccione los servicios disponibles:", className='fw-bold mb-2'),
-                    dcc.Checklist(
-                        id="servicios-consultorio-1",
-                        options=servicios_options,
-                        value=[],
-                        labelStyle={'display': 'block', 'marginBottom': '5px'}
-                    ),
-                ], className='p-3 mb-3', style={'border': f'1px solid {COLOR_BORDE}', 'borderRadius': '5px', 'backgroundColor': '#f9f9f9'}),
-                
-                # Consultorio 2
-                html.Div([
-                    html.H4("Consultorio 2", style={'color': COLOR_PRIMARIO, 'marginBottom': '15px'}),
-                    html.Label("Seleccione los servicios disponibles:", className='fw-bold mb-2'),
-                    dcc.Checklist(
-                        id="servicios-consultorio-2",
-                        options=servicios_options,
-                        value=[],
-                        labelStyle={'display': 'block', 'marginBottom': '5px'}
-                    ),
-                ], className='p-3 mb-3', style={'border': f'1px solid {COLOR_BORDE}', 'borderRadius': '5px', 'backgroundColor': '#f9f9f9'}),
-                
-                html.Button("Guardar y Continuar", 
-                           id="btn-guardar-servicios", 
-                           className='mt-3',
-                           style={
-                               'backgroundColor': COLOR_SECUNDARIO,
-                               'color': 'white',
-                               'border': 'none',
-                               'padding': '10px 20px',
-                               'borderRadius': '5px',
-                               'cursor': 'pointer'
-                           })
-            ]),
+                    # Selector de consultorio para horarios
+                    html.Div([
+                        html.Label("Seleccione el consultorio:", className='fw-bold mb-2'),
+                        dcc.RadioItems(
+                            id="selector-consultorio-horarios",
+                            options=[],
+                            value=1,
+                            labelStyle={'display': 'inline-block', 'marginRight': '15px'}
+                        ),
+                    ], className='mb-3 p-3', style={'border': f'1px solid {COLOR_BORDE}', 'borderRadius': '5px', 'backgroundColor': '#f9f9f9'}),
+            
+                    # Información de servicios disponibles
+                    html.Div(id="info-servicios-consultorio", className='mb-3 p-3', 
+                            style={'border': f'1px solid {COLOR_BORDE}', 'borderRadius': '5px', 'backgroundColor': '#f0f8ff'}),
             
-            # Sección de Horarios por Consultorio (inicialmente oculta)
-            html.Div(id="seccion-horarios", style={'display': 'none'}, children=[
-                html.H3("Horarios por Consultorio", className='mb-3', style={'color': COLOR_PRIMARIO}),
+                    # Matriz de horarios
+                    html.Div([
+                        html.Div("Elija el servicio de cada celda en la tabla, o seleccione varias celdas (Shift + clic) y rellénelas:",
+                                className='fw-bold mb-2'),
                 
-                # Selector de consultorio para horarios
-                html.Div([
-                    html.Label("Seleccione el consultorio:", className='fw-bold mb-2'),
-                    dcc.RadioItems(
-                        id="selector-consultorio-horarios",
-                        options=[
-                            {'label': 'Consultorio 1', 'value': 'consultorio-1'},
-                            {'label': 'Consultorio 2', 'value': 'consultorio-2'}
-                        ],
-                        value='consultorio-1',
-                        labelStyle={'display': 'inline-block', 'marginRight': '15px'}
-                    ),
-                ], className='mb-3 p-3', style={'border': f'1px solid {COLOR_BORDE}', 'borderRadius': '5px', 'backgroundColor': '#f9f9f9'}),
+                        # Operaciones sobre varias celdas a la vez
+                        html.Div([
+                            html.Div([
+                                html.Label("Servicio:", className='fw-bold'),
+                                dcc.Dropdown(
+                                    id="selector-servicio-relleno",
+                                    options=[],
+                                    placeholder="Sin servicio (limpiar)"
+                                ),
+                                html.Button("Rellenar selección",
+                                           id="btn-rellenar-seleccion",
+                                           className='mt-2',
+                                           style=ESTILO_BOTON_HORARIOS)
+                            ], style={'width': '48%', 'display': 'inline-block', 'marginRight': '4%', 'verticalAlign': 'top'}),
+                    
+                            html.Div([
+                                html.Label("Copiar el día:", className='fw-bold'),
+                                dcc.Dropdown(
+                                    id="selector-dia-origen",
+                                    options=[{'label': dia, 'value': dia.lower()} for dia in dias_semana],
+                                    placeholder="Seleccione un día"
+                                ),
+                                html.Button("Copiar a toda la semana",
+                                           id="btn-copiar-dia",
+                                           className='mt-2',
+                                           style=ESTILO_BOTON_HORARIOS)
+                            ], style={'width': '48%', 'display': 'inline-block', 'verticalAlign': 'top'})
+                        ], style={'marginBottom': '20px'}),
                 
-                # Información de servicios disponibles
-                html.Div(id="info-servicios-consultorio", className='mb-3 p-3', 
-                        style={'border': f'1px solid {COLOR_BORDE}', 'borderRadius': '5px', 'backgroundColor': '#f0f8ff'}),
+                        # Tabla de horarios
+                        html.Div("Horarios asignados:", className='fw-bold mb-2'),
+                        html.Div(id="tabla-horarios-container", children=[
+                            html.H5("Consultorio 1", id="titulo-tabla-horarios", style={'marginBottom': '10px'}),
+                            dash_table.DataTable(
+                                id="tabla-horarios",
+                                columns=[{"name": "Turno", "id": "turno", "editable": False}] + [
+                                    {"name": dia, "id": dia.lower(), "presentation": "dropdown"} for dia in dias_semana
+                                ],
+                                data=[],
+                                editable=True,
+                                dropdown={},
+                                style_cell={
+                                    'textAlign': 'center', 
+                                    'fontFamily': 'Montserrat',
+                                    'padding': '8px',
+                                    'minWidth': '80px',
+                                    'height': '40px'
+                                },
+                                style_header={
+                                    'backgroundColor': COLOR_PRIMARIO, 
+                                    'color': 'white', 
+                                    'fontWeight': 'bold',
+                                    'textAlign': 'center'
+                                },
+                                style_data={
+                                    'backgroundColor': 'white',
+                                    'color': 'black'
+                                },
+                                style_data_conditional=[
+                                    {
+                                        'if': {'row_index': 'odd'},
+                                        'backgroundColor': 'rgb(248, 248, 248)'
+                                    }
+                                ]
+                            )
+                        ])
                 
-                # Matriz de horarios
+                    ], className='p-3', style={'border': f'2px solid {COLOR_BORDE}', 'borderRadius': '10px', 'backgroundColor': 'white'}),
+            
+                    html.Div([
+                        html.Button("Guardar Información", 
+                                   id="btn-guardar-todo", 
+                                   className='mt-3',
+                                   style={
+                                       'backgroundColor': COLOR_PRIMARIO,
+                                       'color': 'white',
+                                       'border': 'none',
+                                       'padding': '10px 20px',
+                                       'borderRadius': '5px',
+                                       'cursor': 'pointer',
+                                       'marginRight': '10px'
+                                   }),
+                        html.Button("Exportar a Excel", 
+                                   id="btn-exportar-excel", 
+                                   className='mt-3',
+                                   style={
+                                       'backgroundColor': COLOR_SECUNDARIO,
+                                       'color': 'white',
+                                       'border': 'none',
+                                       'padding': '10px 20px',
+                                       'borderRadius': '5px',
+                                       'cursor': 'pointer'
+                                   })
+                    ], style={'marginTop': '20px'}),
+                    dcc.Download(id="download-excel"),
+            
+                    # Almacenar datos de horarios (una matriz día x turno por consultorio)
+                    html.Div(id="contenedor-stores-horarios"),
+            
+                    # Catálogos que usan los callbacks del lado del cliente (assets/clientside.js)
+                    dcc.Store(id='store-catalogos', data={
+                        'servicios': servicios_options,
+                        'dias': dias_semana,
+                        'turnos': turnos,
+                        'base': app.config.url_base_pathname,
+                        'max_consultorios': horarios.MAX_CONSULTORIOS,
+                        'colores': {'primario': COLOR_PRIMARIO, 'borde': COLOR_BORDE}
+                    }),
+            
+                    # Borrador de la captura en este navegador (sobrevive recargas y falta de red)
+                    dcc.Store(id='store-borrador', storage_type='local'),
+                    # CLUES para la que se generaron los bloques de consultorios en pantalla
+                    dcc.Store(id='store-unidad-consultorios'),
+                    # CLUES a exportar, una vez enviados los cambios pendientes
+                    dcc.Store(id='store-exportacion'),
+                    dcc.Interval(id='intervalo-sincronizacion', interval=INTERVALO_SINCRONIZACION)
+                ]),
+        
+                # Notificaciones
+                html.Div(id="notification", className='text-center mt-3'),
+                html.Div(id="estado-sincronizacion", className='text-center text-muted small mt-2'),
+        
+                # Exportación consolidada de todas las capturas (supervisores)
                 html.Div([
-                    html.Div("Seleccione un día y turno para asignar servicios:", 
-                            className='fw-bold mb-2'),
-                    
-                    # Selectores de día y turno
+                    html.H3("Exportación de capturas", className='mb-3', style={'color': COLOR_PRIMARIO}),
                     html.Div([
                         html.Div([
-                            html.Label("Día:", className='fw-bold'),
+                            html.Label("Entidad:", className='fw-bold'),
                             dcc.Dropdown(
-                                id="selector-dia",
-                                options=[{'label': dia, 'value': dia.lower()} for dia in dias_semana],
-                                placeholder="Seleccione un día"
+                                id="exportacion-entidad",
+                                options=entidades_options,
+                                placeholder="Todas las entidades"
                             )
-                        ], style={'width': '48%', 'display': 'inline-block', 'marginRight': '4%'}),
-                        
+                        ], style={'width': '48%', 'display': 'inline-block', 'marginRight': '4%', 'verticalAlign': 'top'}),
                         html.Div([
-                            html.Label("Turno:", className='fw-bold'),
-                            dcc.Dropdown(
-                                id="selector-turno",
-                                options=[{'label': turno, 'value': turno.lower()} for turno in turnos],
-                                placeholder="Seleccione un turno"
+                            html.Label("Formato:", className='fw-bold'),
+                            dcc.RadioItems(
+                                id="exportacion-formato",
+                                options=[
+                                    {'label': 'CSV', 'value': 'csv'},
+                                    {'label': 'Parquet', 'value': 'parquet'},
+                                    {'label': 'Excel', 'value': 'xlsx'}
+                                ],
+                                value='csv',
+                                labelStyle={'display': 'inline-block', 'marginRight': '15px'}
                             )
-                        ], style={'width': '48%', 'display': 'inline-block'})
+                        ], style={'width': '48%', 'display': 'inline-block', 'verticalAlign': 'top'})
                     ], style={'marginBottom': '20px'}),
-                    
-                    # Selector de servicios para el día y turno seleccionados
-                    html.Div(id="selector-servicios-horario", style={'marginBottom': '20px'}),
-                    
-                    # Botón para asignar servicio
-                    html.Button("Asignar Servicio", 
-                               id="btn-asignar-servicio", 
-                               style={
-                                   'backgroundColor': COLOR_PRIMARIO,
-                                   'color': 'white',
-                                   'border': 'none',
-                                   'padding': '10px 20px',
-                                   'borderRadius': '5px',
-                                   'cursor': 'pointer',
-                                   'marginBottom': '20px',
-                                   'display': 'none'
-                               }),
-                    
-                    # Tabla de horarios
-                    html.Div("Horarios asignados:", className='fw-bold mb-2'),
-                    html.Div(id="tabla-horarios-container")
-                    
-                ], className='p-3', style={'border': f'2px solid {COLOR_BORDE}', 'borderRadius': '10px', 'backgroundColor': 'white'}),
-                
-                html.Div([
-                    html.Button("Guardar Información", 
-                               id="btn-guardar-todo", 
-                               className='mt-3',
-                               style={
-                                   'backgroundColor': COLOR_PRIMARIO,
-                                   'color': 'white',
-                                   'border': 'none',
-                                   'padding': '10px 20px',
-                                   'borderRadius': '5px',
-                                   'cursor': 'pointer',
-                                   'marginRight': '10px'
-                               }),
-                    html.Button("Exportar a Excel", 
-                               id="btn-exportar-excel", 
-                               className='mt-3',
-                               style={
-                                   'backgroundColor': COLOR_SECUNDARIO,
-                                   'color': 'white',
-                                   'border': 'none',
-                                   'padding': '10px 20px',
-                                   'borderRadius': '5px',
-                                   'cursor': 'pointer'
-                               })
-                ], style={'marginTop': '20px'}),
-                dcc.Download(id="download-excel"),
-                
-                # Almacenar datos de horarios
-                dcc.Store(id='store-horarios-consultorio-1', data={}),
-                dcc.Store(id='store-horarios-consultorio-2', data={})
-            ]),
-            
-            # Notificaciones
-            html.Div(id="notification", className='text-center mt-3'),
-            
-        ], className='p-4', style={'maxWidth': '1200px', 'margin': '0 auto'})
-    ], style={
-        'backgroundColor': COLOR_FONDO, 
-        'minHeight': '100vh',
-        'fontFamily': 'Montserrat, sans-serif'
-    })
-])
+                    html.A("Descargar capturas",
+                           id="link-exportacion-capturas",
+                           href=f"{app.config.url_base_pathname}exportar/capturas?formato=csv",
+                           style={
+                               'backgroundColor': COLOR_SECUNDARIO,
+                               'color': 'white',
+                               'padding': '10px 20px',
+                               'borderRadius': '5px',
+                               'textDecoration': 'none',
+                               'display': 'inline-block'
+                           })
+                ], className='mt-4 p-3', style={'border': f'2px solid {COLOR_BORDE}', 'borderRadius': '10px', 'backgroundColor': 'white'}),
+        
+            ], className='p-4', style={'maxWidth': '1200px', 'margin': '0 auto'})
+        ], style={
+            'backgroundColor': COLOR_FONDO, 
+            'minHeight': '100vh',
+            'fontFamily': 'Montserrat, sans-serif'
+        })
+    ])
+
+app.layout = construir_layout
 
 # ========== CALLBACKS ==========
 
@@ -350,355 +470,499 @@ def update_clues_options(entidad_seleccionada):
     if not entidad_seleccionada:
         return [], True
     
-    try:
-        # Filtrar las CLUES por el estado seleccionado
-        df_filtrado = df_merged.filter(pl.col("entidad") == entidad_seleccionada)
-        options = [{"label": f"{row['clues_imb']} - {row.get('nombre_de_la_unidad', 'Unidad de salud')}", "value": row['clues_imb']} 
-                  for row in df_filtrado.rows(named=True)]
-        
-        print(f"CLUES encontradas para {entidad_seleccionada}: {len(options)}")
-        return options, False
-        
-    except Exception as e:
-        print(f"Error al filtrar CLUES: {e}")
-        return [], True
+    # Las opciones ya están armadas por entidad desde la carga de datos
+    options = datos.snapshot_actual().opciones_por_entidad.get(entidad_seleccionada, [])
+    
+    bitacora.evento('entidad_seleccionada', entidad=entidad_seleccionada, clues=len(options))
+    return options, False
 
-# Mostrar información de la CLUES seleccionada
+# Búsqueda global: resultados mientras el usuario escribe
 @app.callback(
-    Output("info-clues", "children"),
-    Input("dropdown-clues", "value")
+    Output("dropdown-busqueda", "options"),
+    Input("dropdown-busqueda", "search_value")
 )
-def show_clues_info(clues_seleccionada):
-    if not clues_seleccionada:
-        return ""
+def buscar_clues(texto):
+    # Sin texto se conservan las opciones para no perder la etiqueta del valor seleccionado
+    if not texto or len(texto.strip()) < 2:
+        raise PreventUpdate
     
-    try:
-        # Buscar la información de la CLUES seleccionada
-        info = df_merged.filter(pl.col("clues_imb") == clues_seleccionada).rows(named=True)[0]
-        
-        # Calcular total de consultorios
-        consultorios_generales = info.get('total_consultorios_generales', 0) or 0
-        consultorios_especialidad = info.get('total_consultorios_de_especialidad', 0) or 0
-        total_consultorios = consultorios_generales + consultorios_especialidad
-        
-        return html.Div([
-            html.P(f"CLUES: {clues_seleccionada}", style={'margin': '5px 0', 'fontWeight': 'bold'}),
-            html.P(f"Entidad: {info.get('entidad', 'N/A')}", style={'margin': '5px 0'}),
-            html.P(f"Consultorios generales: {consultorios_generales}", style={'margin': '5px 0'}),
-            html.P(f"Consultorios especialidad: {consultorios_especialidad}", style={'margin': '5px 0'}),
-            html.P(f"Total consultorios: {total_consultorios}", style={'margin': '5px 0', 'fontWeight': 'bold'}),
-            html.P(f"Quirófanos: {info.get('total_de_quirofanos', 'N/A')}", style={'margin': '5px 0'}),
-        ], style={
-            'backgroundColor': '#f8f9fa',
-            'padding': '15px',
-            'borderRadius': '5px',
-            'marginTop': '15px',
-            'border': f'1px solid {COLOR_BORDE}'
-        })
-    except Exception as e:
-        print(f"Error al mostrar info de CLUES: {e}")
-        return html.Div("Error al cargar información de la unidad", style={'color': 'red', 'padding': '10px'})
+    opciones = datos.snapshot_actual().indice_busqueda.opciones(texto, LIMITE_BUSQUEDA)
+    bitacora.evento('busqueda', caracteres=len(texto), resultados=len(opciones))
+    return opciones
 
-# Mostrar total de consultorios según sistema
+# Búsqueda global: al elegir un resultado se llenan entidad y CLUES
 @app.callback(
-    Output("total-consultorios-sistema", "value"),
+    [Output("dropdown-entidad", "value"),
+     Output("dropdown-clues", "options", allow_duplicate=True),
+     Output("dropdown-clues", "value")],
+    Input("dropdown-busqueda", "value"),
+    prevent_initial_call=True
+)
+def seleccionar_resultado_busqueda(clues_seleccionada):
+    snapshot = datos.snapshot_actual()
+    if not clues_seleccionada or clues_seleccionada not in snapshot.registros_por_clues:
+        raise PreventUpdate
+    
+    entidad = snapshot.registros_por_clues[clues_seleccionada]['entidad']
+    opcion = {'label': snapshot.indice_busqueda.etiqueta(clues_seleccionada), 'value': clues_seleccionada}
+    return entidad, [opcion], clues_seleccionada
+
+# Búsqueda global como endpoint JSON (mismo índice que el dropdown)
+@server.route(f"{app.config.url_base_pathname}api/buscar")
+def api_buscar():
+    texto = flask.request.args.get('q', '')
+    limite = min(flask.request.args.get('limite', LIMITE_BUSQUEDA, type=int), 100)
+    indice_busqueda = datos.snapshot_actual().indice_busqueda
+    docs = indice_busqueda.buscar(texto, limite)
+    return flask.jsonify([
+        {
+            'clues_imb': indice_busqueda.clues[doc],
+            'nombre_de_la_unidad': indice_busqueda.nombres[doc],
+            'entidad': indice_busqueda.entidades[doc],
+        }
+        for doc in docs
+    ])
+
+# Mostrar información de la CLUES seleccionada y total de consultorios según sistema
+@app.callback(
+    [Output("info-clues", "children"),
+     Output("total-consultorios-sistema", "value")],
     Input("dropdown-clues", "value")
 )
-def update_total_consultorios(clues_seleccionada):
+def show_clues_info(clues_seleccionada):
     if not clues_seleccionada:
-        raise PreventUpdate
+        return "", no_update
     
-    try:
-        info = df_merged.filter(pl.col("clues_imb") == clues_seleccionada).rows(named=True)[0]
-        consultorios_generales = info.get('total_consultorios_generales', 0) or 0
-        consultorios_especialidad = info.get('total_consultorios_de_especialidad', 0) or 0
-        return consultorios_generales + consultorios_especialidad
-    except Exception as e:
-        print(f"Error al calcular consultorios: {e}")
-        return 0
+    # Buscar la información de la CLUES seleccionada
+    info = datos.snapshot_actual().registros_por_clues.get(clues_seleccionada)
+    if info is None:
+        bitacora.advertencia('clues_no_encontrada', clues=clues_seleccionada)
+        return html.Div("Error al cargar información de la unidad", style={'color': 'red', 'padding': '10px'}), 0
+    
+    bitacora.evento('clues_seleccionada', clues=clues_seleccionada, entidad=info['entidad'])
+    consultorios_generales = info['consultorios_generales']
+    consultorios_especialidad = info['consultorios_especialidad']
+    total_consultorios = info['total_consultorios']
+    quirofanos = info['total_de_quirofanos']
+    
+    return html.Div([
+        html.P(f"CLUES: {clues_seleccionada}", style={'margin': '5px 0', 'fontWeight': 'bold'}),
+        html.P(f"Entidad: {info['entidad'] or 'N/A'}", style={'margin': '5px 0'}),
+        html.P(f"Consultorios generales: {consultorios_generales}", style={'margin': '5px 0'}),
+        html.P(f"Consultorios especialidad: {consultorios_especialidad}", style={'margin': '5px 0'}),
+        html.P(f"Total consultorios: {total_consultorios}", style={'margin': '5px 0', 'fontWeight': 'bold'}),
+        html.P(f"Quirófanos: {quirofanos if quirofanos is not None else 'N/A'}", style={'margin': '5px 0'}),
+    ], style={
+        'backgroundColor': '#f8f9fa',
+        'padding': '15px',
+        'borderRadius': '5px',
+        'marginTop': '15px',
+        'border': f'1px solid {COLOR_BORDE}'
+    }), total_consultorios
 
 # Mostrar/ocultar input para número real de consultorios y botón de guardar
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='toggle_consultorios_real_input'),
     [Output("input-consultorios-real", "style"),
      Output("btn-guardar-consultorios", "style")],
     Input("coincide-consultorios", "value")
 )
-def toggle_consultorios_real_input(coincide):
-    if coincide == 'no':
-        return {'display': 'block', 'marginTop': '15px'}, {'display': 'block'}
-    elif coincide == 'si':
-        return {'display': 'none'}, {'display': 'block'}
-    return {'display': 'none'}, {'display': 'none'}
 
 # Mostrar sección de servicios cuando se guarde la información de consultorios
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='mostrar_seccion_servicios'),
     Output("seccion-servicios", "style"),
     Input("btn-guardar-consultorios", "n_clicks"),
     [State("coincide-consultorios", "value"),
      State("consultorios-real", "value")],
     prevent_initial_call=True
 )
-def mostrar_seccion_servicios(n_clicks, coincide, consultorios_real):
-    if n_clicks and n_clicks > 0:
-        if coincide == 'si' or (coincide == 'no' and consultorios_real is not None):
-            return {'display': 'block', 'marginTop': '20px'}
-    return {'display': 'none'}
+
+# Generar un bloque de servicios y un store de horarios por consultorio de la unidad.
+# Si se vuelve a guardar, se conserva lo capturado en los consultorios que siguen existiendo;
+# al elegir una CLUES se reconstruyen desde su borrador local.
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='generar_consultorios'),
+    [Output("contenedor-servicios-consultorios", "children"),
+     Output("contenedor-stores-horarios", "children"),
+     Output("selector-consultorio-horarios", "options"),
+     Output("selector-consultorio-horarios", "value"),
+     Output("store-unidad-consultorios", "data")],
+    [Input("btn-guardar-consultorios", "n_clicks"),
+     Input("dropdown-clues", "value")],
+    [State("coincide-consultorios", "value"),
+     State("consultorios-real", "value"),
+     State("total-consultorios-sistema", "value"),
+     State({'type': 'servicios-consultorio', 'index': ALL}, "value"),
+     State({'type': 'store-horarios', 'index': ALL}, "data"),
+     State("store-borrador", "data"),
+     State("store-catalogos", "data")],
+    prevent_initial_call=True
+)
+
+# Respuestas y secciones visibles de la CLUES elegida según su borrador local
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='restaurar_unidad'),
+    [Output("coincide-consultorios", "value"),
+     Output("consultorios-real", "value"),
+     Output("seccion-servicios", "style", allow_duplicate=True),
+     Output("seccion-horarios", "style", allow_duplicate=True)],
+    Input("dropdown-clues", "value"),
+    State("store-borrador", "data"),
+    prevent_initial_call=True
+)
+
+# Al recargar la página se vuelve a la última entidad y CLUES capturadas en este navegador
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='restaurar_entidad'),
+    Output("dropdown-entidad", "value", allow_duplicate=True),
+    Input("store-borrador", "data"),
+    State("dropdown-entidad", "value"),
+    prevent_initial_call='initial_duplicate'
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='restaurar_clues'),
+    Output("dropdown-clues", "value", allow_duplicate=True),
+    Input("dropdown-clues", "options"),
+    [State("dropdown-clues", "value"),
+     State("store-borrador", "data")],
+    prevent_initial_call=True
+)
+
+# Cada cambio de la captura se guarda en el borrador local y se anota para sincronizar
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='guardar_borrador'),
+    [Output("store-borrador", "data"),
+     Output("estado-sincronizacion", "children")],
+    [Input({'type': 'servicios-consultorio', 'index': ALL}, "value"),
+     Input({'type': 'store-horarios', 'index': ALL}, "data"),
+     Input("coincide-consultorios", "value"),
+     Input("consultorios-real", "value")],
+    [State("dropdown-clues", "value"),
+     State("dropdown-entidad", "value"),
+     State("store-unidad-consultorios", "data"),
+     State("store-borrador", "data")],
+    prevent_initial_call=True
+)
 
 # Mostrar sección de horarios cuando se guarden los servicios
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='mostrar_seccion_horarios'),
     Output("seccion-horarios", "style"),
     Input("btn-guardar-servicios", "n_clicks"),
     prevent_initial_call=True
 )
-def mostrar_seccion_horarios(n_clicks):
-    if n_clicks and n_clicks > 0:
-        return {'display': 'block', 'marginTop': '20px'}
-    return {'display': 'none'}
 
 # Mostrar información de servicios disponibles para el consultorio seleccionado
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='mostrar_servicios_consultorio'),
     Output("info-servicios-consultorio", "children"),
     [Input("selector-consultorio-horarios", "value"),
-     Input("servicios-consultorio-1", "value"),
-     Input("servicios-consultorio-2", "value")]
+     Input({'type': 'servicios-consultorio', 'index': ALL}, "value")],
+    State("store-catalogos", "data")
 )
-def mostrar_servicios_consultorio(consultorio_seleccionado, servicios_1, servicios_2):
-    if consultorio_seleccionado == 'consultorio-1':
-        servicios = servicios_1
-        texto = "Consultorio 1"
-    else:
-        servicios = servicios_2
-        texto = "Consultorio 2"
-    
-    if not servicios:
-        return html.P(f"{texto}: No hay servicios seleccionados", style={'margin': '0'})
-    
-    # Obtener nombres de servicios seleccionados
-    nombres_servicios = []
-    for servicio in servicios:
-        for option in servicios_options:
-            if option['value'] == servicio:
-                nombres_servicios.append(option['label'])
-                break
-    
-    return html.Div([
-        html.P(f"{texto}: Servicios disponibles", style={'margin': '0', 'fontWeight': 'bold'}),
-        html.Ul([html.Li(servicio) for servicio in nombres_servicios])
-    ])
 
-# Mostrar selector de servicios cuando se seleccione día y turno
-@app.callback(
-    [Output("selector-servicios-horario", "children"),
-     Output("btn-asignar-servicio", "style")],
-    [Input("selector-consultorio-horarios", "value"),
-     Input("selector-dia", "value"),
-     Input("selector-turno", "value"),
-     Input("servicios-consultorio-1", "value"),
-     Input("servicios-consultorio-2", "value")]
+# Tabla de horarios editable del consultorio seleccionado. Editar celdas, rellenar la selección
+# o copiar un día a la semana produce una sola actualización de la matriz del consultorio
+# (y un solo cambio en el borrador); la tabla se vuelve a dibujar desde esa matriz.
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='editar_horarios'),
+    [Output("titulo-tabla-horarios", "children"),
+     Output("tabla-horarios", "data"),
+     Output("tabla-horarios", "dropdown"),
+     Output("selector-servicio-relleno", "options"),
+     Output({'type': 'store-horarios', 'index': ALL}, "data")],
+    [Input({'type': 'store-horarios', 'index': ALL}, "data"),
+     Input("selector-consultorio-horarios", "value"),
+     Input({'type': 'servicios-consultorio', 'index': ALL}, "value"),
+     Input("tabla-horarios", "data_timestamp"),
+     Input("btn-rellenar-seleccion", "n_clicks"),
+     Input("btn-copiar-dia", "n_clicks")],
+    [State("tabla-horarios", "data"),
+     State("tabla-horarios", "selected_cells"),
+     State("selector-servicio-relleno", "value"),
+     State("selector-dia-origen", "value"),
+     State("store-catalogos", "data")]
 )
-def mostrar_selector_servicios(consultorio, dia, turno, servicios_1, servicios_2):
-    if not dia or not turno:
-        return html.Div(), {'display': 'none'}
-    
-    if consultorio == 'consultorio-1':
-        servicios_disponibles = servicios_1
-    else:
-        servicios_disponibles = servicios_2
-    
-    if not servicios_disponibles:
-        return html.Div("No hay servicios disponibles para este consultorio", style={'color': 'red'}), {'display': 'none'}
-    
-    # Crear opciones de servicios
-    opciones_servicios = []
-    for servicio in servicios_disponibles:
-        for option in servicios_options:
-            if option['value'] == servicio:
-                opciones_servicios.append(option)
-                break
-    
-    return html.Div([
-        html.Label("Seleccione el servicio para este horario:", className='fw-bold mb-2'),
-        dcc.Dropdown(
-            id="selector-servicio-horario",
-            options=opciones_servicios,
-            placeholder="Seleccione un servicio"
-        )
-    ]), {'display': 'block'}
-
-# Generar tabla de horarios
-@app.callback(
-    Output("tabla-horarios-container", "children"),
-    [Input("store-horarios-consultorio-1", "data"),
-     Input("store-horarios-consultorio-2", "data"),
-     Input("selector-consultorio-horarios", "value")]
-)
-def generar_tabla_horarios(horarios_1, horarios_2, consultorio_seleccionado):
-    if consultorio_seleccionado == 'consultorio-1':
-        horarios = horarios_1
-        titulo = "Consultorio 1"
-    else:
-        horarios = horarios_2
-        titulo = "Consultorio 2"
-    
-    # Crear datos para la tabla
-    datos_tabla = []
-    for turno in turnos:
-        fila = {'turno': turno}
-        for dia in dias_semana:
-            clave = f"{dia.lower()}_{turno.lower()}"
-            fila[dia.lower()] = horarios.get(clave, "")
-        datos_tabla.append(fila)
-    
-    columnas = [{"name": "Turno", "id": "turno"}] + [
-        {"name": dia, "id": dia.lower()} for dia in dias_semana
-    ]
-    
-    return html.Div([
-        html.H5(titulo, style={'marginBottom': '10px'}),
-        dash_table.DataTable(
-            id="tabla-horarios",
-            columns=columnas,
-            data=datos_tabla,
-            style_cell={
-                'textAlign': 'center', 
-                'fontFamily': 'Montserrat',
-                'padding': '8px',
-                'minWidth': '80px',
-                'height': '40px'
-            },
-            style_header={
-                'backgroundColor': COLOR_PRIMARIO, 
-                'color': 'white', 
-                'fontWeight': 'bold',
-                'textAlign': 'center'
-            },
-            style_data={
-                'backgroundColor': 'white',
-                'color': 'black'
-            },
-            style_data_conditional=[
-                {
-                    'if': {'row_index': 'odd'},
-                    'backgroundColor': 'rgb(248, 248, 248)'
-                }
-            ]
-        )
-    ])
-
-# Asignar servicio a horario
-@app.callback(
-    [Output("store-horarios-consultorio-1", "data", allow_duplicate=True),
-     Output("store-horarios-consultorio-2", "data", allow_duplicate=True),
-     Output("selector-dia", "value"),
-     Output("selector-turno", "value"),
-     Output("selector-servicio-horario", "value")],
-    [Input("btn-asignar-servicio", "n_clicks")],
-    [State("selector-consultorio-horarios", "value"),
-     State("selector-dia", "value"),
-     State("selector-turno", "value"),
-     State("selector-servicio-horario", "value"),
-     State("store-horarios-consultorio-1", "data"),
-     State("store-horarios-consultorio-2", "data")],
-    prevent_initial_call=True
-)
-def asignar_servicio_horario(n_clicks, consultorio, dia, turno, servicio, horarios_1, horarios_2):
-    if not n_clicks or not dia or not turno or not servicio:
-        raise PreventUpdate
-    
-    # Obtener nombre del servicio
-    nombre_servicio = ""
-    for option in servicios_options:
-        if option['value'] == servicio:
-            nombre_servicio = option['label']
-            break
-    
-    # Actualizar horarios
-    clave = f"{dia}_{turno}"
-    
-    if consultorio == 'consultorio-1':
-        horarios_1 = horarios_1 or {}
-        horarios_1[clave] = nombre_servicio
-        return horarios_1, horarios_2, None, None, None
-    else:
-        horarios_2 = horarios_2 or {}
-        horarios_2[clave] = nombre_servicio
-        return horarios_1, horarios_2, None, None, None
 
 # Notificación al guardar consultorios
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='notificar_guardado_consultorios'),
     Output("notification", "children"),
     Input("btn-guardar-consultorios", "n_clicks"),
     prevent_initial_call=True
 )
-def notificar_guardado_consultorios(n_clicks):
-    if n_clicks and n_clicks > 0:
-        return dbc.Alert("Información de consultorios guardada correctamente", color="success", style={'marginTop': '20px'})
-    raise PreventUpdate
 
 # Notificación al guardar servicios
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='notificar_guardado_servicios'),
     Output("notification", "children", allow_duplicate=True),
     Input("btn-guardar-servicios", "n_clicks"),
     prevent_initial_call=True
 )
-def notificar_guardado_servicios(n_clicks):
-    if n_clicks and n_clicks > 0:
-        return dbc.Alert("Servicios guardados correctamente", color="success", style={'marginTop': '20px'})
-    raise PreventUpdate
 
-# Guardar toda la información
-@app.callback(
-    Output("notification", "children", allow_duplicate=True),
-    Input("btn-guardar-todo", "n_clicks"),
+# Guardar toda la información: envía al servidor los cambios pendientes del borrador en un solo
+# lote (api/sincronizar). Sin conexión quedan en el navegador y el intervalo reintenta.
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='sincronizar'),
+    [Output("estado-sincronizacion", "children", allow_duplicate=True),
+     Output("notification", "children", allow_duplicate=True),
+     Output("store-exportacion", "data")],
+    [Input("intervalo-sincronizacion", "n_intervals"),
+     Input("btn-guardar-todo", "n_clicks"),
+     Input("btn-exportar-excel", "n_clicks")],
+    [State("dropdown-clues", "value"),
+     State("coincide-consultorios", "value"),
+     State("consultorios-real", "value"),
+     State("store-catalogos", "data")],
     prevent_initial_call=True
 )
-def guardar_informacion(n_clicks):
-    if not n_clicks:
-        raise PreventUpdate
-    
-    return dbc.Alert("Información completa guardada correctamente", color="success", style={'marginTop': '20px'})
 
-# Exportar a Excel
+# Exportar a Excel. El navegador solo envía la CLUES (después de sincronizar los cambios
+# pendientes); los horarios salen de la captura en curso de la sesión o de lo ya guardado.
 @app.callback(
     Output("download-excel", "data"),
-    Input("btn-exportar-excel", "n_clicks"),
-    [State("store-horarios-consultorio-1", "data"),
-     State("store-horarios-consultorio-2", "data")],
+    Input("store-exportacion", "data"),
     prevent_initial_call=True
 )
-def exportar_a_excel(n_clicks, horarios_1, horarios_2):
-    if not n_clicks:
+def exportar_a_excel(solicitud):
+    if not solicitud or not solicitud.get('clues'):
         raise PreventUpdate
     
     try:
-        # Crear DataFrames con los horarios
-        datos_exportar = []
-        
-        for consultorio, horarios in [("Consultorio 1", horarios_1 or {}), ("Consultorio 2", horarios_2 or {})]:
-            for clave, servicio in horarios.items():
-                dia, turno = clave.split('_')
-                datos_exportar.append({
-                    'Consultorio': consultorio,
-                    'Día': dia.capitalize(),
-                    'Turno': turno.capitalize(),
-                    'Servicio': servicio
-                })
-        
-        df = pl.DataFrame(datos_exportar)
+        clues = solicitud['clues']
+        almacen = persistencia.obtener_almacen()
+        entrada = sesiones.leer_captura(clues, almacen.folio_guardado(clues))
+        origen = 'sesion'
+        if entrada is not None:
+            captura = entrada['captura']
+        else:
+            captura = almacen.leer_unidad(clues) or {}
+            origen = 'guardada'
+
+        # Filas con los horarios
+        datos_exportar = [
+            (f"Consultorio {consultorio['consultorio']}", dia, turno, servicio)
+            for consultorio in captura.get('consultorios', [])
+            for dia, turno, servicio in horarios.celdas(consultorio['horarios'])
+        ]
         
         # Crear archivo Excel en memoria
-        output = BytesIO()
-        df.write_excel(output)
-        output.seek(0)
+        contenido = exportacion.libro_xlsx(['Consultorio', 'Día', 'Turno', 'Servicio'], datos_exportar, hoja="Horarios")
         
+        bitacora.evento('exportacion_excel', clues=clues, origen=origen, celdas=len(datos_exportar))
         # Devolver el archivo para descarga
         return dcc.send_bytes(
-            output.getvalue(),
+            contenido,
             filename=f"horarios_consultorios_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         )
     except Exception as e:
-        print(f"Error al exportar a Excel: {e}")
-        raise PreventUpdate
+        # Un error no debe verse como "no hay nada que descargar": se registra y el callback falla
+        bitacora.error('exportacion_excel_fallida', error=str(e))
+        raise
+
+# Enlace de exportación consolidada según entidad y formato
+app.clientside_callback(
+    ClientsideFunction(namespace='infraestructura', function_name='actualizar_link_exportacion'),
+    Output("link-exportacion-capturas", "href"),
+    [Input("exportacion-entidad", "value"),
+     Input("exportacion-formato", "value")],
+    State("store-catalogos", "data")
+)
+
+# Exportación consolidada en streaming: la memoria no crece con el número de filas. Excel tarda
+# más en empezar a descargar (el libro se guarda completo antes, ver exportacion.generar_xlsx)
+@server.route(f"{app.config.url_base_pathname}exportar/capturas")
+def exportar_capturas():
+    formato = flask.request.args.get('formato', 'csv')
+    entidad = flask.request.args.get('entidad') or None
+    
+    # Garantiza que el esquema exista aunque todavía no haya capturas
+    almacen = persistencia.obtener_almacen()
+    try:
+        bloques = exportacion.exportar(formato, entidad, almacen.ruta)
+    except ValueError as e:
+        flask.abort(400, str(e))
+    mimetype, extension = exportacion.FORMATOS[formato]
+    bitacora.evento('exportacion_capturas', formato=formato, entidad=entidad)
+    sufijo = re.sub(r'[^a-z0-9]+', '_', (entidad or 'nacional').lower())
+    nombre = f"capturas_{sufijo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return flask.Response(
+        flask.stream_with_context(bloques),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{nombre}"'}
+    )
+
+# Captura en curso de la sesión con un lote aplicado: sobre la caché de sesiones o, si no está,
+# sobre lo ya guardado. Se valida antes de encolar nada: ValueError si el lote no es válido.
+# Devuelve también los folios que la captura incluye (sesiones.leer_captura).
+def _preparar_unidad(almacen, clues, cambios, registro):
+    entrada = sesiones.leer_captura(clues, almacen.folio_guardado(clues))
+    if entrada is not None:
+        base, folios = entrada['captura'], entrada['folios']
+    else:
+        base = almacen.leer_unidad(clues)
+        folios = [base['folio'] if base else None]
+    pendientes = sincronizacion.CambiosUnidad(clues, cambios, registro['entidad'], registro['total_consultorios'])
+    try:
+        return pendientes, persistencia.validar_captura(sincronizacion.aplicar_cambios(base, pendientes)), folios
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"{clues}: {e}") from None
+
+# Lote de cambios capturados en el navegador (formato en sincronizacion.py). Se agrupan por
+# CLUES y cada unidad se encola una vez; el escritor los aplica sobre lo ya guardado. Si alguna
+# unidad no es válida se rechaza el lote completo (400) sin encolar nada; `rechazados` lleva las
+# posiciones de los cambios culpables para que el navegador descarte solo esos. Las CLUES que ya
+# no están en el catálogo no impiden el resto (202): van en `errores` y las posiciones de sus
+# cambios en `pendientes`, que el navegador conserva.
+@server.route(f"{app.config.url_base_pathname}api/sincronizar", methods=['POST'])
+def api_sincronizar():
+    cuerpo = flask.request.get_json(silent=True)
+    try:
+        por_clues = sincronizacion.leer_lote(cuerpo)
+    except sincronizacion.LoteInvalido as e:
+        bitacora.advertencia('sincronizacion_rechazada', error=str(e))
+        return flask.jsonify({'error': str(e), 'rechazados': e.indices}), 400
+    
+    registros = datos.snapshot_actual().registros_por_clues
+    almacen = persistencia.obtener_almacen()
+    preparadas, errores = [], {}
+    for clues, cambios in por_clues.items():
+        registro = registros.get(clues)
+        if registro is None:
+            errores[clues] = "CLUES desconocida"
+            continue
+        try:
+            preparadas.append(_preparar_unidad(almacen, clues, cambios, registro))
+        except ValueError as e:
+            bitacora.advertencia('sincronizacion_rechazada', error=str(e))
+            return flask.jsonify({'error': str(e), 'rechazados': sincronizacion.indices_de(cuerpo, clues)}), 400
+
+    folios = {}
+    for pendientes, captura, incluidos in preparadas:
+        try:
+            folios[pendientes.clues_imb] = almacen.encolar_cambios(*pendientes)
+        except persistencia.ColaLlena:
+            # Cola llena o worker deteniéndose (AlmacenCerrado): el navegador conserva los
+            # cambios y reintenta
+            respuesta = flask.jsonify({'error': 'El servidor está ocupado', 'folios': folios})
+            respuesta.status_code = 503
+            respuesta.headers['Retry-After'] = '2'
+            return respuesta
+        sesiones.guardar_captura(captura, incluidos + [folios[pendientes.clues_imb]])
+    bitacora.evento(
+        'sincronizacion', unidades=len(folios), cambios=sum(map(len, por_clues.values())), errores=len(errores)
+    )
+    sin_aplicar = sorted(indice for clues in errores for indice in sincronizacion.indices_de(cuerpo, clues))
+    return flask.jsonify({'folios': folios, 'errores': errores, 'pendientes': sin_aplicar}), 202
+
+# Estado de un envío de "Guardar Información" por su folio
+@server.route(f"{app.config.url_base_pathname}api/capturas/<folio>")
+def api_estado_captura(folio):
+    estado = persistencia.obtener_almacen().estado_envio(folio)
+    if estado is None:
+        flask.abort(404)
+    return flask.jsonify({'folio': folio, **estado})
+
+# Resumen para los tableros de supervisión: capacidad del catálogo y avance de captura de una
+# entidad (o nacional). Ambos lados ya están agregados, no se recorre ninguna tabla.
+@server.route(f"{app.config.url_base_pathname}api/resumen")
+def api_resumen():
+    entidad = flask.request.args.get('entidad') or resumenes.NACIONAL
+    catalogo = datos.snapshot_actual().resumen_por_entidad.get(entidad)
+    if catalogo is None:
+        flask.abort(404, f"Entidad desconocida: {entidad}")
+    capturas = persistencia.obtener_almacen().leer_resumen(entidad)
+    return flask.jsonify({'entidad': entidad, **resumenes.combinar(catalogo, capturas)})
+
+# Cobertura de servicios sobre los horarios capturados (índice de bits en memoria, cobertura.py).
+# dia y turno se pueden repetir (?turno=nocturno&turno=vespertino); sin ellos se consideran todos.
+@server.route(f"{app.config.url_base_pathname}api/cobertura/unidades")
+def api_cobertura_unidades():
+    servicio = flask.request.args.get('servicio', '')
+    entidad = flask.request.args.get('entidad') or None
+    try:
+        clues = cobertura.obtener_cobertura().indice().unidades_con_servicio(
+            servicio, entidad, flask.request.args.getlist('dia'), flask.request.args.getlist('turno')
+        )
+    except ValueError as e:
+        return flask.jsonify({'error': str(e)}), 400
+    return flask.jsonify({'servicio': servicio, 'entidad': entidad, 'total': len(clues), 'unidades': clues})
+
+@server.route(f"{app.config.url_base_pathname}api/cobertura/huecos")
+def api_cobertura_huecos():
+    servicio = flask.request.args.get('servicio', '')
+    entidad = flask.request.args.get('entidad') or None
+    try:
+        huecos = cobertura.obtener_cobertura().indice().huecos_de_servicio(servicio, entidad)
+    except ValueError as e:
+        return flask.jsonify({'error': str(e)}), 400
+    return flask.jsonify({'servicio': servicio, 'entidad': entidad, **huecos})
+
+# Unidades que ofrecen cada servicio por día y turno: {servicio: {día: {turno: unidades}}}
+@server.route(f"{app.config.url_base_pathname}api/cobertura/conteos")
+def api_cobertura_conteos():
+    entidad = flask.request.args.get('entidad') or None
+    conteos = cobertura.obtener_cobertura().indice().conteos(entidad)
+    return flask.jsonify({
+        'entidad': entidad,
+        'conteos': {
+            servicio: {
+                dia: {turno: int(conteos[i, j, s]) for j, turno in enumerate(turnos)}
+                for i, dia in enumerate(dias_semana)
+            }
+            for s, servicio in enumerate(cobertura.SERVICIOS)
+        },
+    })
+
+# Recarga en caliente de infraestructura y catálogo CLUES (requiere INFRA_ADMIN_TOKEN).
+# POST inicia la recarga en segundo plano; GET devuelve el estado de la última recarga.
+@server.route(f"{app.config.url_base_pathname}admin/recargar", methods=['GET', 'POST'])
+def admin_recargar():
+    token = os.environ.get("INFRA_ADMIN_TOKEN")
+    if not token:
+        flask.abort(404)
+    # En bytes: compare_digest no acepta str con caracteres fuera de ASCII
+    autorizacion = flask.request.headers.get('Authorization', '').encode()
+    if not hmac.compare_digest(autorizacion, f"Bearer {token}".encode()):
+        flask.abort(401)
+    
+    if flask.request.method == 'GET':
+        return flask.jsonify(datos.estado_recarga())
+    
+    parametros = flask.request.get_json(silent=True) or {}
+    archivo_clues = parametros.get('archivo_clues')
+    if archivo_clues:
+        try:
+            datos.ruta_catalogo_clues(archivo_clues)
+        except ValueError as e:
+            return flask.jsonify({'error': str(e)}), 400
+    
+    iniciada = datos.recargar_en_segundo_plano(forzar=bool(parametros.get('forzar')), archivo_clues=archivo_clues)
+    if not iniciada:
+        return flask.jsonify({'error': 'Ya hay una recarga en curso', **datos.estado_recarga()}), 409
+    return flask.jsonify({'recarga': 'iniciada', **datos.estado_recarga()}), 202
+
+# Salud para la plataforma: /healthz indica que el proceso responde; /readyz, que los datos
+# están cargados y puede recibir tráfico
+@server.route("/healthz")
+def healthz():
+    return flask.jsonify({'estado': 'vivo'})
+
+@server.route("/readyz")
+def readyz():
+    if not datos.listo():
+        return flask.jsonify({'estado': 'cargando'}), 503
+    snapshot = datos.snapshot_actual()
+    return flask.jsonify({'estado': 'listo', 'version': snapshot.version, 'cargado_en': snapshot.cargado_en})
+
+_fin_de_fase('callbacks')
+bitacora.evento(
+    'arranque', fases_ms=datos.tiempos_ms(fases_arranque),
+    total_ms=round((time.perf_counter() - INICIO_ARRANQUE) * 1000, 1),
+    carga_datos='diferida' if CARGA_DIFERIDA else 'inmediata',
+)
 
 # Ejecutar la aplicación
 if __name__ == '__main__':
@@ -0,0 +1,15 @@
+import os
+
+# ========== ESCRITURA DE ARCHIVOS COMPARTIDOS ENTRE PROCESOS ==========
+
+
+# Escritura atómica: nunca dejar a medias un archivo que otro proceso pueda estar leyendo.
+# `escribir` recibe la ruta temporal (en la misma carpeta, para que el reemplazo sea atómico).
+def escribir_atomico(ruta, escribir):
+    tmp = ruta.with_name(f".{ruta.name}.{os.getpid()}.tmp")
+    try:
+        escribir(tmp)
+        os.replace(tmp, ruta)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
@@ -0,0 +1,494 @@
+// Callbacks que solo muestran/ocultan secciones o reformatean datos que ya están en el navegador.
+// Se ejecutan en el cliente para no hacer un viaje al servidor en cada clic.
+// La captura en curso (consultorios, servicios y horarios) se edita por completo en el navegador:
+// se guarda en localStorage (store-borrador) y los cambios se envían en lote a api/sincronizar
+// cuando hay conexión.
+(function() {
+    var CLAVE_CAMBIOS = 'infraestructura:cambios:v1';
+    var MAX_UNIDADES_BORRADOR = 20;
+    var enVuelo = false;
+    var seleccionRestaurada = {entidad: false, clues: false};
+
+    function componente(tipo, props, namespace) {
+        return {namespace: namespace || 'dash_html_components', type: tipo, props: props};
+    }
+
+    function alerta(texto, color) {
+        return componente('Alert', {children: texto, color: color, style: {marginTop: '20px'}}, 'dash_bootstrap_components');
+    }
+
+    function sinCambio() {
+        return window.dash_clientside.no_update;
+    }
+
+    function disparadoPor(prefijo) {
+        return window.dash_clientside.callback_context.triggered.some(function(t) {
+            return t.prop_id.indexOf(prefijo) === 0;
+        });
+    }
+
+    // Misma regla que horarios.numero_consultorios
+    function numeroConsultorios(coincide, consultoriosReal, totalSistema, maximo) {
+        var numero = parseInt(coincide === 'no' ? consultoriosReal : totalSistema, 10);
+        if (isNaN(numero)) {
+            numero = 0;
+        }
+        return Math.max(0, Math.min(numero, maximo));
+    }
+
+    // El servidor solo acepta un entero no negativo o null (sincronizacion.leer_lote)
+    function consultoriosRealValido(valor) {
+        return Number.isInteger(valor) && valor >= 0 ? valor : null;
+    }
+
+    function matrizVacia(catalogos) {
+        return catalogos.dias.map(function() {
+            return catalogos.turnos.map(function() { return 0; });
+        });
+    }
+
+    // {consultorio: valor} a partir de un Input/State con ALL
+    function valoresPorConsultorio(elementos) {
+        var valores = {};
+        (elementos || []).forEach(function(elemento) {
+            valores[elemento.id.index] = elemento.value;
+        });
+        return valores;
+    }
+
+    // ----- Cambios pendientes de sincronizar (localStorage, compactados por llave) -----
+
+    function leerCambios() {
+        try {
+            return JSON.parse(window.localStorage.getItem(CLAVE_CAMBIOS)) || {};
+        } catch (e) {
+            return {};
+        }
+    }
+
+    function escribirCambios(cambios) {
+        try {
+            window.localStorage.setItem(CLAVE_CAMBIOS, JSON.stringify(cambios));
+        } catch (e) {
+            // Sin espacio o sin localStorage: los cambios siguen en memoria hasta sincronizar
+        }
+    }
+
+    // El último valor de cada llave reemplaza al anterior: un lote nunca repite una celda
+    function registrarCambios(nuevos) {
+        if (!nuevos.length) {
+            return;
+        }
+        var cambios = leerCambios();
+        nuevos.forEach(function(par) {
+            delete cambios[par[0]];
+            cambios[par[0]] = par[1];
+        });
+        escribirCambios(cambios);
+    }
+
+    function textoEstado(mensaje) {
+        var pendientes = Object.keys(leerCambios()).length;
+        if (mensaje) {
+            return mensaje;
+        }
+        if (!pendientes) {
+            return 'Todos los cambios están sincronizados';
+        }
+        if (!navigator.onLine) {
+            return 'Sin conexión: ' + pendientes + ' cambio(s) guardados en este equipo';
+        }
+        return pendientes + ' cambio(s) por sincronizar';
+    }
+
+    // Cambios entre el borrador anterior y el actual de una unidad
+    function diferencias(clues, anterior, actual) {
+        var cambios = [];
+        if (anterior.coincide !== actual.coincide || anterior.real !== actual.real) {
+            cambios.push(['u|' + clues, ['u', clues, actual.coincide, actual.real]]);
+        }
+        Object.keys(actual.servicios).forEach(function(i) {
+            var previos = anterior.servicios[i];
+            var nuevos = actual.servicios[i] || [];
+            if (previos === undefined ? nuevos.length : JSON.stringify(previos) !== JSON.stringify(nuevos)) {
+                cambios.push(['s|' + clues + '|' + i, ['s', clues, Number(i), nuevos]]);
+            }
+        });
+        Object.keys(actual.horarios).forEach(function(i) {
+            var previa = anterior.horarios[i] || [];
+            (actual.horarios[i] || []).forEach(function(fila, d) {
+                fila.forEach(function(codigo, t) {
+                    var antes = previa[d] ? previa[d][t] : 0;
+                    if (antes !== codigo) {
+                        cambios.push(['c|' + clues + '|' + i + '|' + d + '|' + t, ['c', clues, Number(i), d, t, codigo]]);
+                    }
+                });
+            });
+        });
+        return cambios;
+    }
+
+    function etiquetasServicios(catalogos) {
+        var etiquetas = {};
+        catalogos.servicios.forEach(function(opcion) {
+            etiquetas[opcion.value] = opcion.label;
+        });
+        return etiquetas;
+    }
+
+    // Valor del componente {type, index: consultorio} dentro de un Input con ALL
+    function valorDelConsultorio(elementos, consultorio) {
+        for (var i = 0; i < elementos.length; i++) {
+            if (elementos[i].id.index === consultorio) {
+                return elementos[i].value;
+            }
+        }
+        return null;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        infraestructura: {
+            // Un bloque de servicios y un store de horarios por consultorio. Al elegir una CLUES se
+            // reconstruyen desde su borrador local; con el botón se conserva lo ya capturado.
+            generar_consultorios: function(n_clicks, clues, coincide, consultorios_real, total_sistema,
+                                           servicios, matrices, borrador, catalogos) {
+                var contexto = window.dash_clientside.callback_context;
+                var serviciosPrevios, horariosPrevios, numero;
+
+                if (disparadoPor('dropdown-clues')) {
+                    var unidad = clues && borrador && borrador.unidades ? borrador.unidades[clues] : null;
+                    if (!unidad || !unidad.numero) {
+                        return [[], [], [], null, clues || null];
+                    }
+                    numero = unidad.numero;
+                    serviciosPrevios = unidad.servicios;
+                    horariosPrevios = unidad.horarios;
+                } else {
+                    if (!n_clicks || (coincide !== 'si' && coincide !== 'no')) {
+                        throw window.dash_clientside.PreventUpdate;
+                    }
+                    serviciosPrevios = valoresPorConsultorio(contexto.states_list[3]);
+                    horariosPrevios = valoresPorConsultorio(contexto.states_list[4]);
+                    numero = numeroConsultorios(coincide, consultorios_real, total_sistema, catalogos.max_consultorios);
+                }
+
+                if (numero === 0) {
+                    return [componente('P', {children: 'La unidad no tiene consultorios para capturar', style: {color: 'red'}}),
+                            [], [], null, clues || null];
+                }
+
+                var bloques = [], stores = [], opciones = [];
+                for (var i = 1; i <= numero; i++) {
+                    bloques.push(componente('Div', {
+                        className: 'p-3 mb-3',
+                        style: {border: '1px solid ' + catalogos.colores.borde, borderRadius: '5px', backgroundColor: '#f9f9f9'},
+                        children: [
+                            componente('H4', {children: 'Consultorio ' + i, style: {color: catalogos.colores.primario, marginBottom: '15px'}}),
+                            componente('Label', {children: 'Seleccione los servicios disponibles:', className: 'fw-bold mb-2'}),
+                            componente('Checklist', {
+                                id: {type: 'servicios-consultorio', index: i},
+                                options: catalogos.servicios,
+                                value: serviciosPrevios[i] || [],
+                                labelStyle: {display: 'block', marginBottom: '5px'}
+                            }, 'dash_core_components')
+                        ]
+                    }));
+                    stores.push(componente('Store', {
+                        id: {type: 'store-horarios', index: i},
+                        data: horariosPrevios[i] || matrizVacia(catalogos)
+                    }, 'dash_core_components'));
+                    opciones.push({label: 'Consultorio ' + i, value: i});
+                }
+                return [bloques, stores, opciones, 1, clues || null];
+            },
+
+            // Al elegir una CLUES se recuperan sus respuestas del borrador local
+            restaurar_unidad: function(clues, borrador) {
+                var unidad = clues && borrador && borrador.unidades ? borrador.unidades[clues] : null;
+                if (!unidad) {
+                    return [null, null, {display: 'none'}, {display: 'none'}];
+                }
+                var visible = unidad.numero ? {display: 'block', marginTop: '20px'} : {display: 'none'};
+                return [unidad.coincide || null, unidad.real, visible, visible];
+            },
+
+            // Vuelve a la entidad y CLUES que se estaban capturando antes de recargar la página
+            restaurar_entidad: function(borrador, entidad) {
+                if (seleccionRestaurada.entidad || entidad || !borrador || !borrador.ultima) {
+                    seleccionRestaurada.entidad = true;
+                    return sinCambio();
+                }
+                seleccionRestaurada.entidad = true;
+                return borrador.ultima.entidad || sinCambio();
+            },
+
+            restaurar_clues: function(opciones, clues, borrador) {
+                if (seleccionRestaurada.clues || clues || !borrador || !borrador.ultima || !opciones || !opciones.length) {
+                    return sinCambio();
+                }
+                seleccionRestaurada.clues = true;
+                var ultima = borrador.ultima.clues;
+                var existe = opciones.some(function(opcion) { return opcion.value === ultima; });
+                return existe ? ultima : sinCambio();
+            },
+
+            // Guarda la captura en curso en el borrador local y registra lo que cambió
+            guardar_borrador: function(servicios, matrices, coincide, consultorios_real, clues, entidad, unidad_en_pantalla, borrador) {
+                if (!clues) {
+                    return [sinCambio(), textoEstado()];
+                }
+                var contexto = window.dash_clientside.callback_context;
+                borrador = borrador || {};
+                var unidades = Object.assign({}, borrador.unidades || {});
+                var anterior = unidades[clues] || {servicios: {}, horarios: {}, numero: 0};
+                var actual = {
+                    coincide: coincide || null,
+                    real: consultoriosRealValido(consultorios_real),
+                    numero: anterior.numero,
+                    servicios: anterior.servicios,
+                    horarios: anterior.horarios,
+                    actualizado: Date.now()
+                };
+                // Los bloques en pantalla pueden ser todavía los de la CLUES anterior
+                if (unidad_en_pantalla === clues) {
+                    actual.servicios = valoresPorConsultorio(contexto.inputs_list[0]);
+                    actual.horarios = valoresPorConsultorio(contexto.inputs_list[1]);
+                    actual.numero = contexto.inputs_list[1].length;
+                }
+                if (!actual.coincide && !actual.numero && !unidades[clues]) {
+                    return [sinCambio(), textoEstado()];
+                }
+
+                registrarCambios(diferencias(clues, anterior, actual));
+                unidades[clues] = actual;
+                var claves = Object.keys(unidades).sort(function(a, b) {
+                    return unidades[b].actualizado - unidades[a].actualizado;
+                });
+                claves.slice(MAX_UNIDADES_BORRADOR).forEach(function(clave) { delete unidades[clave]; });
+                return [{ultima: {entidad: entidad, clues: clues}, unidades: unidades}, textoEstado()];
+            },
+
+            // Envía los cambios pendientes en un solo lote. Con "Guardar Información" se envía de
+            // inmediato; si no hay conexión quedan en este equipo y se reintentan con el intervalo.
+            // Al exportar primero se envían los cambios pendientes y después se pide el archivo
+            // (store-exportacion) solo con la CLUES: el servidor ya tiene la captura de la sesión.
+            sincronizar: function(n_intervals, n_clicks, n_exportar, clues, coincide, consultorios_real, catalogos) {
+                var guardar = disparadoPor('btn-guardar-todo');
+                var exportar = disparadoPor('btn-exportar-excel');
+                if ((guardar || exportar) && !clues) {
+                    return [textoEstado(), alerta('Seleccione una CLUES antes de ' + (guardar ? 'guardar' : 'exportar'), 'warning'), sinCambio()];
+                }
+                if (guardar) {
+                    registrarCambios([['u|' + clues, ['u', clues, coincide || null, consultoriosRealValido(consultorios_real)]]]);
+                }
+                var exportacion = exportar ? {clues: clues, solicitada: Date.now()} : sinCambio();
+                var pendientes = leerCambios();
+                var claves = Object.keys(pendientes);
+                if (!claves.length) {
+                    return [textoEstado(), guardar ? alerta('Información completa guardada correctamente', 'success') : sinCambio(), exportacion];
+                }
+                if (!navigator.onLine) {
+                    return [textoEstado(), guardar ? alerta('Sin conexión: la información se guardó en este equipo y se enviará al reconectar', 'warning')
+                        : exportar ? alerta('Sin conexión: no se puede exportar por ahora', 'warning') : sinCambio(), sinCambio()];
+                }
+                if (enVuelo) {
+                    return [sinCambio(), exportar ? alerta('Enviando cambios; intente exportar de nuevo en unos segundos', 'info') : sinCambio(), sinCambio()];
+                }
+
+                enVuelo = true;
+                var enviados = claves.map(function(clave) { return [clave, JSON.stringify(pendientes[clave])]; });
+                return fetch(catalogos.base + 'api/sincronizar', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({cambios: claves.map(function(clave) { return pendientes[clave]; })})
+                }).then(function(respuesta) {
+                    // Un lote rechazado (400) no se aceptaría igual al reintentarlo: el servidor
+                    // indica qué cambios lo invalidan y solo esos se descartan
+                    if (respuesta.status === 400) {
+                        return respuesta.json().catch(function() { return {}; }).then(function(cuerpo) {
+                            return {rechazado: cuerpo.error || 'lote inválido', rechazados: cuerpo.rechazados || []};
+                        });
+                    }
+                    if (!respuesta.ok) {
+                        throw new Error('HTTP ' + respuesta.status);
+                    }
+                    return respuesta.json();
+                }).then(function(resultado) {
+                    // Aceptado se quita lo enviado salvo los cambios que el servidor no aplicó
+                    // (`pendientes`, de CLUES que no reconoce); rechazado, solo los cambios señalados.
+                    // En ambos casos solo si no se volvieron a editar mientras viajaba el lote.
+                    var sinAplicar = resultado.pendientes || [];
+                    var quitar = resultado.rechazado
+                        ? resultado.rechazados.map(function(indice) { return enviados[indice]; }).filter(Boolean)
+                        : enviados.filter(function(par, indice) { return sinAplicar.indexOf(indice) < 0; });
+                    var actuales = leerCambios();
+                    quitar.forEach(function(par) {
+                        if (actuales[par[0]] !== undefined && JSON.stringify(actuales[par[0]]) === par[1]) {
+                            delete actuales[par[0]];
+                        }
+                    });
+                    escribirCambios(actuales);
+                    enVuelo = false;
+                    if (resultado.rechazado) {
+                        var detalle = quitar.length
+                            ? 'se descartaron ' + quitar.length + ' de ' + enviados.length + ' cambios' +
+                              (quitar.length < enviados.length ? '; los demás se enviarán en el siguiente intento' : '')
+                            : 'los cambios siguen guardados en este equipo';
+                        return [textoEstado(), alerta('El servidor rechazó los cambios pendientes (' + resultado.rechazado + '): ' + detalle + '. Revise la captura', 'danger'), sinCambio()];
+                    }
+                    var errores = resultado.errores || {};
+                    var unidades = Object.keys(errores);
+                    if (unidades.length) {
+                        var lista = unidades.map(function(unidad) { return unidad + ' (' + errores[unidad] + ')'; }).join(', ');
+                        return [textoEstado(), alerta('No se guardaron los cambios de ' + lista + '; siguen en este equipo. Avise al administrador', 'warning'), exportacion];
+                    }
+                    var folio = clues && resultado.folios ? resultado.folios[clues] : null;
+                    return [textoEstado(), guardar
+                        ? alerta('Información recibida' + (folio ? ' (folio ' + folio + ')' : '') + '; se guardará en unos segundos', 'success')
+                        : sinCambio(), exportacion];
+                }).catch(function() {
+                    enVuelo = false;
+                    return [textoEstado('No se pudo sincronizar; se reintentará en unos segundos'), guardar
+                        ? alerta('No se pudo enviar la información; queda guardada en este equipo y se reintentará', 'warning')
+                        : exportar ? alerta('No se pudieron enviar los cambios; intente exportar de nuevo', 'warning') : sinCambio(), sinCambio()];
+                });
+            },
+
+            notificar_guardado_consultorios: function(n_clicks) {
+                if (n_clicks && n_clicks > 0) {
+                    return alerta('Información de consultorios guardada correctamente', 'success');
+                }
+                throw window.dash_clientside.PreventUpdate;
+            },
+
+            notificar_guardado_servicios: function(n_clicks) {
+                if (n_clicks && n_clicks > 0) {
+                    return alerta('Servicios guardados correctamente', 'success');
+                }
+                throw window.dash_clientside.PreventUpdate;
+            },
+
+            // Mostrar/ocultar input para número real de consultorios y botón de guardar
+            toggle_consultorios_real_input: function(coincide) {
+                if (coincide === 'no') {
+                    return [{display: 'block', marginTop: '15px'}, {display: 'block'}];
+                } else if (coincide === 'si') {
+                    return [{display: 'none'}, {display: 'block'}];
+                }
+                return [{display: 'none'}, {display: 'none'}];
+            },
+
+            // Mostrar sección de servicios cuando se guarde la información de consultorios
+            mostrar_seccion_servicios: function(n_clicks, coincide, consultorios_real) {
+                if (n_clicks && n_clicks > 0) {
+                    if (coincide === 'si' || (coincide === 'no' && consultorios_real !== null && consultorios_real !== undefined)) {
+                        return {display: 'block', marginTop: '20px'};
+                    }
+                }
+                return {display: 'none'};
+            },
+
+            // Mostrar sección de horarios cuando se guarden los servicios
+            mostrar_seccion_horarios: function(n_clicks) {
+                if (n_clicks && n_clicks > 0) {
+                    return {display: 'block', marginTop: '20px'};
+                }
+                return {display: 'none'};
+            },
+
+            // Mostrar información de servicios disponibles para el consultorio seleccionado
+            mostrar_servicios_consultorio: function(consultorio_seleccionado, servicios_por_consultorio, catalogos) {
+                var servicios = valorDelConsultorio(window.dash_clientside.callback_context.inputs_list[1], consultorio_seleccionado);
+                var texto = 'Consultorio ' + consultorio_seleccionado;
+
+                if (!servicios || servicios.length === 0) {
+                    return componente('P', {children: texto + ': No hay servicios seleccionados', style: {margin: '0'}});
+                }
+
+                var etiquetas = etiquetasServicios(catalogos);
+                var nombres = servicios
+                    .filter(function(servicio) { return servicio in etiquetas; })
+                    .map(function(servicio) { return componente('Li', {children: etiquetas[servicio]}); });
+
+                return componente('Div', {children: [
+                    componente('P', {children: texto + ': Servicios disponibles', style: {margin: '0', fontWeight: 'bold'}}),
+                    componente('Ul', {children: nombres})
+                ]});
+            },
+
+            // Tabla editable del consultorio seleccionado. Las ediciones de celdas (incluido pegar un
+            // rango), "Rellenar selección" y "Copiar a toda la semana" se aplican sobre una copia de la
+            // matriz y se escriben en un solo paso al store del consultorio.
+            editar_horarios: function(matrices, consultorio_seleccionado, servicios, data_timestamp, n_rellenar, n_copiar,
+                                      filas, celdas_seleccionadas, servicio_relleno, dia_origen, catalogos) {
+                var contexto = window.dash_clientside.callback_context;
+                var elementos = contexto.inputs_list[0];
+                var dias = catalogos.dias.map(function(dia) { return dia.toLowerCase(); });
+                var codigos = {};
+                catalogos.servicios.forEach(function(opcion, k) {
+                    codigos[opcion.value] = k + 1;
+                    codigos[opcion.label] = k + 1;
+                });
+
+                var actual = valorDelConsultorio(elementos, consultorio_seleccionado);
+                var matriz = (actual || matrizVacia(catalogos)).map(function(fila) { return fila.slice(); });
+                var modificada = false;
+
+                if (actual && disparadoPor('tabla-horarios')) {
+                    (filas || []).forEach(function(fila, j) {
+                        dias.forEach(function(dia, i) {
+                            if (j < catalogos.turnos.length) {
+                                matriz[i][j] = codigos[fila[dia]] || 0;
+                            }
+                        });
+                    });
+                    modificada = true;
+                } else if (actual && disparadoPor('btn-rellenar-seleccion')) {
+                    var codigo = servicio_relleno ? codigos[servicio_relleno] || 0 : 0;
+                    (celdas_seleccionadas || []).forEach(function(celda) {
+                        var i = dias.indexOf(celda.column_id);
+                        if (i >= 0 && celda.row < catalogos.turnos.length) {
+                            matriz[i][celda.row] = codigo;
+                        }
+                    });
+                    modificada = true;
+                } else if (actual && disparadoPor('btn-copiar-dia')) {
+                    var origen = dias.indexOf(dia_origen);
+                    if (origen < 0) {
+                        throw window.dash_clientside.PreventUpdate;
+                    }
+                    matriz = dias.map(function() { return matriz[origen].slice(); });
+                    modificada = true;
+                }
+
+                var disponibles = valorDelConsultorio(contexto.inputs_list[2], consultorio_seleccionado) || [];
+                var opciones = catalogos.servicios.filter(function(opcion) { return disponibles.indexOf(opcion.value) >= 0; });
+                var desplegables = {};
+                dias.forEach(function(dia) {
+                    desplegables[dia] = {options: opciones, clearable: true};
+                });
+                var datos = catalogos.turnos.map(function(turno, j) {
+                    var fila = {turno: turno};
+                    dias.forEach(function(dia, i) {
+                        var codigo = matriz[i] ? matriz[i][j] : 0;
+                        fila[dia] = codigo ? catalogos.servicios[codigo - 1].value : null;
+                    });
+                    return fila;
+                });
+                var stores = elementos.map(function(elemento) {
+                    return modificada && elemento.id.index === consultorio_seleccionado ? matriz : sinCambio();
+                });
+                return ['Consultorio ' + consultorio_seleccionado, datos, desplegables, opciones, stores];
+            },
+
+            // Enlace de exportación consolidada según entidad y formato
+            actualizar_link_exportacion: function(entidad, formato, catalogos) {
+                var parametros = new URLSearchParams({formato: formato || 'csv'});
+                if (entidad) {
+                    parametros.set('entidad', entidad);
+                }
+                return catalogos.base + 'exportar/capturas?' + parametros.toString();
+            }
+        }
+    });
+})();
@@ -0,0 +1,308 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+
+# ========== BENCHMARK DE LA CADENA DE CALLBACKS ==========
+# Simula usuarios concurrentes que recorren la captura completa sin navegador, con POSTs a
+# _dash-update-component por el cliente de pruebas de Flask:
+# búsqueda -> entidad -> CLUES -> info -> sincronizar (un lote) -> exportar.
+#
+#   python benchmark.py --escalas 1 10 100 --usuarios 8 --sesiones 40
+#
+# Los callbacks del lado del cliente (assets/clientside.js) no pasan por el servidor y no se miden:
+# consultorios, servicios y horarios se capturan en el estado del usuario y se envían como el lote
+# de cambios que mandaría el navegador a api/sincronizar.
+
+# Las capturas van a una base temporal, nunca a la de producción
+os.environ.setdefault("INFRA_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="infra-benchmark-"), "capturas.sqlite3"))
+os.environ["INFRA_VIGILAR_SEGUNDOS"] = "0"
+# Los snapshots sintéticos se publican después de la carga inicial, no durante
+os.environ["INFRA_CARGA_DIFERIDA"] = "0"
+# La bitácora de cada callback se mezclaría con la tabla de resultados
+os.environ.setdefault("INFRA_LOG_NIVEL", "WARNING")
+
+import app as aplicacion  # noqa: E402
+import datos  # noqa: E402
+import horarios  # noqa: E402
+
+RUTA_CALLBACKS = f"{aplicacion.app.config.url_base_pathname}_dash-update-component"
+RUTA_EXPORTACION = f"{aplicacion.app.config.url_base_pathname}exportar/capturas"
+RUTA_SINCRONIZAR = f"{aplicacion.app.config.url_base_pathname}api/sincronizar"
+
+# Celdas de horario que asigna cada usuario simulado por consultorio, y consultorios con horario
+CELDAS_POR_CONSULTORIO = 3
+CONSULTORIOS_CON_HORARIO = 3
+
+# Callbacks que siempre deben devolver algo: un 204 (PreventUpdate) o una respuesta sin
+# `response` también cuentan como error, no solo los HTTP >= 400
+CALLBACKS_CON_SALIDA = {'exportar_a_excel'}
+
+
+# Catálogo sintético: el df_merged real repetido `factor` veces con CLUES distintas
+def escalar(df, factor):
+    if factor <= 1:
+        return df
+    copias = [df] + [
+        df.with_columns((pl.col('clues_imb') + f"-S{k}").alias('clues_imb'))
+        for k in range(1, factor)
+    ]
+    return pl.concat(copias, rechunk=True)
+
+
+# Índice nombre de función -> especificación registrada del callback (output, inputs, state)
+def _especificaciones():
+    especificaciones = {}
+    for especificacion in aplicacion.app._callback_list:
+        funcion = aplicacion.app.callback_map.get(especificacion['output'], {}).get('callback')
+        while funcion is not None and especificacion.get('clientside_function') is None:
+            if hasattr(funcion, '__wrapped__'):
+                funcion = funcion.__wrapped__
+                continue
+            especificaciones[funcion.__name__] = especificacion
+            break
+    return especificaciones
+
+
+# Estado de la página de un usuario: propiedades por "id.propiedad" y componentes con id
+# {'type': ..., 'index': consultorio} por (tipo, propiedad)
+class EstadoPagina:
+    def __init__(self):
+        self.propiedades = {}
+        self.patrones = defaultdict(dict)
+
+    def elemento(self, dependencia):
+        id_componente, propiedad = dependencia['id'], dependencia['property'].split('@')[0]
+        if id_componente.startswith('{'):
+            tipo = json.loads(id_componente)['type']
+            return [
+                {'id': {'index': i, 'type': tipo}, 'property': propiedad, 'value': valor}
+                for i, valor in sorted(self.patrones[(tipo, propiedad)].items())
+            ]
+        return {'id': id_componente, 'property': propiedad,
+                'value': self.propiedades.get(f"{id_componente}.{propiedad}")}
+
+    def salida(self, texto):
+        id_componente, propiedad = texto.rsplit('.', 1)
+        propiedad = propiedad.split('@')[0]
+        if id_componente.startswith('{'):
+            tipo = json.loads(id_componente)['type']
+            return [{'id': {'index': i, 'type': tipo}, 'property': propiedad}
+                    for i in sorted(self.patrones[(tipo, propiedad)])]
+        return {'id': id_componente, 'property': propiedad}
+
+
+def _salidas(clave):
+    if clave.startswith('..'):
+        return clave[2:-2].split('...')
+    return [clave]
+
+
+# El callback respondió 200 con su salida (un 204 es PreventUpdate: no hubo nada)
+def _con_salida(respuesta):
+    return respuesta.status_code == 200 and bool((respuesta.get_json(silent=True) or {}).get('response'))
+
+
+# El lote se aceptó y cada unidad recibió su folio
+def _sincronizada(respuesta):
+    cuerpo = respuesta.get_json(silent=True) or {}
+    return respuesta.status_code == 202 and bool(cuerpo.get('folios')) and not cuerpo.get('errores')
+
+
+class UsuarioSimulado:
+    def __init__(self, especificaciones, resultados, semilla):
+        self.cliente = aplicacion.server.test_client()
+        self.especificaciones = especificaciones
+        self.resultados = resultados
+        self.rng = random.Random(semilla)
+
+    # `exitosa` decide si la respuesta cuenta como error además de los HTTP >= 400
+    def _medir(self, nombre, peticion, exitosa=None):
+        inicio = time.perf_counter()
+        respuesta = peticion()
+        # Consumir el cuerpo completo: en la exportación es donde se hace el trabajo
+        respuesta.get_data()
+        fallida = respuesta.status_code >= 400 or (exitosa is not None and not exitosa(respuesta))
+        self.resultados.registrar(nombre, time.perf_counter() - inicio, fallida)
+        return respuesta
+
+    def callback(self, nombre, estado):
+        especificacion = self.especificaciones[nombre]
+        salidas = [estado.salida(texto) for texto in _salidas(especificacion['output'])]
+        entradas = [estado.elemento(dependencia) for dependencia in especificacion['inputs']]
+        primera = especificacion['inputs'][0]
+        cuerpo = {
+            'output': especificacion['output'],
+            'outputs': salidas if especificacion['output'].startswith('..') else salidas[0],
+            'inputs': entradas,
+            'state': [estado.elemento(dependencia) for dependencia in especificacion['state']],
+            'changedPropIds': [f"{primera['id']}.{primera['property']}"],
+        }
+        exitosa = _con_salida if nombre in CALLBACKS_CON_SALIDA else None
+        respuesta = self._medir(nombre, lambda: self.cliente.post(RUTA_CALLBACKS, json=cuerpo), exitosa)
+        if respuesta.status_code != 200:
+            return {}
+        return respuesta.get_json().get('response', {})
+
+    def sesion(self, entidades):
+        rng = self.rng
+        estado = EstadoPagina()
+        valores = estado.propiedades
+
+        entidad = rng.choice(entidades)
+        valores['dropdown-entidad.value'] = entidad
+        respuesta = self.callback('update_clues_options', estado)
+        opciones = respuesta.get('dropdown-clues', {}).get('options') or []
+        if not opciones:
+            return
+        opcion = rng.choice(opciones)
+
+        # Búsqueda global con las primeras letras del nombre de la unidad
+        valores['dropdown-busqueda.search_value'] = opcion['label'].split(' - ', 1)[-1][:4]
+        self.callback('buscar_clues', estado)
+
+        valores['dropdown-clues.value'] = opcion['value']
+        respuesta = self.callback('show_clues_info', estado)
+        total = respuesta.get('total-consultorios-sistema', {}).get('value') or 0
+
+        # 70 % confirma el total del sistema; el resto captura un número real
+        if total and rng.random() < 0.7:
+            valores['coincide-consultorios.value'] = 'si'
+        else:
+            valores['coincide-consultorios.value'] = 'no'
+            valores['consultorios-real.value'] = rng.randint(1, 10)
+        valores['total-consultorios-sistema.value'] = total
+        clues = opcion['value']
+        numero = horarios.numero_consultorios(
+            valores['coincide-consultorios.value'], valores.get('consultorios-real.value'), total
+        )
+        cambios = [['u', clues, valores['coincide-consultorios.value'], valores.get('consultorios-real.value')]]
+
+        # Servicios elegidos en los checklists y celdas asignadas, como los anota el navegador
+        catalogo = [opcion['value'] for opcion in horarios.servicios_options]
+        for i in range(1, numero + 1):
+            servicios = rng.sample(catalogo, 2)
+            estado.patrones[('servicios-consultorio', 'value')][i] = servicios
+            estado.patrones[('store-horarios', 'data')][i] = horarios.matriz_vacia()
+            cambios.append(['s', clues, i, servicios])
+
+        for consultorio in range(1, min(numero, CONSULTORIOS_CON_HORARIO) + 1):
+            matriz = estado.patrones[('store-horarios', 'data')][consultorio]
+            for _ in range(CELDAS_POR_CONSULTORIO):
+                dia, turno = rng.randrange(len(horarios.dias_semana)), rng.randrange(len(horarios.turnos))
+                codigo = horarios.codigo_servicio(rng.choice(estado.patrones[('servicios-consultorio', 'value')][consultorio]))
+                matriz[dia][turno] = codigo
+                cambios.append(['c', clues, consultorio, dia, turno, codigo])
+
+        self._medir('sincronizar', lambda: self.cliente.post(RUTA_SINCRONIZAR, json={'cambios': cambios}), _sincronizada)
+        # El navegador, ya sincronizado, pide el archivo solo con la CLUES
+        valores['store-exportacion.data'] = {'clues': clues, 'solicitada': 1}
+        self.callback('exportar_a_excel', estado)
+
+        self._medir('exportar_capturas', lambda: self.cliente.get(
+            RUTA_EXPORTACION, query_string={'formato': 'csv', 'entidad': entidad}
+        ))
+
+
+class Resultados:
+    def __init__(self):
+        self._candado = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+
+    def registrar(self, nombre, segundos, fallida):
+        with self._candado:
+            self.latencias[nombre].append(segundos)
+            if fallida:
+                self.errores[nombre] += 1
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    posicion = max(0, min(len(valores_ordenados) - 1, round(p / 100 * len(valores_ordenados)) - 1))
+    return valores_ordenados[posicion]
+
+
+def resumen(resultados, duracion):
+    filas = []
+    for nombre, latencias in sorted(resultados.latencias.items()):
+        ordenadas = sorted(latencias)
+        filas.append({
+            'callback': nombre,
+            'llamadas': len(ordenadas),
+            'errores': resultados.errores[nombre],
+            'p50_ms': percentil(ordenadas, 50) * 1000,
+            'p95_ms': percentil(ordenadas, 95) * 1000,
+            'p99_ms': percentil(ordenadas, 99) * 1000,
+            'por_segundo': len(ordenadas) / duracion if duracion else 0.0,
+        })
+    return filas
+
+
+def imprimir(escala, filas_datos, filas, duracion, sesiones):
+    print(f"\n=== Escala {escala}x: {filas_datos} unidades, {sesiones} sesiones en {duracion:.1f}s "
+          f"({sesiones / duracion:.1f} sesiones/s) ===")
+    print(f"{'callback':<28}{'llamadas':>9}{'errores':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'por s':>9}")
+    for fila in filas:
+        print(f"{fila['callback']:<28}{fila['llamadas']:>9}{fila['errores']:>9}{fila['p50_ms']:>10.1f}"
+              f"{fila['p95_ms']:>10.1f}{fila['p99_ms']:>10.1f}{fila['por_segundo']:>9.1f}")
+
+
+def ejecutar(escala, df_base, usuarios, sesiones, semilla):
+    df = escalar(df_base, escala)
+    inicio = time.perf_counter()
+    snapshot = datos.construir_snapshot(df, escala)
+    datos._publicar(snapshot)
+    print(f"\nSnapshot sintético {escala}x ({df.height} unidades) construido en {time.perf_counter() - inicio:.1f}s")
+
+    especificaciones = _especificaciones()
+    entidades = [opcion['value'] for opcion in snapshot.entidades_options]
+
+    # Una sesión de calentamiento que no se cuenta
+    UsuarioSimulado(especificaciones, Resultados(), semilla).sesion(entidades)
+
+    resultados = Resultados()
+    simulados = [UsuarioSimulado(especificaciones, resultados, semilla + i) for i in range(usuarios)]
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=usuarios) as ejecutor:
+        for futuro in [ejecutor.submit(simulados[i % usuarios].sesion, entidades) for i in range(sesiones)]:
+            futuro.result()
+    duracion = time.perf_counter() - inicio
+
+    filas = resumen(resultados, duracion)
+    imprimir(escala, df.height, filas, duracion, sesiones)
+    return {'escala': escala, 'unidades': df.height, 'sesiones': sesiones, 'usuarios': usuarios,
+            'duracion_s': duracion, 'callbacks': filas}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la cadena de callbacks de captura")
+    parser.add_argument('--escalas', type=int, nargs='+', default=[1, 10, 100],
+                        help="Multiplicadores del número de unidades del catálogo real")
+    parser.add_argument('--usuarios', type=int, default=8, help="Usuarios simulados concurrentes")
+    parser.add_argument('--sesiones', type=int, default=40, help="Capturas completas por escala")
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--json', help="Guarda los resultados en este archivo para comparar entre versiones")
+    args = parser.parse_args(argv)
+
+    df_base = datos.snapshot_actual().df_merged
+    resultados = [ejecutar(escala, df_base, args.usuarios, args.sesiones, args.semilla) for escala in args.escalas]
+    print(f"\nCapturas del benchmark en {os.environ['INFRA_DB_PATH']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
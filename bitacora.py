@@ -0,0 +1,190 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+
+import flask
+
+# ========== BITÁCORA ESTRUCTURADA ==========
+# Una línea JSON por evento: {"ts", "nivel", "evento", "traza", ...campos}. Quien registra solo
+# pone el registro en una cola (sin formatear ni escribir); un hilo lo convierte a JSON y escribe
+# en stdout por lotes. Con la cola llena el evento se descarta y se cuenta, nunca se bloquea.
+#
+# `traza` identifica la sesión del navegador (cookie de sesión), así se puede seguir a cada
+# encuestador desde que elige la entidad hasta que exporta.
+
+NOMBRE = 'infraestructura'
+COOKIE_TRAZA = 'infra_traza'
+MAX_COLA = int(os.environ.get("INFRA_LOG_MAX_COLA", "10000"))
+NIVEL = os.environ.get("INFRA_LOG_NIVEL", "INFO").upper()
+
+_FORMATO_TRAZA = re.compile(r'^[0-9a-f]{16,32}$')
+
+
+# Fracción de sesiones que registran cada evento de alto volumen: "busqueda=0.1,otro=0.5".
+# Se decide por traza, así una sesión muestreada queda completa.
+def _leer_muestreo(texto):
+    muestreo = {}
+    for parte in filter(None, (p.strip() for p in texto.split(','))):
+        evento, _, tasa = parte.partition('=')
+        muestreo[evento.strip()] = min(max(float(tasa), 0.0), 1.0)
+    return muestreo
+
+
+MUESTREO = _leer_muestreo(os.environ.get("INFRA_LOG_MUESTREO", "busqueda=0.1"))
+
+
+def traza_actual():
+    if flask.has_request_context():
+        return flask.g.get('traza')
+    return None
+
+
+def _en_muestra(tasa, traza):
+    if tasa >= 1.0:
+        return True
+    clave = (traza or uuid.uuid4().hex).encode()
+    return int.from_bytes(hashlib.blake2b(clave, digest_size=4).digest(), 'big') < tasa * 2 ** 32
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record):
+        linea = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname.lower(),
+            'evento': record.getMessage(),
+            'traza': getattr(record, 'traza', None),
+            **getattr(record, 'campos', {}),
+        }
+        if record.exc_info:
+            linea['excepcion'] = self.formatException(record.exc_info)
+        return json.dumps(linea, ensure_ascii=False, default=str)
+
+
+# Handler que solo encola; el formato y la escritura ocurren en su hilo. Tras un fork (workers
+# de gunicorn) el hijo arranca con una cola y un hilo propios.
+class ManejadorEnCola(logging.Handler):
+    def __init__(self, destino=None, max_cola=MAX_COLA):
+        super().__init__()
+        self.destino = destino
+        self.max_cola = max_cola
+        self.descartados = 0
+        self._reiniciar()
+        os.register_at_fork(after_in_child=self._reiniciar)
+
+    def _reiniciar(self):
+        self._cola = queue.Queue(maxsize=self.max_cola)
+        self._hilo = None
+        self._candado_hilo = threading.Lock()
+
+    def _asegurar_hilo(self):
+        if self._hilo is None:
+            with self._candado_hilo:
+                if self._hilo is None:
+                    self._hilo = threading.Thread(target=self._escribir, name="bitacora", daemon=True)
+                    self._hilo.start()
+
+    # La traza se toma aquí, en el hilo del request; el hilo escritor no tiene contexto de Flask
+    def handle(self, record):
+        record.traza = getattr(record, 'traza', None) or traza_actual()
+        return super().handle(record)
+
+    def emit(self, record):
+        self._asegurar_hilo()
+        try:
+            self._cola.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+    def _escribir(self):
+        destino = self.destino or sys.stdout
+        while True:
+            registros = [self._cola.get()]
+            while True:
+                try:
+                    registros.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            detener = None in registros
+            lineas = []
+            for registro in registros:
+                if registro is None:
+                    continue
+                try:
+                    lineas.append(self.format(registro))
+                except Exception:
+                    self.handleError(registro)
+            if lineas:
+                destino.write("\n".join(lineas) + "\n")
+                destino.flush()
+            if detener:
+                break
+
+    # Escribe lo pendiente y detiene el hilo (salida del proceso)
+    def close(self):
+        hilo = self._hilo
+        if hilo is not None and hilo.is_alive():
+            self._cola.put(None)
+            hilo.join(timeout=5)
+        self._hilo = None
+        super().close()
+
+    # Indicadores para /metrics: (métrica, tipo, ayuda, valor)
+    def indicadores(self):
+        return [
+            ('infra_bitacora_cola_profundidad', 'gauge', 'Eventos de bitácora en espera de escribirse.', self._cola.qsize()),
+            ('infra_bitacora_descartados_total', 'counter', 'Eventos descartados por cola llena.', self.descartados),
+        ]
+
+
+_logger = logging.getLogger(NOMBRE)
+manejador = ManejadorEnCola()
+manejador.setFormatter(FormatoJSON())
+_logger.addHandler(manejador)
+_logger.setLevel(NIVEL)
+_logger.propagate = False
+atexit.register(manejador.close)
+
+
+def evento(nombre, nivel=logging.INFO, **campos):
+    if not _logger.isEnabledFor(nivel):
+        return
+    tasa = MUESTREO.get(nombre, 1.0)
+    traza = traza_actual()
+    if not _en_muestra(tasa, traza):
+        return
+    if tasa < 1.0:
+        campos['muestreo'] = tasa
+    _logger.log(nivel, nombre, extra={'campos': campos, 'traza': traza})
+
+
+def advertencia(nombre, **campos):
+    evento(nombre, logging.WARNING, **campos)
+
+
+# Dentro de un `except`: agrega la excepción con su traceback
+def error(nombre, **campos):
+    if _logger.isEnabledFor(logging.ERROR):
+        _logger.error(nombre, exc_info=sys.exc_info()[0] is not None, extra={'campos': campos, 'traza': traza_actual()})
+
+
+# Asigna a cada sesión del navegador un id de traza (cookie de sesión) disponible en flask.g.traza
+def registrar_traza(server, ruta_cookie='/'):
+    @server.before_request
+    def asignar_traza():
+        traza = flask.request.cookies.get(COOKIE_TRAZA, '')
+        flask.g.traza_nueva = not _FORMATO_TRAZA.match(traza)
+        flask.g.traza = uuid.uuid4().hex[:16] if flask.g.traza_nueva else traza
+
+    @server.after_request
+    def enviar_traza(respuesta):
+        if flask.g.get('traza_nueva'):
+            respuesta.set_cookie(COOKIE_TRAZA, flask.g.traza, path=ruta_cookie, httponly=True, samesite='Lax')
+        return respuesta
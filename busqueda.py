@@ -0,0 +1,215 @@
+import copy
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left, insort
+
+import polars as pl
+
+# ========== BÚSQUEDA DE CLUES POR TRIGRAMAS ==========
+
+_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+# Puntaje por término según dónde aparece en la unidad
+PUNTAJE_CLUES_EXACTA = 100
+PUNTAJE_CLUES_PREFIJO = 60
+PUNTAJE_PALABRA_EXACTA = 30
+PUNTAJE_PALABRA_PREFIJO = 20
+PUNTAJE_SUBCADENA = 10
+
+# Fracción de unidades dadas de baja (huecos) a partir de la cual con_cambios reconstruye el índice
+MAX_ELIMINADOS = 0.25
+
+
+# Minúsculas, sin acentos y solo letras/números separados por un espacio
+def normalizar(texto):
+    if texto is None:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii').lower()
+    return _NO_ALFANUMERICO.sub(' ', texto).strip()
+
+
+def _trigramas(palabra):
+    return {palabra[i:i + 3] for i in range(len(palabra) - 2)}
+
+
+# Índice invertido sobre clues_imb y nombre_de_la_unidad:
+# trigramas -> unidades para fragmentos de 3+ caracteres y vocabulario ordenado para prefijos cortos
+class IndiceBusqueda:
+    def __init__(self, registros):
+        self._eliminados = set()
+        self.clues = []
+        self.nombres = []
+        self.entidades = []
+        self._clues_norm = []
+        self._palabras = []
+        self._textos = []
+        self._por_trigrama = {}
+        self._por_palabra = {}
+        self._por_clues = {}
+
+        for clues, nombre, entidad in registros:
+            self._agregar(clues, nombre, entidad)
+        self._vocabulario = sorted(self._por_palabra)
+
+    # `lista` devuelve la lista de documentos de una palabra o trigrama lista para modificarse
+    def _agregar(self, clues, nombre, entidad, lista=None):
+        lista = lista or (lambda indice, clave: indice.setdefault(clave, []))
+        doc = len(self.clues)
+        clues_norm = normalizar(clues).replace(' ', '')
+        palabras = tuple(dict.fromkeys([clues_norm] + normalizar(nombre).split()))
+        self._por_clues[clues] = doc
+        self.clues.append(clues)
+        self.nombres.append(nombre)
+        self.entidades.append(entidad)
+        self._clues_norm.append(clues_norm)
+        self._palabras.append(palabras)
+        self._textos.append(' '.join(palabras))
+
+        trigramas = set()
+        for palabra in palabras:
+            lista(self._por_palabra, palabra).append(doc)
+            trigramas |= _trigramas(palabra)
+        for trigrama in trigramas:
+            lista(self._por_trigrama, trigrama).append(doc)
+
+    def __len__(self):
+        return len(self.clues) - len(self._eliminados)
+
+    # Índice nuevo con las unidades `registros` (clues, nombre, entidad) reemplazadas o agregadas,
+    # que comparte con este las listas que no cambian: este sigue siendo válido para quien lo
+    # esté usando. La versión anterior de una unidad reemplazada queda como hueco que buscar
+    # descarta; cuando hay demasiados se reconstruye completo.
+    def con_cambios(self, registros):
+        agregar = list(registros)
+        nuevo = copy.copy(self)
+        for atributo in ('clues', 'nombres', 'entidades', '_clues_norm', '_palabras', '_textos'):
+            setattr(nuevo, atributo, list(getattr(self, atributo)))
+        nuevo._por_trigrama = dict(self._por_trigrama)
+        nuevo._por_palabra = dict(self._por_palabra)
+        nuevo._por_clues = dict(self._por_clues)
+        nuevo._eliminados = set(self._eliminados)
+
+        for clues, _, _ in agregar:
+            doc = nuevo._por_clues.pop(clues, None)
+            if doc is not None:
+                nuevo._eliminados.add(doc)
+
+        if len(nuevo._eliminados) > MAX_ELIMINADOS * len(nuevo.clues):
+            vigentes = [
+                (nuevo.clues[doc], nuevo.nombres[doc], nuevo.entidades[doc])
+                for doc in sorted(nuevo._por_clues.values())
+            ]
+            return IndiceBusqueda([*vigentes, *agregar])
+
+        # Copia cada lista modificada una sola vez
+        copiadas = set()
+
+        def lista(indice, clave):
+            if (id(indice), clave) not in copiadas:
+                copiadas.add((id(indice), clave))
+                indice[clave] = list(indice.get(clave, ()))
+            return indice[clave]
+
+        palabras_antes = len(nuevo._por_palabra)
+        for clues, nombre, entidad in agregar:
+            nuevo._agregar(clues, nombre, entidad, lista)
+        if len(nuevo._por_palabra) != palabras_antes:
+            nuevo._vocabulario = list(self._vocabulario)
+            for palabra in nuevo._por_palabra.keys() - self._por_palabra.keys():
+                insort(nuevo._vocabulario, palabra)
+        return nuevo
+
+    # Unidades que contienen el término (fragmentos de 3+ caracteres) o alguna palabra que empieza con él
+    def _candidatos(self, termino):
+        if len(termino) >= 3:
+            listas = [self._por_trigrama.get(t) for t in _trigramas(termino)]
+            if not all(listas):
+                return set()
+            listas.sort(key=len)
+            candidatos = set(listas[0])
+            for lista in listas[1:]:
+                candidatos.intersection_update(lista)
+                if not candidatos:
+                    break
+            return candidatos
+
+        candidatos = set()
+        i = bisect_left(self._vocabulario, termino)
+        while i < len(self._vocabulario) and self._vocabulario[i].startswith(termino):
+            candidatos.update(self._por_palabra[self._vocabulario[i]])
+            i += 1
+        return candidatos
+
+    def _puntaje(self, doc, terminos):
+        clues_norm = self._clues_norm[doc]
+        texto = self._textos[doc]
+        total = 0
+        for termino in terminos:
+            # Los trigramas pueden dar falsos positivos: confirmar que el término aparece tal cual
+            if termino not in texto:
+                return 0
+            if termino == clues_norm:
+                total += PUNTAJE_CLUES_EXACTA
+            elif clues_norm.startswith(termino):
+                total += PUNTAJE_CLUES_PREFIJO
+            elif termino in self._palabras[doc]:
+                total += PUNTAJE_PALABRA_EXACTA
+            elif any(palabra.startswith(termino) for palabra in self._palabras[doc]):
+                total += PUNTAJE_PALABRA_PREFIJO
+            else:
+                total += PUNTAJE_SUBCADENA
+        return total
+
+    # Devuelve los índices de las mejores `limite` unidades para la consulta
+    def buscar(self, consulta, limite=20):
+        terminos = sorted(set(normalizar(consulta).split()), key=len, reverse=True)
+        if not terminos:
+            return []
+
+        candidatos = None
+        for termino in terminos:
+            docs = self._candidatos(termino)
+            candidatos = docs if candidatos is None else candidatos & docs
+            if not candidatos:
+                return []
+        if self._eliminados:
+            candidatos = candidatos - self._eliminados
+
+        ranking = []
+        for doc in candidatos:
+            puntaje = self._puntaje(doc, terminos)
+            if puntaje:
+                ranking.append((-puntaje, len(self._textos[doc]), self.clues[doc], doc))
+        return [doc for *_, doc in heapq.nsmallest(limite, ranking)]
+
+    # Misma etiqueta que las opciones del dropdown de CLUES por entidad
+    def etiqueta(self, clues):
+        doc = self._por_clues[clues]
+        return f"{clues} - {self.nombres[doc] or 'Unidad de salud'}"
+
+    # Resultados listos para un dcc.Dropdown; `search` permite que el filtro del navegador no los descarte
+    def opciones(self, consulta, limite=20):
+        opciones = []
+        for doc in self.buscar(consulta, limite):
+            nombre = self.nombres[doc] or 'Unidad de salud'
+            entidad = self.entidades[doc] or 'Sin entidad'
+            opciones.append({
+                'label': f"{self.clues[doc]} - {nombre} ({entidad})",
+                'value': self.clues[doc],
+                'search': f"{self.clues[doc]} {nombre} {entidad} {self._textos[doc]}",
+            })
+        return opciones
+
+
+def construir_indice_busqueda(df):
+    if 'nombre_de_la_unidad' in df.columns:
+        nombre = pl.col('nombre_de_la_unidad')
+    else:
+        nombre = pl.lit(None, dtype=pl.Utf8).alias('nombre_de_la_unidad')
+    registros = (
+        df.filter(pl.col('clues_imb').is_not_null())
+        .unique(subset='clues_imb', keep='first', maintain_order=True)
+        .select(pl.col('clues_imb'), nombre, pl.col('entidad'))
+    )
+    return IndiceBusqueda(registros.iter_rows())
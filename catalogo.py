@@ -0,0 +1,134 @@
+import json
+from datetime import datetime
+from pathlib import Path
+
+import polars as pl
+
+import archivos
+
+# ========== VERSIONES DEL CATÁLOGO CLUES ==========
+# El catálogo llega completo cada mes. Cada archivo nuevo se compara por clues_imb con el
+# anterior y solo se guarda la diferencia (altas, cambios y bajas) en delta_v{n}.arrow, más una
+# línea de resumen en historial.json. actual.arrow es el catálogo completo de la última versión,
+# contra el que se compara el siguiente. La primera versión registrada es la base (sin delta).
+
+ALTA, CAMBIO, BAJA = 'alta', 'cambio', 'baja'
+
+COLUMNAS = ['clues_imb', 'entidad', 'nombre_de_la_unidad']
+
+# Deltas que se conservan en disco; del historial se conserva el resumen de todas las versiones
+MAX_DELTAS = 24
+
+
+# Columnas del catálogo como texto, una fila por CLUES (la primera si viene repetida)
+def normalizar(df):
+    return (
+        df.select([
+            (pl.col(c) if c in df.columns else pl.lit(None)).cast(pl.Utf8).alias(c)
+            for c in COLUMNAS
+        ])
+        .filter(pl.col('clues_imb').is_not_null())
+        .unique(subset='clues_imb', keep='first', maintain_order=True)
+    )
+
+
+# Unidades que aparecen, cambian de entidad o nombre, o desaparecen entre dos catálogos.
+# Las bajas conservan sus valores anteriores (para el historial).
+def diferencias(anterior, nuevo):
+    altas = nuevo.join(anterior, on='clues_imb', how='anti').with_columns(pl.lit(ALTA).alias('operacion'))
+    bajas = anterior.join(nuevo, on='clues_imb', how='anti').with_columns(pl.lit(BAJA).alias('operacion'))
+    cambios = (
+        nuevo.join(anterior, on='clues_imb', how='inner', suffix='_anterior')
+        .filter(pl.any_horizontal([pl.col(c).ne_missing(pl.col(f"{c}_anterior")) for c in COLUMNAS[1:]]))
+        .select(COLUMNAS)
+        .with_columns(pl.lit(CAMBIO).alias('operacion'))
+    )
+    return pl.concat([altas, cambios, bajas])
+
+
+class VersionesCatalogo:
+    def __init__(self, directorio):
+        self.directorio = Path(directorio)
+        self._historial = self.directorio / 'historial.json'
+        self._actual = self.directorio / 'actual.arrow'
+
+    def _delta(self, version):
+        return self.directorio / f"delta_v{version}.arrow"
+
+    def historial(self):
+        try:
+            return json.loads(self._historial.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return []
+
+    def ultima(self):
+        historial = self.historial()
+        return historial[-1] if historial else None
+
+    # Versión registrada para un archivo (por su sha256); 0 si no se conoce
+    def version_de(self, sha256):
+        for entrada in reversed(self.historial()):
+            if entrada['sha256'] == sha256:
+                return entrada['version']
+        return 0
+
+    # Deltas posteriores a `version`, en orden, para ponerse al día. None si alguno ya no está
+    # en disco o `version` no está en el historial (entonces hay que reconstruir completo).
+    def deltas_desde(self, version):
+        historial = self.historial()
+        if not any(entrada['version'] == version for entrada in historial):
+            return None
+        pendientes = []
+        for entrada in historial:
+            if entrada['version'] <= version:
+                continue
+            ruta = self._delta(entrada['version'])
+            if not ruta.exists():
+                return None
+            pendientes.append((entrada, pl.read_ipc(ruta, memory_map=False)))
+        return pendientes
+
+    # Registra un catálogo completo como versión nueva. Devuelve (entrada, delta); delta es None
+    # para la versión base o si el archivo ya era la última versión registrada.
+    def registrar(self, catalogo, huella):
+        ultima = self.ultima()
+        if ultima is not None and ultima['sha256'] == huella['sha256']:
+            return ultima, None
+
+        catalogo = normalizar(catalogo)
+        anterior = None
+        if ultima is not None and self._actual.exists():
+            anterior = pl.read_ipc(self._actual, memory_map=False)
+        delta = diferencias(anterior, catalogo) if anterior is not None else None
+
+        conteo = {ALTA: 0, CAMBIO: 0, BAJA: 0}
+        if delta is not None:
+            conteo.update(dict(delta.group_by('operacion').count().iter_rows()))
+        entrada = {
+            'version': (ultima['version'] + 1) if ultima else 1,
+            'archivo': Path(huella['ruta']).name,
+            'sha256': huella['sha256'],
+            'registrada_en': datetime.now().isoformat(timespec='seconds'),
+            'unidades': len(catalogo),
+            'base': delta is None,
+            'altas': conteo[ALTA],
+            'cambios': conteo[CAMBIO],
+            'bajas': conteo[BAJA],
+        }
+
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        if delta is not None:
+            archivos.escribir_atomico(self._delta(entrada['version']), lambda tmp: delta.write_ipc(tmp, compression='zstd'))
+        archivos.escribir_atomico(self._actual, lambda tmp: catalogo.write_ipc(tmp, compression='zstd'))
+        historial = self.historial() + [entrada]
+        archivos.escribir_atomico(
+            self._historial, lambda tmp: tmp.write_text(json.dumps(historial, indent=2, ensure_ascii=False), encoding='utf-8')
+        )
+        self._podar(historial)
+        return entrada, delta
+
+    def _podar(self, historial):
+        for entrada in historial[:-MAX_DELTAS]:
+            ruta = self._delta(entrada['version'])
+            if ruta.exists():
+                ruta.unlink()
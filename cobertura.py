@@ -0,0 +1,184 @@
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import numpy as np
+
+import bitacora
+import horarios
+import persistencia
+
+# ========== MOTOR DE COBERTURA DE SERVICIOS ==========
+# Todos los horarios capturados en un arreglo denso de bits: bits[unidad, consultorio, día, turno]
+# es un uint16 con el bit s encendido si ese consultorio da el servicio s (código s + 1 de
+# horarios.servicios_options) en ese día y turno. Las preguntas de los planeadores ("qué unidades
+# de una entidad dan Pediatría en el turno Nocturno", "qué días no tienen Ginecología") son
+# máscaras y reducciones de NumPy sobre ese arreglo, sin recorrer capturas.
+
+SERVICIOS = [opcion['value'] for opcion in horarios.servicios_options]
+NUMERO_SERVICIOS = len(SERVICIOS)
+assert NUMERO_SERVICIOS <= 16, "Los servicios de una celda se guardan en un uint16"
+
+# Tiempo mínimo entre reconstrucciones del índice cuando hay capturas nuevas
+REFRESCO_SEGUNDOS = 5.0
+
+CONSULTA_HORARIOS = """
+SELECT u.clues_imb, u.entidad, c.consultorio, c.horarios
+FROM consultorios c JOIN unidades u ON u.clues_imb = c.clues_imb
+"""
+
+# Código de servicio (0..N) -> máscara de bits de la celda
+_MASCARA_CODIGO = np.array([0] + [1 << s for s in range(NUMERO_SERVICIOS)], dtype=np.uint16)
+
+_SIN_CORCHETES = str.maketrans('[]', '  ')
+
+
+def indice_servicio(servicio):
+    if servicio not in horarios.CODIGOS_SERVICIO:
+        raise ValueError(f"Servicio desconocido: {servicio}")
+    return horarios.CODIGOS_SERVICIO[servicio] - 1
+
+
+def _indices(valores, indice, total):
+    if not valores:
+        return np.arange(total)
+    try:
+        return np.array(sorted({indice(valor) for valor in valores}))
+    except ValueError:
+        raise ValueError(f"Valor desconocido en {', '.join(valores)}") from None
+
+
+class IndiceCobertura:
+    def __init__(self, clues, entidades, bits):
+        self.clues = clues                      # np.ndarray[str] (U,)
+        self.bits = bits                        # np.ndarray[uint16] (U, C, días, turnos)
+        # Servicios de cada unidad en cada día y turno (OR de sus consultorios)
+        self.por_unidad = np.bitwise_or.reduce(bits, axis=1)
+        self.entidades, self.entidad_de_unidad = np.unique(entidades, return_inverse=True)
+        self._posicion_entidad = {entidad: i for i, entidad in enumerate(self.entidades)}
+
+    @property
+    def unidades(self):
+        return len(self.clues)
+
+    def _filtro_entidad(self, entidad):
+        if entidad is None:
+            return np.ones(self.unidades, dtype=bool)
+        posicion = self._posicion_entidad.get(entidad)
+        if posicion is None:
+            return np.zeros(self.unidades, dtype=bool)
+        return self.entidad_de_unidad == posicion
+
+    def _celdas(self, entidad, dias, turnos):
+        seleccion = self.por_unidad[self._filtro_entidad(entidad)]
+        i = _indices(dias, horarios.indice_dia, len(horarios.dias_semana))
+        j = _indices(turnos, horarios.indice_turno, len(horarios.turnos))
+        return seleccion[:, i][:, :, j]
+
+    # CLUES que ofrecen `servicio` en alguno de los días y turnos indicados (todos si se omiten)
+    def unidades_con_servicio(self, servicio, entidad=None, dias=None, turnos=None):
+        bit = np.uint16(1 << indice_servicio(servicio))
+        ofrece = ((self._celdas(entidad, dias, turnos) & bit) != 0).any(axis=(1, 2))
+        return self.clues[self._filtro_entidad(entidad)][ofrece].tolist()
+
+    # Días y turnos en que ninguna unidad (de la entidad) ofrece `servicio`
+    def huecos_de_servicio(self, servicio, entidad=None):
+        bit = np.uint16(1 << indice_servicio(servicio))
+        cubierto = ((self.por_unidad[self._filtro_entidad(entidad)] & bit) != 0).any(axis=0)
+        return {
+            'dias_sin_servicio': [dia for dia, alguno in zip(horarios.dias_semana, cubierto.any(axis=1)) if not alguno],
+            'turnos_sin_servicio': {
+                dia: [turno for turno, cubre in zip(horarios.turnos, fila) if not cubre]
+                for dia, fila in zip(horarios.dias_semana, cubierto)
+                if not fila.all()
+            },
+        }
+
+    # Unidades que ofrecen cada servicio en cada día y turno: arreglo (días, turnos, servicios)
+    def conteos(self, entidad=None):
+        seleccion = self.por_unidad[self._filtro_entidad(entidad)]
+        desplazamientos = np.arange(NUMERO_SERVICIOS, dtype=np.uint16)
+        return ((seleccion[..., None] >> desplazamientos) & 1).sum(axis=0, dtype=np.int64)
+
+
+# Índice a partir de filas (clues_imb, entidad, consultorio, horarios JSON)
+def construir(filas):
+    filas = list(filas)
+    dias, turnos = len(horarios.dias_semana), len(horarios.turnos)
+    if not filas:
+        return IndiceCobertura(np.array([], dtype=object), np.array([], dtype=object),
+                               np.zeros((0, 0, dias, turnos), dtype=np.uint16))
+
+    clues_fila = np.array([fila[0] for fila in filas], dtype=object)
+    consultorio = np.array([fila[2] for fila in filas], dtype=np.int64) - 1
+    # Las matrices se guardan validadas como JSON compacto de enteros ([[0,1,0],...]): sin corchetes
+    # son una sola lista de números separada por comas, mucho más rápida de leer que fila por fila
+    texto = ','.join(fila[3] for fila in filas).translate(_SIN_CORCHETES)
+    codigos = np.fromstring(texto, dtype=np.int64, sep=',')
+    if codigos.size != len(filas) * dias * turnos:
+        raise ValueError("Hay horarios guardados con una forma distinta de días x turnos")
+    codigos = codigos.reshape(len(filas), dias, turnos)
+    codigos[(codigos < 0) | (codigos > NUMERO_SERVICIOS)] = horarios.SIN_SERVICIO
+
+    clues, unidad = np.unique(clues_fila, return_inverse=True)
+    entidades = np.empty(len(clues), dtype=object)
+    entidades[unidad] = [fila[1] or '' for fila in filas]
+
+    bits = np.zeros((len(clues), int(consultorio.max()) + 1, dias, turnos), dtype=np.uint16)
+    bits[unidad, consultorio] = _MASCARA_CODIGO[codigos]
+    return IndiceCobertura(clues, entidades, bits)
+
+
+# Mantiene el índice al día con la base de capturas. PRAGMA data_version cambia cuando otra
+# conexión (el escritor de este u otro worker) confirma una transacción; entonces se reconstruye,
+# como mucho una vez cada REFRESCO_SEGUNDOS.
+class Cobertura:
+    def __init__(self, ruta, refresco=REFRESCO_SEGUNDOS):
+        self.ruta = ruta
+        self.refresco = refresco
+        self._candado = threading.Lock()
+        self._conexion = None
+        self._version = None
+        self._construido = 0.0
+        self._indice = None
+
+    def _version_datos(self):
+        if self._conexion is None:
+            self._conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+        return self._conexion.execute("PRAGMA data_version").fetchone()[0]
+
+    def indice(self):
+        with self._candado:
+            version = self._version_datos()
+            vencido = time.monotonic() - self._construido >= self.refresco
+            if self._indice is None or (version != self._version and vencido):
+                inicio = time.perf_counter()
+                with closing(sqlite3.connect(self.ruta)) as conexion:
+                    self._indice = construir(conexion.execute(CONSULTA_HORARIOS))
+                self._version = version
+                self._construido = time.monotonic()
+                bitacora.evento(
+                    'indice_cobertura', unidades=self._indice.unidades, kb=self._indice.bits.nbytes // 1024,
+                    ms=round((time.perf_counter() - inicio) * 1000, 1),
+                )
+            return self._indice
+
+    def cerrar(self):
+        with self._candado:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+
+
+_cobertura = None
+_cobertura_candado = threading.Lock()
+
+
+# Motor compartido por el proceso, sobre la misma base que el almacén de capturas
+def obtener_cobertura():
+    global _cobertura
+    with _cobertura_candado:
+        if _cobertura is None:
+            _cobertura = Cobertura(persistencia.obtener_almacen().ruta)
+        return _cobertura
@@ -0,0 +1,105 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import flask
+
+try:
+    import brotli
+except ImportError:  # Sin brotli se usa solo gzip
+    brotli = None
+
+# ========== COMPRESIÓN Y CACHÉ HTTP ==========
+
+# Respuestas más chicas que esto no se comprimen: el encabezado gzip no compensa
+UMBRAL_COMPRESION = 1024
+
+TIPOS_COMPRIMIBLES = (
+    'text/', 'application/json', 'application/javascript', 'application/x-javascript', 'image/svg+xml',
+)
+
+# Bundles de componentes ya comprimidos que se guardan en memoria (por ruta y codificación)
+MAX_ESTATICOS_EN_CACHE = 64
+
+
+def _codificacion_aceptada(request):
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+# Los recursos estáticos se comprimen una sola vez con el nivel máximo; las respuestas
+# dinámicas (callbacks) con un nivel rápido
+def _comprimir(datos, codificacion, estatico):
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=11 if estatico else 4)
+    # mtime=0 para que el mismo contenido produzca siempre los mismos bytes (y el mismo ETag)
+    return gzip.compress(datos, compresslevel=9 if estatico else 6, mtime=0)
+
+
+def _comprimible(respuesta):
+    return (
+        respuesta.status_code == 200
+        and not respuesta.direct_passthrough
+        and not respuesta.is_streamed
+        and 'Content-Encoding' not in respuesta.headers
+        and (respuesta.mimetype or '').startswith(TIPOS_COMPRIMIBLES)
+    )
+
+
+# Registra en el servidor Flask la compresión gzip/brotli y la validación con ETag/Last-Modified
+# de _dash-layout y _dash-dependencies. `fecha_layout` devuelve cuándo cambió el layout por última vez;
+# `rutas_estaticas` son otros prefijos (bajo `base`) cuyo contenido no cambia para una misma URL.
+def configurar(server, base, fecha_layout=None, umbral=UMBRAL_COMPRESION, rutas_estaticas=()):
+    rutas_validables = {f"{base}_dash-layout", f"{base}_dash-dependencies"}
+    prefijos_estaticos = tuple(f"{base}{ruta}" for ruta in ('_dash-component-suites/', *rutas_estaticas))
+    inicio = datetime.now(timezone.utc).replace(microsecond=0)
+    estaticos = OrderedDict()
+    candado = threading.Lock()
+
+    def comprimir_estatico(clave, datos, codificacion):
+        with candado:
+            if clave in estaticos:
+                estaticos.move_to_end(clave)
+                return estaticos[clave]
+        comprimidos = _comprimir(datos, codificacion, estatico=True)
+        with candado:
+            estaticos[clave] = comprimidos
+            if len(estaticos) > MAX_ESTATICOS_EN_CACHE:
+                estaticos.popitem(last=False)
+        return comprimidos
+
+    @server.after_request
+    def comprimir_y_validar(respuesta):
+        request = flask.request
+        if not _comprimible(respuesta):
+            return respuesta
+
+        respuesta.vary.add('Accept-Encoding')
+        datos = respuesta.get_data()
+        codificacion = _codificacion_aceptada(request)
+        if codificacion and len(datos) >= umbral:
+            if request.path.startswith(prefijos_estaticos):
+                datos = comprimir_estatico((request.full_path, codificacion), datos, codificacion)
+            else:
+                datos = _comprimir(datos, codificacion, estatico=False)
+            respuesta.set_data(datos)
+            respuesta.headers['Content-Encoding'] = codificacion
+
+        if request.method == 'GET' and request.path in rutas_validables:
+            # El ETag depende de los bytes enviados: cada codificación tiene el suyo
+            respuesta.set_etag(hashlib.sha1(datos).hexdigest())
+            modificado = inicio
+            if fecha_layout is not None and request.path.endswith('_dash-layout'):
+                modificado = max(inicio, fecha_layout())
+            respuesta.last_modified = modificado
+            # Siempre revalidar; si no cambió, el navegador recibe un 304 sin cuerpo
+            respuesta.cache_control.no_cache = True
+            respuesta = respuesta.make_conditional(request)
+        return respuesta
+
+    return comprimir_y_validar
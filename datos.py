@@ -0,0 +1,684 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple
+
+import polars as pl
+
+import archivos
+import bitacora
+import busqueda
+import catalogo
+import resumenes
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+BASE_DIR = Path(__file__).parent
+
+# ========== ARCHIVOS DE ORIGEN Y CACHÉ ==========
+DATA_DIR = BASE_DIR / "data"
+ARCHIVO_INFRA = DATA_DIR / "infraestructura.xlsx"
+# El catálogo CLUES cambia de nombre cada mes; se puede indicar con INFRA_ARCHIVO_CLUES
+ARCHIVO_CLUES = DATA_DIR / os.environ.get("INFRA_ARCHIVO_CLUES", "clues_julio.xlsx")
+
+# La caché se puede mover a un disco local rápido con INFRA_CACHE_DIR
+CACHE_DIR = Path(os.environ.get("INFRA_CACHE_DIR", BASE_DIR / "data/cache"))
+CACHE_ARROW = CACHE_DIR / "df_merged.arrow"
+CACHE_META = CACHE_DIR / "df_merged.json"
+
+# Historial de versiones del catálogo CLUES (ver catalogo.py)
+versiones_catalogo = catalogo.VersionesCatalogo(CACHE_DIR / "catalogo_clues")
+
+# Subir este número cuando cambie la forma de construir df_merged
+VERSION_CACHE = 4
+
+# Columnas que usa la app; el resto de los libros no se carga
+COLUMNAS_INFRA = ['clues_imb'] + resumenes.COLUMNAS_CAPACIDAD
+COLUMNAS_CLUES = ['clues_imb', 'entidad', 'nombre_de_la_unidad']
+
+# Rangos de los enteros, del más angosto al más ancho
+RANGOS_ENTEROS = [
+    (pl.UInt8, 0, 2**8 - 1), (pl.UInt16, 0, 2**16 - 1), (pl.UInt32, 0, 2**32 - 1),
+    (pl.Int8, -2**7, 2**7 - 1), (pl.Int16, -2**15, 2**15 - 1), (pl.Int32, -2**31, 2**31 - 1),
+]
+
+
+def _fuentes():
+    return {'infraestructura': ARCHIVO_INFRA, 'clues': ARCHIVO_CLUES}
+
+
+# Huella de un archivo: mtime y tamaño para la comprobación rápida, sha256 para confirmar
+def _huella_archivo(ruta, calcular_hash=True):
+    stat = ruta.stat()
+    huella = {'ruta': str(ruta), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    if calcular_hash:
+        sha = hashlib.sha256()
+        with open(ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(1 << 20), b''):
+                sha.update(bloque)
+        huella['sha256'] = sha.hexdigest()
+    return huella
+
+
+def _leer_meta():
+    try:
+        with open(CACHE_META, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Determina si la caché corresponde a los libros de Excel actuales.
+# Devuelve (vigente, huellas) donde huellas es None si no hubo que recalcularlas.
+def _cache_vigente(meta, fuentes):
+    if not meta or meta.get('version') != VERSION_CACHE or not CACHE_ARROW.exists():
+        return False, None
+
+    guardadas = meta.get('fuentes', {})
+    rapidas = _huellas_rapidas(fuentes)
+    if all(
+        nombre in guardadas
+        and guardadas[nombre]['mtime_ns'] == huella['mtime_ns']
+        and guardadas[nombre]['size'] == huella['size']
+        for nombre, huella in rapidas.items()
+    ):
+        return True, None
+
+    # El mtime cambió (p. ej. un checkout nuevo): confirmar por contenido
+    huellas = {nombre: _huella_archivo(ruta) for nombre, ruta in fuentes.items()}
+    vigente = all(
+        nombre in guardadas and guardadas[nombre].get('sha256') == huella['sha256']
+        for nombre, huella in huellas.items()
+    )
+    return vigente, huellas
+
+
+def _huellas_rapidas(fuentes):
+    return {nombre: _huella_archivo(ruta, calcular_hash=False) for nombre, ruta in fuentes.items()}
+
+
+# Memoria residente del proceso en bytes (None si la plataforma no la expone)
+def memoria_residente():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _mb(bytes_):
+    return round(bytes_ / 2**20, 1) if bytes_ is not None else None
+
+
+# Tipo entero más angosto que contiene todos los valores de la columna
+def _entero_angosto(minimo, maximo):
+    if minimo is None:
+        return pl.UInt8
+    for tipo, desde, hasta in RANGOS_ENTEROS:
+        if desde <= minimo and maximo <= hasta:
+            return tipo
+    return pl.Int64
+
+
+# entidad se repite miles de veces: Categorical (orden lexicográfico para los dropdowns);
+# los conteos se guardan en el entero más angosto que los contiene
+def _compactar(df):
+    enteros = [c for c, tipo in df.schema.items() if tipo.is_integer()]
+    rangos = df.select(
+        [pl.col(c).min().alias(f"min_{c}") for c in enteros] + [pl.col(c).max().alias(f"max_{c}") for c in enteros]
+    ).row(0, named=True) if enteros else {}
+    return df.with_columns(
+        [pl.col(c).cast(_entero_angosto(rangos[f"min_{c}"], rangos[f"max_{c}"])) for c in enteros]
+        + [pl.col('entidad').cast(pl.Categorical('lexical'))]
+    )
+
+
+def leer_catalogo_clues(ruta):
+    return pl.read_excel(ruta, read_csv_options={'columns': COLUMNAS_CLUES})
+
+
+# Lectura de los libros de Excel y merge (el camino lento). Solo se leen las columnas que usa la app.
+def construir_df_merged(fuentes=None, df_clues=None):
+    fuentes = fuentes or _fuentes()
+    df_infra = pl.read_excel(fuentes['infraestructura'], read_csv_options={'columns': COLUMNAS_INFRA})
+    if df_clues is None:
+        df_clues = leer_catalogo_clues(fuentes['clues'])
+    return _compactar(df_infra.join(df_clues, on='clues_imb', how='left'))
+
+
+def _guardar_cache(df, huellas):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    archivos.escribir_atomico(CACHE_ARROW, lambda tmp: df.write_ipc(tmp, compression='uncompressed'))
+    _escribir_meta(huellas, len(df))
+
+
+def _escribir_meta(huellas, filas):
+    meta = {'version': VERSION_CACHE, 'fuentes': huellas, 'filas': filas}
+    archivos.escribir_atomico(CACHE_META, lambda tmp: tmp.write_text(json.dumps(meta, indent=2), encoding='utf-8'))
+
+
+# Bloqueo entre procesos para que, con varios workers, solo uno reconstruya la caché
+@contextmanager
+def _bloqueo_cache():
+    if fcntl is None:
+        yield
+        return
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(CACHE_DIR / ".lock", 'a') as archivo:
+        fcntl.flock(archivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(archivo, fcntl.LOCK_UN)
+
+
+def _leer_cache(huellas, tiempos):
+    t = time.perf_counter()
+    # Sin compresión para que el mapeo en memoria no requiera copiar los buffers;
+    # los procesos que mapean el mismo archivo comparten sus páginas
+    df = pl.read_ipc(CACHE_ARROW, memory_map=True)
+    tiempos['lectura_cache'] = time.perf_counter() - t
+    if huellas is not None:
+        # Solo cambió el mtime: actualizar la metadata para no volver a calcular el hash
+        try:
+            _escribir_meta(huellas, len(df))
+        except OSError as e:
+            bitacora.advertencia('cache_meta_no_actualizada', error=str(e))
+    tiempos['origen'] = 'cache'
+    return df
+
+
+# Carga df_merged desde la caché Arrow (memory-mapped) o la reconstruye desde Excel.
+# Devuelve el DataFrame y un diccionario con los tiempos de cada fase en segundos.
+def cargar_df_merged(forzar=False, fuentes=None):
+    fuentes = fuentes or _fuentes()
+    tiempos = {}
+    inicio = time.perf_counter()
+
+    vigente, huellas = (False, None) if forzar else _cache_vigente(_leer_meta(), fuentes)
+    tiempos['verificacion'] = time.perf_counter() - inicio
+    if vigente:
+        df = _leer_cache(huellas, tiempos)
+        tiempos['total'] = time.perf_counter() - inicio
+        return df, tiempos
+
+    with _bloqueo_cache():
+        # Otro proceso pudo haber reconstruido la caché mientras esperábamos
+        if not forzar:
+            vigente, huellas = _cache_vigente(_leer_meta(), fuentes)
+        if vigente:
+            df = _leer_cache(huellas, tiempos)
+        else:
+            t = time.perf_counter()
+            df_clues = leer_catalogo_clues(fuentes['clues'])
+            df = construir_df_merged(fuentes, df_clues)
+            tiempos['lectura_excel'] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            huellas = huellas or {nombre: _huella_archivo(ruta) for nombre, ruta in fuentes.items()}
+            try:
+                _guardar_cache(df, huellas)
+                # También las reconstrucciones completas quedan en el historial del catálogo
+                _registrar_catalogo(df_clues, huellas['clues'])
+            except OSError as e:
+                # Un disco de solo lectura no debe impedir que la app arranque
+                bitacora.advertencia('cache_no_escrita', error=str(e))
+            tiempos['escritura_cache'] = time.perf_counter() - t
+            tiempos['origen'] = 'excel'
+
+    tiempos['total'] = time.perf_counter() - inicio
+    return df, tiempos
+
+
+# Agrega el catálogo al historial si es un archivo que no es la última versión registrada
+def _registrar_catalogo(df_clues, huella):
+    ultima = versiones_catalogo.ultima()
+    if ultima is not None and ultima['sha256'] == huella['sha256']:
+        return ultima, None
+    entrada, delta = versiones_catalogo.registrar(df_clues, huella)
+    bitacora.evento(
+        'catalogo_registrado', version=entrada['version'], archivo=entrada['archivo'], base=entrada['base'],
+        altas=entrada['altas'], cambios=entrada['cambios'], bajas=entrada['bajas'],
+    )
+    return entrada, delta
+
+
+def _huellas_guardadas():
+    return (_leer_meta() or {}).get('fuentes') or {}
+
+
+# Versión del catálogo y sha256 de infraestructura con que se construyó la caché vigente
+def _origen_cache():
+    guardadas = _huellas_guardadas()
+    sha_clues = (guardadas.get('clues') or {}).get('sha256')
+    return versiones_catalogo.version_de(sha_clues), (guardadas.get('infraestructura') or {}).get('sha256')
+
+
+# Tiempos de carga en milisegundos para la bitácora
+def tiempos_ms(tiempos):
+    return {fase: valor if fase == 'origen' else round(valor * 1000, 1) for fase, valor in tiempos.items()}
+
+
+def memoria_mb(memoria):
+    return {clave: _mb(valor) for clave, valor in memoria.items()}
+
+
+# ========== ÍNDICES DERIVADOS ==========
+
+# Opciones del dropdown de CLUES ya armadas por entidad, para servirlas sin filtrar df_merged
+def indice_opciones_por_entidad(df):
+    if 'nombre_de_la_unidad' in df.columns:
+        nombre = pl.col('nombre_de_la_unidad').fill_null('Unidad de salud')
+    else:
+        nombre = pl.lit('Unidad de salud')
+    etiquetas = df.filter(pl.col('clues_imb').is_not_null()).select(
+        pl.col('entidad'),
+        pl.col('clues_imb'),
+        pl.concat_str([pl.col('clues_imb'), pl.lit(' - '), nombre]).alias('label'),
+    )
+
+    indice = {}
+    for entidad, clues, label in etiquetas.iter_rows():
+        indice.setdefault(entidad, []).append({'label': label, 'value': clues})
+    return indice
+
+
+# Registro de cada CLUES con los totales de consultorios ya calculados, indexado por clues_imb
+def indice_registros_por_clues(df):
+    # Los conteos vienen en enteros angostos: se amplían antes de sumar
+    generales = pl.col('total_consultorios_generales').cast(pl.Int32).fill_null(0)
+    especialidad = pl.col('total_consultorios_de_especialidad').cast(pl.Int32).fill_null(0)
+    registros = (
+        df.filter(pl.col('clues_imb').is_not_null())
+        .unique(subset='clues_imb', keep='first', maintain_order=True)
+        .select(
+            pl.col('clues_imb'),
+            pl.col('entidad'),
+            generales.alias('consultorios_generales'),
+            especialidad.alias('consultorios_especialidad'),
+            (generales + especialidad).alias('total_consultorios'),
+            pl.col('total_de_quirofanos'),
+        )
+    )
+    return {registro['clues_imb']: registro for registro in registros.iter_rows(named=True)}
+
+
+# ========== SNAPSHOT DE DATOS Y RECARGA EN CALIENTE ==========
+
+# Todo lo que los callbacks leen de los catálogos. Es inmutable: una recarga construye uno
+# nuevo completo y lo publica con una sola asignación, así cada request ve una versión consistente.
+class Snapshot(NamedTuple):
+    df_merged: pl.DataFrame
+    entidades_options: list
+    opciones_por_entidad: dict
+    registros_por_clues: dict
+    indice_busqueda: busqueda.IndiceBusqueda
+    resumen_por_entidad: dict
+    version: int
+    cargado_en: str
+    fuentes: dict
+    # Con qué versión del catálogo CLUES y qué libro de infraestructura se construyó (0 y None si
+    # no se sabe); decide si una recarga puede aplicar solo los cambios del catálogo
+    catalogo_version: int = 0
+    sha_infraestructura: str = None
+
+
+# Datos de ejemplo en caso de error
+DATOS_EJEMPLO = [
+    {'clues_imb': '01ABC123', 'entidad': 'Aguascalientes', 'nombre_de_la_unidad': 'Hospital General de Aguascalientes', 
+     'consultorios_generales_habilitados': 12, 'consultorios_generales_inhabilitados': 3, 'total_consultorios_generales': 15,
+     'consultorios_de_especialidad_habilitados': 8, 'consultorios_de_especialidad_inhabilitados': 2, 'total_consultorios_de_especialidad': 10,
+     'quirofanos_habilitados': 4, 'quirofanos_inhabilitados': 1, 'total_de_quirofanos': 5},
+    {'clues_imb': '02DEF456', 'entidad': 'Baja California', 'nombre_de_la_unidad': 'Hospital General de Tijuana', 
+     'consultorios_generales_habilitados': 15, 'consultorios_generales_inhabilitados': 5, 'total_consultorios_generales': 20,
+     'consultorios_de_especialidad_habilitados': 10, 'consultorios_de_especialidad_inhabilitados': 2, 'total_consultorios_de_especialidad': 12,
+     'quirofanos_habilitados': 5, 'quirofanos_inhabilitados': 1, 'total_de_quirofanos': 6},
+]
+
+_snapshot = None
+# Se activa cuando se publica el primer snapshot (readyz)
+_listo = threading.Event()
+_candado_recarga = threading.Lock()
+_estado_recarga = {'en_progreso': False, 'ultima_recarga': None, 'ultimo_error': None, 'tiempos': None, 'memoria': None}
+
+
+def _memoria(antes, df):
+    return {'rss_antes': antes, 'rss_despues': memoria_residente(), 'df_merged': df.estimated_size()}
+
+
+def construir_snapshot(df, version, fuentes=None, catalogo_version=0, sha_infraestructura=None):
+    return Snapshot(
+        df_merged=df,
+        # Lista de entidades
+        entidades_options=[{'label': e, 'value': e} for e in df['entidad'].drop_nulls().unique().sort().to_list()],
+        # Índice entidad -> opciones de CLUES
+        opciones_por_entidad=indice_opciones_por_entidad(df),
+        # Índice clues_imb -> registro con totales precalculados
+        registros_por_clues=indice_registros_por_clues(df),
+        # Índice de trigramas para la búsqueda global por CLUES o nombre de la unidad
+        indice_busqueda=busqueda.construir_indice_busqueda(df),
+        # Capacidad del catálogo por entidad y nacional (resumenes.NACIONAL)
+        resumen_por_entidad=resumenes.resumen_catalogo(df),
+        version=version,
+        cargado_en=datetime.now().isoformat(timespec='seconds'),
+        fuentes={nombre: str(ruta) for nombre, ruta in (fuentes or {}).items()},
+        catalogo_version=catalogo_version,
+        sha_infraestructura=sha_infraestructura,
+    )
+
+
+# Snapshot vigente; cada callback lo lee una sola vez y trabaja con esa referencia
+def snapshot_actual():
+    return _snapshot
+
+
+def _publicar(snapshot):
+    global _snapshot
+    _snapshot = snapshot
+    _listo.set()
+
+
+def listo():
+    return _listo.is_set()
+
+
+def esperar_carga(timeout=None):
+    return _listo.wait(timeout)
+
+
+# Primera carga al arrancar; si los archivos no se pueden leer se usan datos de ejemplo
+def cargar_inicial():
+    fuentes = _fuentes()
+    memoria_antes = memoria_residente()
+    try:
+        # Cargar bases ya unidas (desde la caché Arrow si los Excel no cambiaron)
+        df, tiempos = cargar_df_merged(fuentes=fuentes)
+        t = time.perf_counter()
+        snapshot = construir_snapshot(df, 1, fuentes, *_origen_cache())
+        tiempos['indices'] = time.perf_counter() - t
+        memoria = _memoria(memoria_antes, df)
+
+        bitacora.evento(
+            'datos_cargados', registros=len(df), entidades=len(snapshot.entidades_options),
+            tiempos_ms=tiempos_ms(tiempos), memoria_mb=memoria_mb(memoria),
+        )
+        _estado_recarga.update(ultima_recarga=snapshot.cargado_en, tiempos=tiempos, memoria=memoria)
+    except Exception as e:
+        bitacora.error('datos_no_cargados', error=str(e), respaldo='datos de ejemplo')
+        snapshot = construir_snapshot(pl.DataFrame(DATOS_EJEMPLO), 1)
+        _estado_recarga.update(ultimo_error=str(e))
+    _publicar(snapshot)
+    return snapshot
+
+
+# Carga inicial en un hilo: el servidor acepta conexiones (y responde /healthz) mientras se leen
+# los datos. Al terminar inicia la vigilancia si se pidió. `inicio` (perf_counter del arranque
+# del proceso) sirve para registrar cuánto tardó la app en quedar lista.
+def cargar_en_segundo_plano(intervalo_vigilancia=0, inicio=None):
+    def tarea():
+        cargar_inicial()
+        if inicio is not None:
+            bitacora.evento('datos_listos', desde_arranque_ms=round((time.perf_counter() - inicio) * 1000, 1))
+        if intervalo_vigilancia > 0:
+            iniciar_vigilancia(intervalo_vigilancia)
+
+    hilo = threading.Thread(target=tarea, name="carga-inicial", daemon=True)
+    hilo.start()
+    return hilo
+
+
+# Un catálogo CLUES nuevo se indica por nombre y debe estar dentro de data/
+def ruta_catalogo_clues(nombre):
+    ruta = (DATA_DIR / Path(nombre).name).resolve()
+    if ruta.suffix != '.xlsx' or ruta.parent != DATA_DIR.resolve() or not ruta.exists():
+        raise ValueError(f"Catálogo CLUES inválido: {nombre}")
+    return ruta
+
+
+# ========== ACTUALIZACIÓN INCREMENTAL DEL CATÁLOGO CLUES ==========
+# Cuando solo cambia el catálogo CLUES (el caso de cada mes) no se reconstruye el snapshot: se
+# toman las diferencias con la versión anterior (catalogo.py) y se corrigen entidad y nombre de
+# las unidades afectadas en df_merged y en cada índice. Nada del snapshot anterior se modifica;
+# el nuevo comparte con él todo lo que no cambió.
+
+# Snapshot con un delta del catálogo aplicado (filas clues_imb, entidad, nombre_de_la_unidad,
+# operacion). Las unidades que no están en infraestructura no afectan nada: df_merged es un left join.
+def aplicar_delta_catalogo(snapshot, delta, version_catalogo):
+    df = snapshot.df_merged
+    nuevos = delta.filter(pl.col('clues_imb').is_in(df['clues_imb'])).select(
+        'clues_imb',
+        *[
+            pl.when(pl.col('operacion') == catalogo.BAJA).then(None).otherwise(pl.col(c)).alias(c)
+            for c in ('entidad', 'nombre_de_la_unidad')
+        ],
+    )
+    if nuevos.is_empty():
+        return snapshot._replace(catalogo_version=version_catalogo)
+
+    # Entidades que ganan o pierden unidades (None: sin entidad)
+    registros = dict(snapshot.registros_por_clues)
+    afectadas = set()
+    for clues, entidad, _ in nuevos.iter_rows():
+        afectadas.update((registros[clues]['entidad'], entidad))
+        registros[clues] = {**registros[clues], 'entidad': entidad}
+
+    df = (
+        df.with_columns(pl.col('entidad').cast(pl.Utf8))
+        .join(nuevos.with_columns(pl.lit(True).alias('_cambio')), on='clues_imb', how='left', suffix='_nuevo')
+        .with_columns([
+            pl.when(pl.col('_cambio')).then(pl.col(f"{c}_nuevo")).otherwise(pl.col(c)).alias(c)
+            for c in ('entidad', 'nombre_de_la_unidad')
+        ])
+        .select(df.columns)
+        .with_columns(pl.col('entidad').cast(pl.Categorical('lexical')))
+    )
+
+    # Opciones y resúmenes: solo se recalculan las entidades afectadas
+    filtro = pl.col('entidad').cast(pl.Utf8).is_in([e for e in afectadas if e is not None])
+    if None in afectadas:
+        filtro = filtro | pl.col('entidad').is_null()
+    df_afectadas = df.filter(filtro)
+    opciones_afectadas = indice_opciones_por_entidad(df_afectadas)
+    resumen_afectadas = resumenes.resumen_catalogo(df_afectadas)
+    opciones = dict(snapshot.opciones_por_entidad)
+    resumen = dict(snapshot.resumen_por_entidad)
+    for entidad in afectadas:
+        if entidad in opciones_afectadas:
+            opciones[entidad] = opciones_afectadas[entidad]
+        else:
+            opciones.pop(entidad, None)
+        clave = resumenes.SIN_ENTIDAD if entidad is None else entidad
+        if clave in resumen_afectadas:
+            resumen[clave] = resumen_afectadas[clave]
+        else:
+            resumen.pop(clave, None)
+
+    return snapshot._replace(
+        df_merged=df,
+        entidades_options=[{'label': e, 'value': e} for e in df['entidad'].drop_nulls().unique().sort().to_list()],
+        opciones_por_entidad=opciones,
+        registros_por_clues=registros,
+        indice_busqueda=snapshot.indice_busqueda.con_cambios(nuevos.select('clues_imb', 'nombre_de_la_unidad', 'entidad').iter_rows()),
+        resumen_por_entidad=resumen,
+        catalogo_version=version_catalogo,
+    )
+
+
+# Camino incremental de recargar: registra el catálogo nuevo (si lo es) y aplica al snapshot
+# vigente los deltas que le falten, incluidos los que registró otro worker. Devuelve
+# (None, tiempos) si no aplica: cambió el libro de infraestructura o falta historial.
+def _recargar_catalogo(anterior, fuentes):
+    tiempos = {}
+    inicio = time.perf_counter()
+    guardada = _huellas_guardadas().get('infraestructura')
+    if not anterior.catalogo_version or not guardada or guardada.get('sha256') != anterior.sha_infraestructura:
+        return None, tiempos
+    rapida = _huella_archivo(fuentes['infraestructura'], calcular_hash=False)
+    if (rapida['mtime_ns'], rapida['size']) != (guardada['mtime_ns'], guardada['size']):
+        return None, tiempos
+
+    with _bloqueo_cache():
+        huella_clues = _huella_archivo(fuentes['clues'])
+        pendientes = versiones_catalogo.deltas_desde(anterior.catalogo_version)
+        if pendientes is None:
+            return None, tiempos
+        registrada = versiones_catalogo.ultima()['sha256'] == huella_clues['sha256']
+        if not registrada:
+            t = time.perf_counter()
+            df_clues = leer_catalogo_clues(fuentes['clues'])
+            tiempos['lectura_catalogo'] = time.perf_counter() - t
+            t = time.perf_counter()
+            entrada, delta = _registrar_catalogo(df_clues, huella_clues)
+            tiempos['diferencias'] = time.perf_counter() - t
+            if delta is None:
+                # Se perdió el catálogo anterior: esta versión queda como base
+                return None, tiempos
+            pendientes.append((entrada, delta))
+
+        t = time.perf_counter()
+        snapshot = anterior
+        for entrada, delta in pendientes:
+            snapshot = aplicar_delta_catalogo(snapshot, delta, entrada['version'])
+        tiempos['delta'] = time.perf_counter() - t
+
+        # Si otro worker registró la versión, ya escribió también la caché
+        if not registrada:
+            t = time.perf_counter()
+            try:
+                _guardar_cache(snapshot.df_merged, {'infraestructura': guardada, 'clues': huella_clues})
+            except OSError as e:
+                bitacora.advertencia('cache_no_escrita', error=str(e))
+            tiempos['escritura_cache'] = time.perf_counter() - t
+
+    tiempos['origen'] = 'delta'
+    tiempos['total'] = time.perf_counter() - inicio
+    return snapshot, tiempos
+
+
+# Construye un snapshot nuevo y lo publica de una vez: aplicando solo los cambios del catálogo
+# CLUES si es posible, o completo (Excel o caché + índices). Mientras tanto los requests siguen
+# usando el snapshot anterior sin bloquearse.
+def recargar(forzar=False, archivo_clues=None):
+    global ARCHIVO_CLUES
+    if not _candado_recarga.acquire(blocking=False):
+        return None
+    try:
+        _estado_recarga['en_progreso'] = True
+        memoria_antes = memoria_residente()
+        fuentes = _fuentes()
+        if archivo_clues:
+            fuentes['clues'] = ruta_catalogo_clues(archivo_clues)
+
+        anterior = snapshot_actual()
+        version = (anterior.version + 1) if anterior else 1
+        snapshot, tiempos = (None, {}) if forzar or anterior is None else _recargar_catalogo(anterior, fuentes)
+        if snapshot is not None:
+            snapshot = snapshot._replace(
+                version=version,
+                cargado_en=datetime.now().isoformat(timespec='seconds'),
+                fuentes={nombre: str(ruta) for nombre, ruta in fuentes.items()},
+            )
+        else:
+            df, tiempos = cargar_df_merged(forzar=forzar, fuentes=fuentes)
+            t = time.perf_counter()
+            snapshot = construir_snapshot(df, version, fuentes, *_origen_cache())
+            tiempos['indices'] = time.perf_counter() - t
+        df = snapshot.df_merged
+
+        _publicar(snapshot)
+        ARCHIVO_CLUES = fuentes['clues']
+        memoria = _memoria(memoria_antes, df)
+        _estado_recarga.update(ultima_recarga=snapshot.cargado_en, ultimo_error=None, tiempos=tiempos, memoria=memoria)
+        bitacora.evento(
+            'datos_recargados', version=snapshot.version, registros=len(df),
+            tiempos_ms=tiempos_ms(tiempos), memoria_mb=memoria_mb(memoria),
+        )
+        return snapshot
+    except Exception as e:
+        # Si falla, se conserva el snapshot anterior
+        _estado_recarga['ultimo_error'] = str(e)
+        bitacora.error('datos_no_recargados', error=str(e))
+        raise
+    finally:
+        _estado_recarga['en_progreso'] = False
+        _candado_recarga.release()
+
+
+# Lanza la recarga en un hilo; devuelve False si ya hay una en curso
+def recargar_en_segundo_plano(forzar=False, archivo_clues=None):
+    if _candado_recarga.locked():
+        return False
+
+    def tarea():
+        try:
+            recargar(forzar=forzar, archivo_clues=archivo_clues)
+        except Exception:
+            pass
+
+    threading.Thread(target=tarea, name="recarga-datos", daemon=True).start()
+    return True
+
+
+def estado_recarga():
+    snapshot = snapshot_actual()
+    estado = dict(_estado_recarga, listo=listo())
+    if snapshot is not None:
+        estado.update(
+            version=snapshot.version, registros=len(snapshot.df_merged), fuentes=snapshot.fuentes,
+            catalogo_version=snapshot.catalogo_version,
+        )
+    estado['historial_catalogo'] = versiones_catalogo.historial()[-catalogo.MAX_DELTAS:]
+    return estado
+
+
+# Vigila los Excel de origen y recarga cuando cambian (mtime o tamaño). También sigue la
+# metadata de la caché: si otro worker recargó (p. ej. con un catálogo CLUES nuevo),
+# este toma los mismos archivos y lee la caché ya construida.
+def iniciar_vigilancia(intervalo):
+    def marca_meta():
+        try:
+            return CACHE_META.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def vigilar():
+        vistas = _huellas_rapidas(_fuentes())
+        meta_vista = marca_meta()
+        while True:
+            time.sleep(intervalo)
+            try:
+                actuales = _huellas_rapidas(_fuentes())
+            except OSError as e:
+                bitacora.advertencia('vigilancia_sin_acceso', error=str(e))
+                continue
+            meta_actual = marca_meta()
+
+            archivo_clues = None
+            if actuales == vistas and meta_actual != meta_vista:
+                meta = _leer_meta() or {}
+                ruta_clues = meta.get('fuentes', {}).get('clues', {}).get('ruta')
+                if ruta_clues is None or Path(ruta_clues) == ARCHIVO_CLUES:
+                    meta_vista = meta_actual
+                    continue
+                archivo_clues = Path(ruta_clues).name
+            elif actuales == vistas:
+                continue
+
+            try:
+                if recargar(archivo_clues=archivo_clues) is not None:
+                    vistas = _huellas_rapidas(_fuentes())
+                    meta_vista = marca_meta()
+            except Exception:
+                pass
+
+    hilo = threading.Thread(target=vigilar, name="vigilancia-datos", daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from contextlib import closing
+
+import horarios
+import persistencia
+
+# ========== EXPORTACIÓN NACIONAL DE CAPTURAS ==========
+
+# Filas que se leen de SQLite y se envían al cliente por bloque
+TAMANO_BLOQUE = 2000
+
+COLUMNAS = [
+    'CLUES', 'Entidad', 'Coincide consultorios', 'Consultorios real', 'Consultorio',
+    'Servicios', 'Día', 'Turno', 'Servicio', 'Actualizado en',
+]
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+# Filas que admite una hoja de Excel (con el encabezado); las demás pasan a otra hoja
+FILAS_POR_HOJA = 1_048_576
+
+CONSULTA = """
+SELECT u.clues_imb, u.entidad, u.coincide_consultorios, u.consultorios_real, u.actualizado_en,
+       c.consultorio, c.servicios, c.horarios
+FROM unidades u
+LEFT JOIN consultorios c ON c.clues_imb = u.clues_imb
+WHERE (:entidad IS NULL OR u.entidad = :entidad)
+ORDER BY u.clues_imb, c.consultorio
+"""
+
+
+# Una fila por celda de horario asignada; un consultorio sin horarios aparece una vez con Día/Turno vacíos.
+# Servicios y Servicio llevan las mismas etiquetas que ve el encuestador
+def _expandir(fila):
+    clues, entidad, coincide, consultorios_real, actualizado, consultorio, servicios, matriz = fila
+    base = [clues, entidad, coincide, consultorios_real, consultorio,
+            ", ".join(map(horarios.etiqueta_servicio, json.loads(servicios))) if servicios else None]
+    asignadas = list(horarios.celdas(json.loads(matriz) if matriz else None))
+    if not asignadas:
+        yield base + [None, None, None, actualizado]
+        return
+    for dia, turno, servicio in asignadas:
+        yield base + [dia, turno, servicio, actualizado]
+
+
+# Lee las capturas por bloques de TAMANO_BLOQUE filas sin materializar todo el resultado
+def iterar_bloques(entidad=None, ruta=None):
+    with closing(persistencia.conectar(ruta or persistencia.RUTA_BD)) as conexion:
+        cursor = conexion.execute(CONSULTA, {'entidad': entidad})
+        bloque = []
+        while True:
+            filas = cursor.fetchmany(TAMANO_BLOQUE)
+            if not filas:
+                break
+            for fila in filas:
+                bloque.extend(_expandir(fila))
+            if len(bloque) >= TAMANO_BLOQUE:
+                yield bloque
+                bloque = []
+        if bloque:
+            yield bloque
+
+
+def generar_csv(bloques):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    # BOM para que Excel reconozca los acentos
+    buffer.write('\ufeff')
+    escritor.writerow(COLUMNAS)
+    for bloque in bloques:
+        escritor.writerows(bloque)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+# Archivo de solo escritura que entrega lo escrito por partes (para streaming de Parquet)
+class _SalidaPorPartes(io.RawIOBase):
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+# Cada bloque se escribe como un row group y se envía en cuanto está listo
+def generar_parquet(bloques):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.schema([
+        ('CLUES', pa.string()), ('Entidad', pa.string()), ('Coincide consultorios', pa.string()),
+        ('Consultorios real', pa.int64()), ('Consultorio', pa.int64()), ('Servicios', pa.string()),
+        ('Día', pa.string()), ('Turno', pa.string()), ('Servicio', pa.string()), ('Actualizado en', pa.string()),
+    ])
+    salida = _SalidaPorPartes()
+    with pq.ParquetWriter(salida, esquema, compression='zstd') as escritor:
+        for bloque in bloques:
+            columnas = list(zip(*bloque))
+            escritor.write_table(pa.Table.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)],
+                schema=esquema,
+            ))
+            datos = salida.vaciar()
+            if datos:
+                yield datos
+    yield salida.vaciar()
+
+
+# Libro de una sola hoja en memoria, para exportaciones chicas (los horarios de una unidad).
+# openpyxl ya es dependencia; Polars necesitaría además xlsxwriter.
+def libro_xlsx(columnas, filas, hoja="Capturas"):
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    pagina = libro.create_sheet(hoja)
+    pagina.append(columnas)
+    for fila in filas:
+        pagina.append(fila)
+    salida = io.BytesIO()
+    libro.save(salida)
+    return salida.getvalue()
+
+
+# openpyxl en modo write_only va volcando las filas a disco, así que la memoria no crece con la
+# exportación nacional. El .xlsx se envía por partes, pero solo después de guardarlo completo: a
+# diferencia de CSV y Parquet, el primer byte llega hasta que se escribió la última fila.
+def generar_xlsx(bloques, tamano_parte=1 << 16):
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    hoja, filas = None, FILAS_POR_HOJA
+    for bloque in bloques:
+        for fila in bloque:
+            if filas >= FILAS_POR_HOJA:
+                hoja = libro.create_sheet("Capturas" if hoja is None else f"Capturas {len(libro.worksheets) + 1}")
+                hoja.append(COLUMNAS)
+                filas = 1
+            hoja.append(fila)
+            filas += 1
+    if hoja is None:
+        libro.create_sheet("Capturas").append(COLUMNAS)
+
+    descriptor, ruta = tempfile.mkstemp(suffix='.xlsx')
+    os.close(descriptor)
+    try:
+        libro.save(ruta)
+        with open(ruta, 'rb') as archivo:
+            while True:
+                datos = archivo.read(tamano_parte)
+                if not datos:
+                    break
+                yield datos
+    finally:
+        os.unlink(ruta)
+
+
+GENERADORES = {'csv': generar_csv, 'parquet': generar_parquet, 'xlsx': generar_xlsx}
+
+
+# Devuelve el generador de bytes para el formato pedido
+def exportar(formato, entidad=None, ruta=None):
+    if formato not in GENERADORES:
+        raise ValueError(f"Formato no soportado: {formato}")
+    return GENERADORES[formato](iterar_bloques(entidad, ruta))
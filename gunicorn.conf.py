@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+
+# ========== CONFIGURACIÓN DE GUNICORN ==========
+# Uso: gunicorn -c gunicorn.conf.py "wsgi:crear_app()"
+#
+# Configuración con la que se ajustó:
+#   - 3 workers gthread x 4 hilos. Los callbacks son cortos y casi todo el tiempo se va en
+#     serializar JSON, así que unos pocos hilos por worker cubren la espera de red sin
+#     multiplicar la memoria.
+#   - preload_app: el maestro importa la app (Dash, layout, callbacks) una vez antes del fork,
+#     pero nunca carga datos: una operación de Polars en el maestro deja a los workers sin su pool
+#     de hilos y se bloquean en la primera consulta. Cada worker carga después del fork, por
+#     defecto en un hilo para abrir el puerto sin esperar (el servicio escala a cero; la
+#     plataforma espera a /readyz); con INFRA_CARGA_DIFERIDA=0 en post_fork, antes de aceptar
+#     conexiones. df_merged se mapea desde la caché Arrow sin copiarse, así que sus páginas se
+#     comparten por la caché del sistema; cada worker tiene su propia copia de los índices.
+#   - POLARS_MAX_THREADS=2 por worker para no tener un pool de Polars con un hilo por núcleo
+#     en cada proceso.
+#   - Cada worker abre su propio escritor de SQLite y su cola de capturas (INFRA_MAX_COLA_CAPTURAS);
+#     al salir, el worker vacía la cola antes de terminar (worker_exit). graceful_timeout debe
+#     alcanzar para eso.
+#   - Los escritores de los workers comparten la base; el modo WAL y el timeout de 30 s
+#     serializan los commits entre procesos.
+#   - La recarga en caliente (admin/recargar) se hace en el worker que recibe la petición; con
+#     INFRA_VIGILAR_SEGUNDOS los demás workers la detectan por la metadata de la caché.
+# Se puede cambiar con WEB_CONCURRENCY, GUNICORN_THREADS y PORT sin tocar este archivo.
+
+# Debe fijarse antes de que el maestro importe polars
+os.environ.setdefault("POLARS_MAX_THREADS", "2")
+os.environ.setdefault("INFRA_PREFORK", "1")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count() + 1, 4)))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# Reciclar workers de vez en cuando limita la memoria que se desprende del maestro por copy-on-write
+max_requests = 5000
+max_requests_jitter = 500
+
+
+def post_fork(server, worker):
+    import wsgi
+
+    wsgi.iniciar_worker()
+
+
+def worker_exit(server, worker):
+    import wsgi
+
+    wsgi.detener_worker()
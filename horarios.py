@@ -0,0 +1,97 @@
+# ========== CATÁLOGOS Y HORARIOS POR CONSULTORIO ==========
+
+# Servicios de consultorio
+servicios_options = [
+    {'label': 'Medicina General', 'value': 'medicina_general'},
+    {'label': 'Pediatría', 'value': 'pediatria'},
+    {'label': 'Ginecología', 'value': 'ginecologia'},
+    {'label': 'Cirugía General', 'value': 'cirugia_general'},
+    {'label': 'Traumatología', 'value': 'traumatologia'},
+    {'label': 'Oftalmología', 'value': 'oftalmologia'},
+    {'label': 'Otorrinolaringología', 'value': 'otorrinolaringologia'},
+    {'label': 'Dermatología', 'value': 'dermatologia'},
+    {'label': 'Psiquiatría', 'value': 'psiquiatria'},
+    {'label': 'Odontología', 'value': 'odontologia'},
+]
+
+# Días de la semana
+dias_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+turnos = ['Matutino', 'Vespertino', 'Nocturno']
+
+# Límite de consultorios que se capturan por unidad
+MAX_CONSULTORIOS = 100
+
+# El horario de un consultorio es una matriz de 7 días x 3 turnos con el código del servicio asignado.
+# 0 = sin asignar; el servicio en la posición i de servicios_options tiene el código i + 1.
+SIN_SERVICIO = 0
+CODIGOS_SERVICIO = {opcion['value']: i + 1 for i, opcion in enumerate(servicios_options)}
+ETIQUETAS_SERVICIO = {i + 1: opcion['label'] for i, opcion in enumerate(servicios_options)}
+
+
+def matriz_vacia():
+    return [[SIN_SERVICIO] * len(turnos) for _ in dias_semana]
+
+
+def codigo_servicio(valor):
+    if valor not in CODIGOS_SERVICIO:
+        raise ValueError(f"Servicio desconocido: {valor}")
+    return CODIGOS_SERVICIO[valor]
+
+
+# Etiqueta de un servicio por su clave; una clave que ya no está en el catálogo se deja tal cual
+def etiqueta_servicio(valor):
+    codigo = CODIGOS_SERVICIO.get(valor)
+    return ETIQUETAS_SERVICIO[codigo] if codigo else valor
+
+
+def indice_dia(dia):
+    return [d.lower() for d in dias_semana].index(dia.lower())
+
+
+def indice_turno(turno):
+    return [t.lower() for t in turnos].index(turno.lower())
+
+
+# Verifica forma y códigos de la matriz; si se indican los servicios del consultorio,
+# solo se aceptan códigos de esos servicios
+def validar_matriz(matriz, servicios_permitidos=None):
+    if matriz is None:
+        return matriz_vacia()
+    if not isinstance(matriz, list) or len(matriz) != len(dias_semana):
+        raise ValueError(f"El horario debe tener {len(dias_semana)} días")
+
+    permitidos = None
+    if servicios_permitidos is not None:
+        permitidos = {codigo_servicio(valor) for valor in servicios_permitidos}
+
+    validada = []
+    for fila in matriz:
+        if not isinstance(fila, list) or len(fila) != len(turnos):
+            raise ValueError(f"Cada día del horario debe tener {len(turnos)} turnos")
+        for codigo in fila:
+            if not isinstance(codigo, int) or isinstance(codigo, bool):
+                raise ValueError(f"Código de servicio inválido: {codigo!r}")
+            if codigo != SIN_SERVICIO and codigo not in ETIQUETAS_SERVICIO:
+                raise ValueError(f"Código de servicio desconocido: {codigo}")
+            if codigo != SIN_SERVICIO and permitidos is not None and codigo not in permitidos:
+                raise ValueError(f"{ETIQUETAS_SERVICIO[codigo]} no está entre los servicios del consultorio")
+        validada.append(list(fila))
+    return validada
+
+
+# Celdas asignadas como (día, turno, etiqueta del servicio), en orden de día y turno
+def celdas(matriz):
+    for i, fila in enumerate(matriz or []):
+        for j, codigo in enumerate(fila):
+            if codigo != SIN_SERVICIO:
+                yield dias_semana[i], turnos[j], ETIQUETAS_SERVICIO[codigo]
+
+
+# Número de consultorios que se capturan según la respuesta a "¿Coincide con la realidad?"
+def numero_consultorios(coincide, consultorios_real, total_sistema):
+    numero = consultorios_real if coincide == 'no' else total_sistema
+    try:
+        numero = int(numero or 0)
+    except (TypeError, ValueError):
+        numero = 0
+    return max(0, min(numero, MAX_CONSULTORIOS))
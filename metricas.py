@@ -0,0 +1,171 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+import flask
+from dash.exceptions import PreventUpdate
+
+# ========== MÉTRICAS DE CALLBACKS (FORMATO PROMETHEUS) ==========
+
+# Límites superiores (segundos) de las cubetas del histograma de latencia
+CUBETAS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _MetricasCallback:
+    __slots__ = ('invocaciones', 'cubetas', 'suma_segundos', 'bytes_peticion', 'bytes_respuesta',
+                 'prevent_update', 'errores')
+
+    def __init__(self):
+        self.invocaciones = 0
+        self.cubetas = [0] * (len(CUBETAS_LATENCIA) + 1)  # la última es +Inf
+        self.suma_segundos = 0.0
+        self.bytes_peticion = 0
+        self.bytes_respuesta = 0
+        self.prevent_update = 0
+        self.errores = 0
+
+
+# Contadores en memoria del proceso; con gunicorn cada worker expone los suyos
+class RegistroMetricas:
+    def __init__(self):
+        self._candado = threading.Lock()
+        self._callbacks = {}
+        self._colectores = []
+
+    # Indicadores de otros componentes (p. ej. la cola de capturas): una función que devuelve
+    # tuplas (métrica, tipo, ayuda, valor) y se consulta en cada lectura de /metrics
+    def agregar_colector(self, colector):
+        self._colectores.append(colector)
+
+    def _metricas(self, nombre):
+        metricas = self._callbacks.get(nombre)
+        if metricas is None:
+            metricas = self._callbacks.setdefault(nombre, _MetricasCallback())
+        return metricas
+
+    def registrar(self, nombre, segundos, bytes_peticion, bytes_respuesta):
+        cubeta = bisect_left(CUBETAS_LATENCIA, segundos)
+        with self._candado:
+            metricas = self._metricas(nombre)
+            metricas.invocaciones += 1
+            metricas.cubetas[cubeta] += 1
+            metricas.suma_segundos += segundos
+            metricas.bytes_peticion += bytes_peticion
+            metricas.bytes_respuesta += bytes_respuesta
+
+    def contar_prevent_update(self, nombre):
+        with self._candado:
+            self._metricas(nombre).prevent_update += 1
+
+    def contar_error(self, nombre):
+        with self._candado:
+            self._metricas(nombre).errores += 1
+
+    def exportar(self):
+        with self._candado:
+            copia = {
+                nombre: (m.invocaciones, list(m.cubetas), m.suma_segundos, m.bytes_peticion,
+                         m.bytes_respuesta, m.prevent_update, m.errores)
+                for nombre, m in self._callbacks.items()
+            }
+
+        lineas = []
+
+        def serie(metrica, tipo, ayuda, valores):
+            lineas.append(f"# HELP {metrica} {ayuda}")
+            lineas.append(f"# TYPE {metrica} {tipo}")
+            lineas.extend(valores)
+
+        nombres = sorted(copia)
+        serie('infra_callback_invocaciones_total', 'counter', 'Invocaciones de cada callback.',
+              [f'infra_callback_invocaciones_total{{callback="{n}"}} {copia[n][0]}' for n in nombres])
+
+        histograma = []
+        for n in nombres:
+            invocaciones, cubetas, suma = copia[n][:3]
+            acumulado = 0
+            for limite, cantidad in zip(CUBETAS_LATENCIA, cubetas):
+                acumulado += cantidad
+                histograma.append(f'infra_callback_duracion_segundos_bucket{{callback="{n}",le="{limite}"}} {acumulado}')
+            histograma.append(f'infra_callback_duracion_segundos_bucket{{callback="{n}",le="+Inf"}} {invocaciones}')
+            histograma.append(f'infra_callback_duracion_segundos_sum{{callback="{n}"}} {suma:.6f}')
+            histograma.append(f'infra_callback_duracion_segundos_count{{callback="{n}"}} {invocaciones}')
+        serie('infra_callback_duracion_segundos', 'histogram',
+              'Tiempo de atención de la petición del callback (incluye serializar la respuesta).', histograma)
+
+        serie('infra_callback_bytes_peticion_total', 'counter', 'Bytes recibidos del navegador por callback.',
+              [f'infra_callback_bytes_peticion_total{{callback="{n}"}} {copia[n][3]}' for n in nombres])
+        serie('infra_callback_bytes_respuesta_total', 'counter',
+              'Bytes de respuesta por callback, antes de comprimir.',
+              [f'infra_callback_bytes_respuesta_total{{callback="{n}"}} {copia[n][4]}' for n in nombres])
+        serie('infra_callback_prevent_update_total', 'counter', 'Invocaciones que terminaron en PreventUpdate.',
+              [f'infra_callback_prevent_update_total{{callback="{n}"}} {copia[n][5]}' for n in nombres])
+        serie('infra_callback_errores_total', 'counter', 'Invocaciones que lanzaron una excepción.',
+              [f'infra_callback_errores_total{{callback="{n}"}} {copia[n][6]}' for n in nombres])
+
+        for colector in self._colectores:
+            for metrica, tipo, ayuda, valor in colector():
+                serie(metrica, tipo, ayuda, [f"{metrica} {valor}"])
+        return "\n".join(lineas) + "\n"
+
+
+registro = RegistroMetricas()
+
+
+# Envuelve app.callback para que cada callback declarado después quede instrumentado y
+# registra en el servidor la medición por petición y la ruta /metrics
+def instrumentar(app, ruta='/metrics', registro_metricas=registro):
+    server = app.server
+    ruta_callbacks = f"{app.config.url_base_pathname}_dash-update-component"
+    callback_original = app.callback
+
+    def callback(*args, **kwargs):
+        decorar = callback_original(*args, **kwargs)
+
+        def decorador(funcion):
+            nombre = funcion.__name__
+
+            @functools.wraps(funcion)
+            def medida(*a, **k):
+                flask.g.callback_medido = nombre
+                try:
+                    return funcion(*a, **k)
+                except PreventUpdate:
+                    registro_metricas.contar_prevent_update(nombre)
+                    raise
+                except Exception:
+                    registro_metricas.contar_error(nombre)
+                    raise
+
+            return decorar(medida)
+
+        return decorador
+
+    app.callback = callback
+
+    @server.before_request
+    def iniciar_medicion():
+        if flask.request.path == ruta_callbacks:
+            flask.g.inicio_callback = time.perf_counter()
+
+    # La latencia cubre toda la petición (despacho de Dash y serialización), no solo la función
+    @server.after_request
+    def terminar_medicion(respuesta):
+        nombre = flask.g.get('callback_medido')
+        if nombre is not None:
+            registro_metricas.registrar(
+                nombre,
+                time.perf_counter() - flask.g.inicio_callback,
+                flask.request.content_length or 0,
+                respuesta.calculate_content_length() or 0,
+            )
+        return respuesta
+
+    @server.route(ruta)
+    def metricas():
+        return flask.Response(registro_metricas.exportar(), content_type=TIPO_CONTENIDO)
+
+    return registro_metricas
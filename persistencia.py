@@ -0,0 +1,512 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+import bitacora
+import horarios
+import resumenes
+import sincronizacion
+
+BASE_DIR = Path(__file__).parent
+
+# ========== ALMACÉN DE CAPTURAS (SQLite en modo WAL) ==========
+RUTA_BD = Path(os.environ.get("INFRA_DB_PATH", BASE_DIR / "data/capturas.sqlite3"))
+
+# Máximo de capturas que se confirman juntas en una sola transacción
+MAX_LOTE = 256
+
+# Capturas que pueden esperar en la cola; con la cola llena se rechazan (backpressure)
+MAX_COLA = int(os.environ.get("INFRA_MAX_COLA_CAPTURAS", "1000"))
+# Cuánto espera un envío por lugar en la cola antes de rechazarse
+ESPERA_COLA = 0.5
+
+# Estados de envío recientes que se conservan en memoria para consultarlos por folio
+MAX_ESTADOS = 10000
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS unidades (
+    clues_imb TEXT PRIMARY KEY,
+    entidad TEXT,
+    coincide_consultorios TEXT,
+    consultorios_real INTEGER,
+    consultorios_sistema INTEGER,
+    folio TEXT,
+    actualizado_en TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS consultorios (
+    clues_imb TEXT NOT NULL REFERENCES unidades(clues_imb) ON DELETE CASCADE,
+    consultorio INTEGER NOT NULL,
+    servicios TEXT NOT NULL,
+    horarios TEXT NOT NULL,
+    actualizado_en TEXT NOT NULL,
+    PRIMARY KEY (clues_imb, consultorio)
+);
+CREATE INDEX IF NOT EXISTS idx_unidades_entidad ON unidades(entidad);
+CREATE TABLE IF NOT EXISTS folios (
+    folio TEXT PRIMARY KEY,
+    clues_imb TEXT NOT NULL,
+    actualizado_en TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resumen_capturas (
+    entidad TEXT PRIMARY KEY,
+    unidades INTEGER NOT NULL DEFAULT 0,
+    coinciden INTEGER NOT NULL DEFAULT 0,
+    no_coinciden INTEGER NOT NULL DEFAULT 0,
+    consultorios_sistema INTEGER NOT NULL DEFAULT 0,
+    consultorios_reportados INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+UPSERT_UNIDAD = """
+INSERT INTO unidades (clues_imb, entidad, coincide_consultorios, consultorios_real, consultorios_sistema, folio, actualizado_en)
+VALUES (:clues_imb, :entidad, :coincide_consultorios, :consultorios_real, :consultorios_sistema, :folio, :actualizado_en)
+ON CONFLICT(clues_imb) DO UPDATE SET
+    entidad = excluded.entidad,
+    coincide_consultorios = excluded.coincide_consultorios,
+    consultorios_real = excluded.consultorios_real,
+    consultorios_sistema = excluded.consultorios_sistema,
+    folio = excluded.folio,
+    actualizado_en = excluded.actualizado_en
+"""
+
+UPSERT_CONSULTORIO = """
+INSERT INTO consultorios (clues_imb, consultorio, servicios, horarios, actualizado_en)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(clues_imb, consultorio) DO UPDATE SET
+    servicios = excluded.servicios,
+    horarios = excluded.horarios,
+    actualizado_en = excluded.actualizado_en
+"""
+
+# Suma (o resta) la contribución de una captura a los contadores de su entidad
+ACUMULAR_RESUMEN = """
+INSERT INTO resumen_capturas (entidad, unidades, coinciden, no_coinciden, consultorios_sistema, consultorios_reportados)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(entidad) DO UPDATE SET
+    unidades = unidades + excluded.unidades,
+    coinciden = coinciden + excluded.coinciden,
+    no_coinciden = no_coinciden + excluded.no_coinciden,
+    consultorios_sistema = consultorios_sistema + excluded.consultorios_sistema,
+    consultorios_reportados = consultorios_reportados + excluded.consultorios_reportados
+"""
+
+# Contadores desde cero a partir de `unidades`, con las mismas reglas que resumenes.aporte_captura.
+# {llave} es la entidad (o una constante para el total nacional); sin unidades no inserta nada.
+SEMBRAR_RESUMEN = """
+INSERT INTO resumen_capturas (entidad, unidades, coinciden, no_coinciden, consultorios_sistema, consultorios_reportados)
+SELECT {llave}, COUNT(*),
+    SUM(CASE WHEN coincide_consultorios = 'si' THEN 1 ELSE 0 END),
+    SUM(CASE WHEN coincide_consultorios = 'no' THEN 1 ELSE 0 END),
+    SUM(COALESCE(consultorios_sistema, 0)),
+    SUM(CASE WHEN coincide_consultorios = 'no' THEN COALESCE(consultorios_real, 0) ELSE COALESCE(consultorios_sistema, 0) END)
+FROM unidades
+GROUP BY 1
+"""
+
+
+def conectar(ruta):
+    conexion = sqlite3.connect(ruta, timeout=30, isolation_level=None, check_same_thread=False)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    # FULL: cada COMMIT es durable; el costo del fsync se reparte entre todo el lote
+    conexion.execute("PRAGMA synchronous=FULL")
+    conexion.execute("PRAGMA foreign_keys=ON")
+    return conexion
+
+
+# Valida y normaliza una captura enviada desde "Guardar Información"
+def validar_captura(captura):
+    clues = captura.get('clues_imb')
+    if not clues:
+        raise ValueError("La captura no tiene CLUES")
+    if captura.get('coincide_consultorios') not in ('si', 'no', None):
+        raise ValueError(f"Valor inválido para coincide_consultorios: {captura.get('coincide_consultorios')}")
+
+    consultorios = []
+    for consultorio in captura.get('consultorios', []):
+        numero = int(consultorio['consultorio'])
+        if not 1 <= numero <= horarios.MAX_CONSULTORIOS:
+            raise ValueError(f"Número de consultorio inválido: {numero}")
+        servicios = list(consultorio.get('servicios') or [])
+        consultorios.append({
+            'consultorio': numero,
+            'servicios': servicios,
+            'horarios': horarios.validar_matriz(consultorio.get('horarios'), servicios),
+        })
+
+    consultorios_real = captura.get('consultorios_real')
+    consultorios_sistema = captura.get('consultorios_sistema')
+    return {
+        'clues_imb': clues,
+        'entidad': captura.get('entidad'),
+        'coincide_consultorios': captura.get('coincide_consultorios'),
+        'consultorios_real': int(consultorios_real) if consultorios_real is not None else None,
+        'consultorios_sistema': int(consultorios_sistema) if consultorios_sistema is not None else None,
+        'consultorios': consultorios,
+    }
+
+
+class ColaLlena(Exception):
+    pass
+
+
+# El worker se está deteniendo (cerrar()): para quien envía es lo mismo que una cola llena,
+# hay que reintentar más tarde (en otro worker)
+class AlmacenCerrado(ColaLlena):
+    pass
+
+
+# Las capturas se encolan y un solo hilo escritor las valida y confirma por lotes (group commit):
+# mientras se hace el fsync de un lote, las siguientes capturas se acumulan para el próximo.
+# El callback que guarda solo encola (write-behind) y responde con el folio del envío.
+class AlmacenCapturas:
+    def __init__(self, ruta=RUTA_BD, max_lote=MAX_LOTE, max_cola=MAX_COLA):
+        self.ruta = Path(ruta)
+        self.max_lote = max_lote
+        self.max_cola = max_cola
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._hilo = None
+        self._candado = threading.Lock()
+        self._cerrado = False
+        self._estados = OrderedDict()
+        self._contadores = {'encoladas': 0, 'rechazadas': 0, 'guardadas': 0, 'fallidas': 0, 'lotes': 0}
+        self._espera_segundos = 0.0
+
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        with closing(conectar(self.ruta)) as conexion:
+            conexion.executescript(ESQUEMA)
+            _migrar(conexion)
+
+    # El hilo escritor se inicia con la primera captura (no antes de un fork)
+    def _iniciar(self):
+        with self._candado:
+            if self._cerrado:
+                raise AlmacenCerrado("El almacén de capturas está cerrado")
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._escritor, name="escritor-capturas", daemon=True)
+                self._hilo.start()
+
+    # Encola una captura; el Future (con su folio en futuro.folio) se resuelve cuando su lote
+    # queda confirmado en disco. Si la cola sigue llena después de `espera` segundos, ColaLlena;
+    # si el almacén ya se cerró, AlmacenCerrado.
+    def enviar(self, captura, espera=ESPERA_COLA):
+        futuro = Future()
+        futuro.folio = uuid.uuid4().hex[:12]
+        self._iniciar()
+        try:
+            self._cola.put((captura, futuro, time.monotonic()), timeout=espera)
+        except queue.Full:
+            with self._candado:
+                self._contadores['rechazadas'] += 1
+            bitacora.advertencia('cola_capturas_llena', clues=_clues(captura), capacidad=self.max_cola)
+            raise ColaLlena(f"Hay {self.max_cola} capturas en espera") from None
+        with self._candado:
+            self._contadores['encoladas'] += 1
+            self._registrar_estado(futuro.folio, {'estado': 'pendiente', 'clues_imb': _clues(captura)})
+        # El folio une este evento (con la traza de la sesión) con el resultado del escritor
+        bitacora.evento('captura_encolada', folio=futuro.folio, clues=_clues(captura))
+        return futuro
+
+    # Write-behind: devuelve el folio en cuanto la captura está en la cola
+    def encolar(self, captura):
+        return self.enviar(captura).folio
+
+    # Cambios sincronizados desde el navegador; el escritor los aplica sobre lo guardado
+    # dentro de la misma transacción, así dos lotes seguidos de la misma unidad no se pisan
+    def encolar_cambios(self, clues_imb, cambios, entidad, consultorios_sistema):
+        return self.encolar(sincronizacion.CambiosUnidad(clues_imb, cambios, entidad, consultorios_sistema))
+
+    # Guarda y espera a que la captura sea durable
+    def guardar(self, captura, timeout=None):
+        return self.enviar(captura, espera=timeout).result(timeout)
+
+    def _registrar_estado(self, folio, estado):
+        self._estados[folio] = estado
+        self._estados.move_to_end(folio)
+        while len(self._estados) > MAX_ESTADOS:
+            self._estados.popitem(last=False)
+
+    # Estado de un envío por folio: en memoria mientras es reciente; si ya se guardó (quizá en
+    # otro worker o antes de reiniciar) se confirma en la tabla folios. None si no se conoce.
+    def estado_envio(self, folio):
+        with self._candado:
+            estado = self._estados.get(folio)
+        if estado is not None:
+            return dict(estado)
+        with closing(conectar(self.ruta)) as conexion:
+            fila = conexion.execute(
+                "SELECT clues_imb, actualizado_en FROM folios WHERE folio = ?", (folio,)
+            ).fetchone()
+        if fila is None:
+            return None
+        return {'estado': 'guardada', 'clues_imb': fila[0], 'actualizado_en': fila[1]}
+
+    # Indicadores de la cola para /metrics: (métrica, tipo, ayuda, valor)
+    def indicadores(self):
+        with self._candado:
+            contadores = dict(self._contadores)
+            espera = self._espera_segundos
+        return [
+            ('infra_cola_capturas_profundidad', 'gauge', 'Capturas en espera de escribirse.', self._cola.qsize()),
+            ('infra_cola_capturas_capacidad', 'gauge', 'Capacidad de la cola de capturas.', self.max_cola),
+            ('infra_cola_capturas_encoladas_total', 'counter', 'Capturas aceptadas en la cola.', contadores['encoladas']),
+            ('infra_cola_capturas_rechazadas_total', 'counter', 'Capturas rechazadas por cola llena.', contadores['rechazadas']),
+            ('infra_cola_capturas_guardadas_total', 'counter', 'Capturas confirmadas en disco.', contadores['guardadas']),
+            ('infra_cola_capturas_fallidas_total', 'counter', 'Capturas inválidas o que no se pudieron escribir.', contadores['fallidas']),
+            ('infra_cola_capturas_lotes_total', 'counter', 'Transacciones de group commit.', contadores['lotes']),
+            ('infra_cola_capturas_espera_segundos_total', 'counter', 'Tiempo acumulado entre encolar y confirmar.', espera),
+        ]
+
+    def _escritor(self):
+        conexion = conectar(self.ruta)
+        try:
+            while True:
+                elemento = self._cola.get()
+                if elemento is None:
+                    break
+                lote = [elemento]
+                detener = False
+                while len(lote) < self.max_lote:
+                    try:
+                        elemento = self._cola.get_nowait()
+                    except queue.Empty:
+                        break
+                    if elemento is None:
+                        detener = True
+                        break
+                    lote.append(elemento)
+                self._confirmar(conexion, lote)
+                if detener:
+                    break
+        finally:
+            conexion.close()
+
+    def _confirmar(self, conexion, lote):
+        ahora = datetime.now().isoformat(timespec='seconds')
+        resultados = []
+        try:
+            conexion.execute("BEGIN IMMEDIATE")
+            for captura, futuro, encolada in lote:
+                # Un SAVEPOINT por captura: una captura que falla no tumba al resto del lote
+                conexion.execute("SAVEPOINT captura")
+                try:
+                    if isinstance(captura, sincronizacion.CambiosUnidad):
+                        captura = sincronizacion.aplicar_cambios(_leer_unidad(conexion, captura.clues_imb), captura)
+                    captura = validar_captura(captura)
+                    _upsert(conexion, captura, ahora, futuro.folio)
+                    conexion.execute("RELEASE captura")
+                    resultados.append((futuro, encolada, captura['clues_imb'], None))
+                except (KeyError, TypeError, ValueError, sqlite3.Error) as e:
+                    conexion.execute("ROLLBACK TO captura")
+                    conexion.execute("RELEASE captura")
+                    if not isinstance(e, sqlite3.Error):
+                        e = ValueError(f"Captura inválida: {e}")
+                    resultados.append((futuro, encolada, None, e))
+            conexion.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conexion.in_transaction:
+                conexion.execute("ROLLBACK")
+            resultados = [(futuro, encolada, None, e) for _, futuro, encolada in lote]
+
+        confirmada = time.monotonic()
+        with self._candado:
+            self._contadores['lotes'] += 1
+            for futuro, encolada, resultado, error in resultados:
+                self._espera_segundos += confirmada - encolada
+                if error is not None:
+                    self._contadores['fallidas'] += 1
+                    estado = {'estado': 'error', 'error': str(error)}
+                else:
+                    self._contadores['guardadas'] += 1
+                    estado = {'estado': 'guardada', 'actualizado_en': ahora}
+                if futuro.folio in self._estados:
+                    self._estados[futuro.folio].update(estado)
+        for futuro, _, resultado, error in resultados:
+            if error is not None:
+                bitacora.advertencia('captura_fallida', folio=futuro.folio, error=str(error))
+                futuro.set_exception(error)
+            else:
+                futuro.set_result(resultado)
+
+    # Lectura de una unidad capturada (conexión propia: WAL permite leer mientras se escribe)
+    def leer_unidad(self, clues_imb):
+        with closing(conectar(self.ruta)) as conexion:
+            return _leer_unidad(conexion, clues_imb)
+
+    # Folio de lo último guardado de la unidad (None si no hay captura o es anterior a los folios)
+    def folio_guardado(self, clues_imb):
+        with closing(conectar(self.ruta)) as conexion:
+            fila = conexion.execute("SELECT folio FROM unidades WHERE clues_imb = ?", (clues_imb,)).fetchone()
+        return fila[0] if fila else None
+
+    # Contadores de capturas de una entidad (o NACIONAL); None si aún no hay capturas
+    def leer_resumen(self, entidad=resumenes.NACIONAL):
+        with closing(conectar(self.ruta)) as conexion:
+            conexion.row_factory = sqlite3.Row
+            fila = conexion.execute("SELECT * FROM resumen_capturas WHERE entidad = ?", (entidad,)).fetchone()
+        if fila is None:
+            return None
+        resumen = dict(fila)
+        resumen.pop('entidad')
+        return resumen
+
+    # Detiene el hilo escritor después de confirmar lo que ya estaba en la cola (flush)
+    def cerrar(self):
+        with self._candado:
+            self._cerrado = True
+            hilo = self._hilo
+        if hilo is not None and hilo.is_alive():
+            self._cola.put(None)
+            hilo.join()
+
+
+def _clues(captura):
+    if isinstance(captura, sincronizacion.CambiosUnidad):
+        return captura.clues_imb
+    return captura.get('clues_imb')
+
+
+def _leer_unidad(conexion, clues_imb):
+    unidad = conexion.execute(
+        "SELECT clues_imb, entidad, coincide_consultorios, consultorios_real, consultorios_sistema, folio, actualizado_en "
+        "FROM unidades WHERE clues_imb = ?",
+        (clues_imb,),
+    ).fetchone()
+    if unidad is None:
+        return None
+    registro = dict(zip(
+        ('clues_imb', 'entidad', 'coincide_consultorios', 'consultorios_real', 'consultorios_sistema', 'folio', 'actualizado_en'),
+        unidad,
+    ))
+    consultorios = conexion.execute(
+        "SELECT consultorio, servicios, horarios FROM consultorios WHERE clues_imb = ? ORDER BY consultorio",
+        (clues_imb,),
+    ).fetchall()
+    registro['consultorios'] = [
+        {'consultorio': consultorio, 'servicios': json.loads(servicios), 'horarios': json.loads(matriz)}
+        for consultorio, servicios, matriz in consultorios
+    ]
+    return registro
+
+
+# Bases creadas antes de los resúmenes y los folios: agrega las columnas, llena resumen_capturas
+# una sola vez y pasa a la tabla folios el último folio que ya tenía cada unidad
+def _migrar(conexion):
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        columnas = {fila[1] for fila in conexion.execute("PRAGMA table_info(unidades)")}
+        for columna, tipo in (('consultorios_sistema', 'INTEGER'), ('folio', 'TEXT')):
+            if columna not in columnas:
+                conexion.execute(f"ALTER TABLE unidades ADD COLUMN {columna} {tipo}")
+        vacio = conexion.execute("SELECT 1 FROM resumen_capturas LIMIT 1").fetchone() is None
+        # En SQL y no en Polars: corre en el hilo de quien crea el almacén (AlmacenCapturas.__init__,
+        # antes de que exista el hilo escritor), quizá en un worker recién creado con fork, y dentro
+        # de BEGIN IMMEDIATE, que bloquea a los escritores de otros procesos mientras dura
+        if vacio:
+            conexion.execute(SEMBRAR_RESUMEN.format(llave="COALESCE(entidad, ?)"), (resumenes.SIN_ENTIDAD,))
+            conexion.execute(SEMBRAR_RESUMEN.format(llave="?"), (resumenes.NACIONAL,))
+        if conexion.execute("SELECT 1 FROM folios LIMIT 1").fetchone() is None:
+            conexion.execute(
+                "INSERT OR IGNORE INTO folios (folio, clues_imb, actualizado_en) "
+                "SELECT folio, clues_imb, actualizado_en FROM unidades WHERE folio IS NOT NULL"
+            )
+        conexion.execute("COMMIT")
+    except sqlite3.Error:
+        conexion.execute("ROLLBACK")
+        raise
+
+
+# Resta la contribución de la captura anterior de la unidad y suma la nueva, en su entidad y en
+# el total nacional. Corre dentro del SAVEPOINT de la captura: si esta falla, el resumen no cambia.
+def _actualizar_resumen(conexion, anterior, nueva):
+    deltas = {}
+    for signo, fila in ((-1, anterior), (1, nueva)):
+        if fila is None:
+            continue
+        entidad, coincide, consultorios_real, consultorios_sistema = fila
+        aporte = resumenes.aporte_captura(coincide, consultorios_real, consultorios_sistema)
+        for llave in (entidad or resumenes.SIN_ENTIDAD, resumenes.NACIONAL):
+            acumulado = deltas.setdefault(llave, [0] * len(aporte))
+            for i, valor in enumerate(aporte):
+                acumulado[i] += signo * valor
+    conexion.executemany(ACUMULAR_RESUMEN, [
+        (llave, *delta) for llave, delta in deltas.items() if any(delta)
+    ])
+
+
+# Reenvíos de la misma CLUES reemplazan la captura anterior (upsert idempotente)
+def _upsert(conexion, captura, ahora, folio=None):
+    anterior = conexion.execute(
+        "SELECT entidad, coincide_consultorios, consultorios_real, consultorios_sistema FROM unidades WHERE clues_imb = ?",
+        (captura['clues_imb'],),
+    ).fetchone()
+    conexion.execute(UPSERT_UNIDAD, {
+        'clues_imb': captura['clues_imb'],
+        'entidad': captura['entidad'],
+        'coincide_consultorios': captura['coincide_consultorios'],
+        'consultorios_real': captura['consultorios_real'],
+        'consultorios_sistema': captura['consultorios_sistema'],
+        'folio': folio,
+        'actualizado_en': ahora,
+    })
+    _actualizar_resumen(conexion, anterior, (
+        captura['entidad'], captura['coincide_consultorios'],
+        captura['consultorios_real'], captura['consultorios_sistema'],
+    ))
+    # Todos los folios aplicados, no solo el último de la unidad, para consultarlos después
+    if folio is not None:
+        conexion.execute(
+            "INSERT OR IGNORE INTO folios (folio, clues_imb, actualizado_en) VALUES (?, ?, ?)",
+            (folio, captura['clues_imb'], ahora),
+        )
+    numeros = [c['consultorio'] for c in captura['consultorios']]
+    conexion.executemany(UPSERT_CONSULTORIO, [
+        (
+            captura['clues_imb'],
+            c['consultorio'],
+            json.dumps(c['servicios'], ensure_ascii=False),
+            json.dumps(c['horarios'], separators=(',', ':')),
+            ahora,
+        )
+        for c in captura['consultorios']
+    ])
+    # Consultorios que ya no vienen en la captura se eliminan
+    if numeros:
+        marcadores = ", ".join("?" for _ in numeros)
+        conexion.execute(
+            f"DELETE FROM consultorios WHERE clues_imb = ? AND consultorio NOT IN ({marcadores})",
+            [captura['clues_imb'], *numeros],
+        )
+    else:
+        conexion.execute("DELETE FROM consultorios WHERE clues_imb = ?", (captura['clues_imb'],))
+
+
+_almacen = None
+_almacen_candado = threading.Lock()
+
+
+# Almacén compartido por el proceso; se cierra (vaciando la cola) al salir
+def obtener_almacen():
+    global _almacen
+    with _almacen_candado:
+        if _almacen is None:
+            _almacen = AlmacenCapturas()
+            atexit.register(_almacen.cerrar)
+        return _almacen
+
+
+# Vacía la cola y detiene el escritor si el almacén llegó a crearse (salida de un worker)
+def cerrar_almacen():
+    with _almacen_candado:
+        almacen = _almacen
+    if almacen is not None:
+        almacen.cerrar()
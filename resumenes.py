@@ -0,0 +1,67 @@
+import polars as pl
+
+# ========== RESÚMENES DE CAPACIDAD POR ENTIDAD ==========
+# Los totales del catálogo se calculan una vez por snapshot (consulta lazy de Polars); los de
+# las capturas los mantiene persistencia.py de forma incremental en la tabla resumen_capturas.
+# Leer el resumen de una entidad es una búsqueda por llave en ambos lados.
+
+# Llave del total nacional (se guarda junto a las entidades)
+NACIONAL = 'NACIONAL'
+SIN_ENTIDAD = 'SIN ENTIDAD'
+
+COLUMNAS_CAPACIDAD = [
+    'consultorios_generales_habilitados', 'consultorios_generales_inhabilitados', 'total_consultorios_generales',
+    'consultorios_de_especialidad_habilitados', 'consultorios_de_especialidad_inhabilitados',
+    'total_consultorios_de_especialidad',
+    'quirofanos_habilitados', 'quirofanos_inhabilitados', 'total_de_quirofanos',
+]
+
+# Contadores por entidad de lo capturado. consultorios_reportados es el total del sistema si la
+# unidad respondió que coincide y el número real si no; la discrepancia es la diferencia.
+CAMPOS_CAPTURAS = ['unidades', 'coinciden', 'no_coinciden', 'consultorios_sistema', 'consultorios_reportados']
+
+
+# Totales del catálogo por entidad y nacional; cada CLUES cuenta una sola vez
+def resumen_catalogo(df):
+    columnas = [c for c in COLUMNAS_CAPACIDAD if c in df.columns]
+    agregados = [pl.count().alias('unidades')] + [pl.col(c).fill_null(0).sum().alias(c) for c in columnas]
+    unidades = (
+        df.lazy()
+        .filter(pl.col('clues_imb').is_not_null())
+        .unique(subset='clues_imb', keep='first')
+        .with_columns(pl.col('entidad').cast(pl.Utf8).fill_null(SIN_ENTIDAD))
+    )
+    por_entidad, nacional = pl.collect_all([
+        unidades.group_by('entidad').agg(agregados),
+        unidades.select(agregados),
+    ])
+
+    resumen = {fila.pop('entidad'): fila for fila in por_entidad.iter_rows(named=True)}
+    resumen[NACIONAL] = nacional.row(0, named=True)
+    return resumen
+
+
+# Contribución de una unidad capturada a los contadores de CAMPOS_CAPTURAS
+def aporte_captura(coincide, consultorios_real, consultorios_sistema):
+    sistema = consultorios_sistema or 0
+    no_coincide = coincide == 'no'
+    return (
+        1,
+        int(coincide == 'si'),
+        int(no_coincide),
+        sistema,
+        (consultorios_real or 0) if no_coincide else sistema,
+    )
+
+
+# Resumen para los tableros: capacidad del catálogo, avance de captura y discrepancias
+def combinar(catalogo, capturas):
+    catalogo = catalogo or {'unidades': 0}
+    capturas = capturas or dict.fromkeys(CAMPOS_CAPTURAS, 0)
+    unidades = catalogo.get('unidades') or 0
+    return {
+        'catalogo': catalogo,
+        'capturas': capturas,
+        'avance': capturas['unidades'] / unidades if unidades else 0.0,
+        'discrepancia_consultorios': capturas['consultorios_reportados'] - capturas['consultorios_sistema'],
+    }
@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import flask
+
+import bitacora
+
+# ========== ESTADO DE CAPTURA POR SESIÓN (SERVIDOR) ==========
+# Lo que cada sesión del navegador lleva capturado de cada unidad, armado en el servidor con los
+# lotes de cambios de /api/sincronizar. Así los callbacks que necesitan la captura completa (la
+# exportación a Excel) reciben solo la CLUES, no todos los stores del navegador.
+#
+# Por defecto vive en memoria del proceso (LRU con caducidad y tope de memoria). Con
+# INFRA_SESIONES_URL (redis://...) se guarda en un servidor compatible con Redis y lo comparten
+# todos los workers. Es una caché: si una entrada no está o ya no coincide con lo guardado en
+# SQLite, se usa lo guardado.
+
+COOKIE_SESION = 'infra_sesion'
+URL = os.environ.get("INFRA_SESIONES_URL", "")
+# Caducidad desde la última escritura (una jornada de captura)
+TTL_SEGUNDOS = int(os.environ.get("INFRA_SESIONES_TTL", str(8 * 3600)))
+MAX_MB = float(os.environ.get("INFRA_SESIONES_MAX_MB", "64"))
+# Folios que recuerda cada entrada para compararse con lo guardado
+MAX_FOLIOS = 20
+
+_FORMATO_SESION = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _clave(sesion, clues):
+    return f"{sesion}:{clues}"
+
+
+# LRU en memoria: cada entrada se guarda como JSON (su tamaño es lo que cuenta contra el tope).
+# Al rebasar max_bytes se desaloja la usada hace más tiempo; las caducadas se quitan al leerlas
+# o al pasar por el extremo viejo de la lista.
+class SesionesEnMemoria:
+    def __init__(self, ttl=TTL_SEGUNDOS, max_bytes=int(MAX_MB * 2**20)):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()   # clave -> (expira, bytes)
+        self._bytes = 0
+        self._candado = threading.Lock()
+        self._contadores = dict.fromkeys(('aciertos', 'fallos', 'caducadas', 'desalojadas'), 0)
+
+    def _quitar(self, clave):
+        _, valor = self._entradas.pop(clave)
+        self._bytes -= len(valor)
+
+    def leer(self, clave):
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] <= time.monotonic():
+                self._quitar(clave)
+                self._contadores['caducadas'] += 1
+                entrada = None
+            if entrada is None:
+                self._contadores['fallos'] += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._contadores['aciertos'] += 1
+        return json.loads(entrada[1])
+
+    def guardar(self, clave, valor):
+        datos = json.dumps(valor, separators=(',', ':')).encode()
+        if len(datos) > self.max_bytes:
+            return
+        ahora = time.monotonic()
+        with self._candado:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (ahora + self.ttl, datos)
+            self._bytes += len(datos)
+            while self._bytes > self.max_bytes or (self._entradas and next(iter(self._entradas.values()))[0] <= ahora):
+                vieja = next(iter(self._entradas))
+                causa = 'caducadas' if self._entradas[vieja][0] <= ahora else 'desalojadas'
+                self._quitar(vieja)
+                self._contadores[causa] += 1
+
+    def indicadores(self):
+        with self._candado:
+            contadores = dict(self._contadores)
+            entradas, ocupados = len(self._entradas), self._bytes
+        return [
+            ('infra_sesiones_entradas', 'gauge', 'Unidades en curso guardadas en la caché de sesiones.', entradas),
+            ('infra_sesiones_bytes', 'gauge', 'Memoria ocupada por la caché de sesiones.', ocupados),
+            ('infra_sesiones_capacidad_bytes', 'gauge', 'Tope de memoria de la caché de sesiones.', self.max_bytes),
+            ('infra_sesiones_aciertos_total', 'counter', 'Lecturas encontradas en la caché de sesiones.', contadores['aciertos']),
+            ('infra_sesiones_fallos_total', 'counter', 'Lecturas no encontradas en la caché de sesiones.', contadores['fallos']),
+            ('infra_sesiones_caducadas_total', 'counter', 'Entradas quitadas por caducidad.', contadores['caducadas']),
+            ('infra_sesiones_desalojadas_total', 'counter', 'Entradas desalojadas por el tope de memoria.', contadores['desalojadas']),
+        ]
+
+
+# Servidor compatible con Redis (Redis, Valkey, KeyDB...). Caducidad y tope de memoria los aplica
+# el servidor (SET ... EX y maxmemory-policy allkeys-lru); un error se trata como fallo de caché.
+class SesionesRedis:
+    def __init__(self, cliente, ttl=TTL_SEGUNDOS, prefijo='infra:sesion:'):
+        self.cliente = cliente
+        self.ttl = ttl
+        self.prefijo = prefijo
+        self._candado = threading.Lock()
+        self._contadores = dict.fromkeys(('aciertos', 'fallos', 'errores'), 0)
+
+    def _contar(self, contador):
+        with self._candado:
+            self._contadores[contador] += 1
+
+    def leer(self, clave):
+        try:
+            datos = self.cliente.get(self.prefijo + clave)
+        except Exception as e:
+            self._contar('errores')
+            bitacora.advertencia('sesiones_error', operacion='leer', error=str(e))
+            return None
+        self._contar('fallos' if datos is None else 'aciertos')
+        return None if datos is None else json.loads(datos)
+
+    def guardar(self, clave, valor):
+        try:
+            self.cliente.set(self.prefijo + clave, json.dumps(valor, separators=(',', ':')), ex=self.ttl)
+        except Exception as e:
+            self._contar('errores')
+            bitacora.advertencia('sesiones_error', operacion='guardar', error=str(e))
+
+    def indicadores(self):
+        with self._candado:
+            contadores = dict(self._contadores)
+        return [
+            ('infra_sesiones_aciertos_total', 'counter', 'Lecturas encontradas en la caché de sesiones.', contadores['aciertos']),
+            ('infra_sesiones_fallos_total', 'counter', 'Lecturas no encontradas en la caché de sesiones.', contadores['fallos']),
+            ('infra_sesiones_errores_total', 'counter', 'Errores al hablar con el servidor de sesiones.', contadores['errores']),
+        ]
+
+
+def crear_almacen(url=URL):
+    if not url:
+        return SesionesEnMemoria()
+    try:
+        import redis
+    except ImportError:
+        # Sin el cliente instalado (pip install redis) se sigue con la caché en memoria
+        bitacora.advertencia('sesiones_sin_redis', respaldo='memoria')
+        return SesionesEnMemoria()
+    return SesionesRedis(redis.Redis.from_url(url, socket_timeout=0.5))
+
+
+almacen = crear_almacen()
+
+
+def sesion_actual():
+    return flask.g.get('sesion') if flask.has_request_context() else None
+
+
+# Captura en curso de una unidad en la sesión actual, si sigue al día con SQLite. Con varios
+# workers otro proceso pudo guardar cambios de la unidad después de armarla: la entrada solo vale
+# si el folio guardado (`folio_guardado`) es uno de los que ya incluye, el de lo que había al
+# armarla o los de sus propios envíos (que quizá siguen en la cola). Devuelve {'captura', 'folios'};
+# None si no hay sesión, no está en caché o está vieja.
+def leer_captura(clues, folio_guardado):
+    sesion = sesion_actual()
+    entrada = almacen.leer(_clave(sesion, clues)) if sesion else None
+    if entrada is None or folio_guardado not in entrada.get('folios', ()):
+        return None
+    return entrada
+
+
+def guardar_captura(captura, folios):
+    sesion = sesion_actual()
+    if sesion:
+        entrada = {'captura': captura, 'folios': list(folios)[-MAX_FOLIOS:]}
+        almacen.guardar(_clave(sesion, captura['clues_imb']), entrada)
+
+
+# Asigna a cada navegador un id de sesión (cookie de sesión) disponible en flask.g.sesion. Es
+# distinto de la traza de bitácora: la traza aparece en los logs y este da acceso a la captura.
+def registrar(server, ruta_cookie='/'):
+    @server.before_request
+    def asignar_sesion():
+        sesion = flask.request.cookies.get(COOKIE_SESION, '')
+        flask.g.sesion_nueva = not _FORMATO_SESION.match(sesion)
+        flask.g.sesion = uuid.uuid4().hex if flask.g.sesion_nueva else sesion
+
+    @server.after_request
+    def enviar_sesion(respuesta):
+        if flask.g.get('sesion_nueva'):
+            respuesta.set_cookie(COOKIE_SESION, flask.g.sesion, path=ruta_cookie, httponly=True, samesite='Lax')
+        return respuesta
@@ -0,0 +1,144 @@
+from typing import NamedTuple
+
+import horarios
+
+# ========== SINCRONIZACIÓN DE CAMBIOS CAPTURADOS SIN CONEXIÓN ==========
+# El navegador guarda la captura en curso en localStorage y acumula los cambios compactados
+# (el último valor de cada celda, checklist o respuesta). Cuando hay conexión los envía en un
+# solo lote a /api/sincronizar. Formato de cada cambio:
+#   ['u', clues, coincide, consultorios_real]            respuesta de "¿Coincide con la realidad?"
+#   ['s', clues, consultorio, [servicios]]               servicios de un consultorio
+#   ['c', clues, consultorio, dia, turno, codigo]        celda del horario (índices y código)
+
+# Cambios que se aceptan por lote
+MAX_CAMBIOS = 5000
+# Tope de consultorios_real: solo descarta números absurdos (la captura se recorta a MAX_CONSULTORIOS)
+MAX_CONSULTORIOS_REAL = 10000
+
+
+# Cambios de una unidad pendientes de aplicarse sobre lo que ya está guardado. `entidad` y
+# `consultorios_sistema` vienen del catálogo, no del navegador.
+class CambiosUnidad(NamedTuple):
+    clues_imb: str
+    cambios: list
+    entidad: str
+    consultorios_sistema: int
+
+
+def _entero(valor, minimo, maximo, nombre):
+    if not isinstance(valor, int) or isinstance(valor, bool) or not minimo <= valor <= maximo:
+        raise ValueError(f"{nombre} inválido: {valor!r}")
+    return valor
+
+
+def _servicios(valores):
+    for valor in valores:
+        if not isinstance(valor, str):
+            raise ValueError(f"Servicio inválido: {valor!r}")
+        horarios.codigo_servicio(valor)
+    return list(valores)
+
+
+# Lote rechazado. `indices` son las posiciones en 'cambios' de los cambios que lo invalidan
+# (vacío si el problema es el lote completo): el navegador descarta solo esos y reenvía el resto.
+class LoteInvalido(ValueError):
+    def __init__(self, mensaje, indices=()):
+        super().__init__(mensaje)
+        self.indices = list(indices)
+
+
+def _normalizar(cambio):
+    if not isinstance(cambio, list) or len(cambio) < 2 or not isinstance(cambio[1], str) or not cambio[1]:
+        raise ValueError(f"Cambio inválido: {cambio!r}")
+    tipo = cambio[0]
+    if tipo == 'u' and len(cambio) == 4:
+        if cambio[2] not in ('si', 'no', None):
+            raise ValueError(f"Valor inválido para coincide_consultorios: {cambio[2]!r}")
+        consultorios_real = cambio[3]
+        if consultorios_real is not None:
+            consultorios_real = _entero(consultorios_real, 0, MAX_CONSULTORIOS_REAL, "Consultorios reales")
+        return {'tipo': 'unidad', 'coincide': cambio[2], 'consultorios_real': consultorios_real}
+    if tipo == 's' and len(cambio) == 4 and isinstance(cambio[3], list):
+        return {
+            'tipo': 'servicios',
+            'consultorio': _entero(cambio[2], 1, horarios.MAX_CONSULTORIOS, "Consultorio"),
+            'servicios': _servicios(cambio[3]),
+        }
+    if tipo == 'c' and len(cambio) == 6:
+        return {
+            'tipo': 'celda',
+            'consultorio': _entero(cambio[2], 1, horarios.MAX_CONSULTORIOS, "Consultorio"),
+            'dia': _entero(cambio[3], 0, len(horarios.dias_semana) - 1, "Día"),
+            'turno': _entero(cambio[4], 0, len(horarios.turnos) - 1, "Turno"),
+            'codigo': _entero(cambio[5], horarios.SIN_SERVICIO, len(horarios.servicios_options), "Código"),
+        }
+    raise ValueError(f"Cambio inválido: {cambio!r}")
+
+
+# Valida la forma del lote y lo agrupa por CLUES, conservando el orden de llegada. Si hay
+# cambios inválidos, LoteInvalido los señala todos (no solo el primero).
+def leer_lote(cuerpo):
+    if not isinstance(cuerpo, dict) or not isinstance(cuerpo.get('cambios'), list):
+        raise LoteInvalido("El lote debe tener una lista 'cambios'")
+    if len(cuerpo['cambios']) > MAX_CAMBIOS:
+        raise LoteInvalido(f"El lote tiene más de {MAX_CAMBIOS} cambios")
+
+    por_clues = {}
+    invalidos = {}
+    for indice, cambio in enumerate(cuerpo['cambios']):
+        try:
+            normalizado = _normalizar(cambio)
+        except ValueError as e:
+            invalidos[indice] = str(e)
+            continue
+        por_clues.setdefault(cambio[1], []).append(normalizado)
+    if invalidos:
+        primero = next(iter(invalidos.values()))
+        otros = f" (y {len(invalidos) - 1} cambios más)" if len(invalidos) > 1 else ""
+        raise LoteInvalido(f"{primero}{otros}", invalidos)
+    return por_clues
+
+
+# Posiciones en el lote de los cambios de una CLUES (para rechazar solo esa unidad)
+def indices_de(cuerpo, clues):
+    return [indice for indice, cambio in enumerate(cuerpo['cambios']) if cambio[1] == clues]
+
+
+# Aplica los cambios sobre la unidad guardada (o vacía) y devuelve la captura completa para
+# validar_captura. Las celdas con servicios que ya no están en el consultorio se limpian: sin
+# conexión el orden en que se editaron checklist y horario no está garantizado.
+def aplicar_cambios(base, pendientes):
+    base = base or {}
+    coincide = base.get('coincide_consultorios')
+    consultorios_real = base.get('consultorios_real')
+    servicios = {c['consultorio']: list(c['servicios']) for c in base.get('consultorios', [])}
+    matrices = {c['consultorio']: [list(fila) for fila in c['horarios']] for c in base.get('consultorios', [])}
+
+    for cambio in pendientes.cambios:
+        if cambio['tipo'] == 'unidad':
+            coincide, consultorios_real = cambio['coincide'], cambio['consultorios_real']
+        elif cambio['tipo'] == 'servicios':
+            servicios[cambio['consultorio']] = cambio['servicios']
+        else:
+            matriz = matrices.setdefault(cambio['consultorio'], horarios.matriz_vacia())
+            matriz[cambio['dia']][cambio['turno']] = cambio['codigo']
+
+    numero = horarios.numero_consultorios(coincide, consultorios_real, pendientes.consultorios_sistema)
+    consultorios = []
+    for i in range(1, numero + 1):
+        seleccion = servicios.get(i, [])
+        permitidos = {horarios.codigo_servicio(valor) for valor in seleccion}
+        matriz = [
+            [codigo if codigo in permitidos else horarios.SIN_SERVICIO for codigo in fila]
+            for fila in matrices.get(i) or horarios.matriz_vacia()
+        ]
+        consultorios.append({'consultorio': i, 'servicios': seleccion, 'horarios': matriz})
+
+    return {
+        'clues_imb': pendientes.clues_imb,
+        'entidad': pendientes.entidad,
+        'coincide_consultorios': coincide,
+        'consultorios_real': consultorios_real if coincide == 'no' else None,
+        'consultorios_sistema': pendientes.consultorios_sistema,
+        'consultorios': consultorios,
+    }
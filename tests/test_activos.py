@@ -0,0 +1,21 @@
+import pytest
+
+import activos
+
+
+def test_fuentes_versionadas_se_sirven_con_huella():
+    recursos = activos.cargar('/infraestructura/')
+    for nombre in activos.FUENTES:
+        assert recursos.url(nombre).startswith('/infraestructura/recursos/montserrat-')
+    assert recursos.hojas_estilo()[0] != activos.FUENTES_REMOTAS
+
+
+def test_recurso_faltante_usa_origen_remoto(tmp_path):
+    recursos = activos.cargar('/infraestructura/', tmp_path)
+    assert recursos.url('logo_imss.svg') == activos.ORIGENES['logo_imss.svg']
+    assert set(recursos.faltantes()) == {*activos.ORIGENES, *activos.FUENTES}
+
+
+def test_recurso_faltante_detiene_el_arranque_estricto(tmp_path):
+    with pytest.raises(RuntimeError, match='logo_imss.svg'):
+        activos.cargar('/infraestructura/', tmp_path, estricto=True)
@@ -0,0 +1,136 @@
+import polars as pl
+import pytest
+
+import busqueda
+import catalogo
+import datos
+import resumenes
+
+ENTIDADES = ['AGUASCALIENTES', 'JALISCO', 'SONORA']
+
+
+def _infraestructura(unidades):
+    return pl.DataFrame({
+        'clues_imb': [f"CL{i:05d}" for i in range(unidades)],
+        **{columna: [(i * (j + 3)) % 17 for i in range(unidades)] for j, columna in enumerate(resumenes.COLUMNAS_CAPACIDAD)},
+    })
+
+
+# Catálogo CLUES: cubre casi toda la infraestructura (algunas unidades sin catálogo) y trae
+# unidades que no están en infraestructura. YUCATAN tiene pocas unidades.
+def _catalogo(unidades):
+    clues = [f"CL{i:05d}" for i in range(unidades) if i % 11 != 5] + ['FUERA1', 'FUERA2']
+    return pl.DataFrame({
+        'clues_imb': clues,
+        'entidad': [
+            'JALISCO' if not c.startswith('CL') else 'YUCATAN' if int(c[2:]) % 50 == 0 else ENTIDADES[int(c[2:]) % len(ENTIDADES)]
+            for c in clues
+        ],
+        'nombre_de_la_unidad': [f"Unidad medica {c[-3:]}" for c in clues],
+    })
+
+
+# Mes siguiente: altas (también de unidades que no estaban en el catálogo), cambios de entidad
+# y de nombre (uno a una entidad nueva y otro a sin nombre) y bajas, entre ellas todas las
+# unidades de una entidad
+def _catalogo_siguiente(anterior, unidades, fraccion):
+    cambios = max(1, int(unidades * fraccion))
+    filas = {fila['clues_imb']: fila for fila in anterior.iter_rows(named=True)}
+    for i in range(cambios):
+        clues = f"CL{(i * 7) % unidades:05d}"
+        if clues in filas:
+            filas[clues] = {**filas[clues], 'entidad': ENTIDADES[(i + 1) % len(ENTIDADES)], 'nombre_de_la_unidad': f"Clinica renombrada {i}"}
+    filas['CL00001'] = {**filas['CL00001'], 'entidad': 'ZACATECAS'}
+    filas['CL00002'] = {**filas['CL00002'], 'nombre_de_la_unidad': None}
+    for i in range(5, unidades, 55):
+        clues = f"CL{i:05d}"
+        filas[clues] = {'clues_imb': clues, 'entidad': 'SONORA', 'nombre_de_la_unidad': f"Alta {i}"}
+    for clues in [c for c, fila in filas.items() if fila['entidad'] == 'YUCATAN'] + ['FUERA1', 'CL00003']:
+        filas.pop(clues, None)
+    filas['FUERA3'] = {'clues_imb': 'FUERA3', 'entidad': 'SONORA', 'nombre_de_la_unidad': 'Fuera'}
+    return pl.DataFrame(list(filas.values()), schema=anterior.schema)
+
+
+def _snapshot(infraestructura, catalogo_clues, version):
+    df = datos._compactar(infraestructura.join(catalogo_clues, on='clues_imb', how='left'))
+    return datos.construir_snapshot(df, version, catalogo_version=version)
+
+
+def _resultados(indice, consultas):
+    return {consulta: indice.opciones(consulta, limite=50) for consulta in consultas}
+
+
+def _comparar(incremental, completo):
+    columnas = completo.df_merged.columns
+    assert incremental.df_merged.columns == columnas
+    assert incremental.df_merged.with_columns(pl.col('entidad').cast(pl.Utf8)).equals(
+        completo.df_merged.with_columns(pl.col('entidad').cast(pl.Utf8))
+    )
+    assert incremental.df_merged['entidad'].dtype == completo.df_merged['entidad'].dtype
+    assert incremental.entidades_options == completo.entidades_options
+    assert incremental.opciones_por_entidad == completo.opciones_por_entidad
+    assert incremental.registros_por_clues == completo.registros_por_clues
+    assert incremental.resumen_por_entidad == completo.resumen_por_entidad
+
+    assert len(incremental.indice_busqueda) == len(completo.indice_busqueda)
+    consultas = [
+        'unidad', 'medica', 'clinica', 'renombrada', 'alta', 'cl000', 'CL00001', 'cl00003', 'fuera',
+        'clinica renombrada 1', 'zacatecas', 'un', 'a', 'x',
+    ]
+    assert _resultados(incremental.indice_busqueda, consultas) == _resultados(completo.indice_busqueda, consultas)
+    for clues in completo.registros_por_clues:
+        assert incremental.indice_busqueda.etiqueta(clues) == completo.indice_busqueda.etiqueta(clues)
+
+
+# Pocos cambios: el índice se actualiza con huecos. Muchos: con_cambios lo reconstruye.
+@pytest.mark.parametrize('fraccion', [0.02, busqueda.MAX_ELIMINADOS * 2])
+def test_delta_igual_a_reconstruir_completo(fraccion):
+    unidades = 400
+    infraestructura = _infraestructura(unidades)
+    anterior = catalogo.normalizar(_catalogo(unidades))
+    nuevo = catalogo.normalizar(_catalogo_siguiente(anterior, unidades, fraccion))
+    delta = catalogo.diferencias(anterior, nuevo)
+    assert set(delta['operacion']) == {catalogo.ALTA, catalogo.CAMBIO, catalogo.BAJA}
+
+    incremental = datos.aplicar_delta_catalogo(_snapshot(infraestructura, anterior, 1), delta, 2)
+    completo = _snapshot(infraestructura, nuevo, 2)
+    assert incremental.catalogo_version == 2
+    _comparar(incremental, completo)
+
+
+# Varios meses seguidos (y volver al catálogo original) sobre el mismo snapshot incremental
+def test_deltas_encadenados_igual_a_reconstruir_completo():
+    unidades = 300
+    infraestructura = _infraestructura(unidades)
+    catalogos = [catalogo.normalizar(_catalogo(unidades))]
+    for fraccion in (0.01, 0.05, 0.1):
+        catalogos.append(catalogo.normalizar(_catalogo_siguiente(catalogos[-1], unidades, fraccion)))
+    catalogos.append(catalogos[0])
+
+    incremental = _snapshot(infraestructura, catalogos[0], 1)
+    for version, (anterior, nuevo) in enumerate(zip(catalogos, catalogos[1:]), start=2):
+        incremental = datos.aplicar_delta_catalogo(incremental, catalogo.diferencias(anterior, nuevo), version)
+        _comparar(incremental, _snapshot(infraestructura, nuevo, version))
+
+
+def test_versiones_registran_el_delta_y_se_ponen_al_dia(tmp_path):
+    unidades = 200
+    anterior = _catalogo(unidades)
+    nuevo = _catalogo_siguiente(catalogo.normalizar(anterior), unidades, 0.05)
+    versiones = catalogo.VersionesCatalogo(tmp_path)
+
+    base, delta = versiones.registrar(anterior, {'ruta': 'clues_julio.xlsx', 'sha256': 'a'})
+    assert base['version'] == 1 and base['base'] and delta is None
+    entrada, delta = versiones.registrar(nuevo, {'ruta': 'clues_agosto.xlsx', 'sha256': 'b'})
+    assert entrada['version'] == 2
+    assert (entrada['altas'], entrada['cambios'], entrada['bajas']) == tuple(
+        int((delta['operacion'] == operacion).sum()) for operacion in (catalogo.ALTA, catalogo.CAMBIO, catalogo.BAJA)
+    )
+    assert versiones.registrar(nuevo, {'ruta': 'clues_agosto.xlsx', 'sha256': 'b'}) == (entrada, None)
+    assert versiones.version_de('b') == 2
+
+    pendientes = versiones.deltas_desde(1)
+    assert [e['version'] for e, _ in pendientes] == [2]
+    assert pendientes[0][1].sort('clues_imb').equals(delta.sort('clues_imb'))
+    assert versiones.deltas_desde(2) == []
+    assert versiones.deltas_desde(7) is None
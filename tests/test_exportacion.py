@@ -0,0 +1,53 @@
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+import exportacion
+import horarios
+from persistencia import AlmacenCapturas
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    ruta = tmp_path / 'capturas.sqlite3'
+    almacen = AlmacenCapturas(ruta)
+    matriz = horarios.matriz_vacia()
+    matriz[0][0] = horarios.codigo_servicio('pediatria')
+    for clues, entidad in (('A', 'JALISCO'), ('B', 'SONORA')):
+        almacen.enviar({
+            'clues_imb': clues, 'entidad': entidad, 'coincide_consultorios': 'si', 'consultorios_real': None,
+            'consultorios_sistema': 1,
+            'consultorios': [{'consultorio': 1, 'servicios': ['pediatria'], 'horarios': matriz}],
+        }).result(5)
+    almacen.cerrar()
+    return ruta
+
+
+def test_formato_desconocido_se_rechaza_antes_de_generar(ruta):
+    with pytest.raises(ValueError):
+        exportacion.exportar('ods', None, ruta)
+
+
+def test_xlsx_nacional(ruta):
+    libro = load_workbook(io.BytesIO(b''.join(exportacion.exportar('xlsx', None, ruta))))
+    assert [fila[0] for fila in libro['Capturas'].values] == ['CLUES', 'A', 'B']
+
+
+def test_xlsx_pasa_a_otra_hoja_al_llenar_una(ruta, monkeypatch):
+    monkeypatch.setattr(exportacion, 'FILAS_POR_HOJA', 2)
+    libro = load_workbook(io.BytesIO(b''.join(exportacion.exportar('xlsx', None, ruta))))
+    assert libro.sheetnames == ['Capturas', 'Capturas 2']
+    assert [fila[0] for fila in libro['Capturas 2'].values] == ['CLUES', 'B']
+
+
+def test_xlsx_de_una_entidad(ruta):
+    libro = load_workbook(io.BytesIO(b''.join(exportacion.exportar('xlsx', 'JALISCO', ruta))))
+    filas = list(libro['Capturas'].values)
+    assert filas[0] == tuple(exportacion.COLUMNAS)
+    assert [fila[0] for fila in filas[1:]] == ['A']
+
+
+def test_csv_nacional(ruta):
+    texto = b''.join(exportacion.exportar('csv', None, ruta)).decode('utf-8-sig')
+    assert [linea.split(',')[0] for linea in texto.splitlines()] == ['CLUES', 'A', 'B']
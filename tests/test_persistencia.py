@@ -0,0 +1,252 @@
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+import horarios
+import persistencia
+import resumenes
+from persistencia import AlmacenCapturas
+from sincronizacion import CambiosUnidad, leer_lote
+
+AHORA = '2026-01-01T00:00:00'
+PEDIATRIA = horarios.codigo_servicio('pediatria')
+GINECOLOGIA = horarios.codigo_servicio('ginecologia')
+
+
+def _captura(clues='A', entidad='JALISCO', coincide='si', real=None, sistema=2, consultorios=None):
+    return {
+        'clues_imb': clues,
+        'entidad': entidad,
+        'coincide_consultorios': coincide,
+        'consultorios_real': real,
+        'consultorios_sistema': sistema,
+        'consultorios': consultorios or [],
+    }
+
+
+def _cambios(clues, cambios, entidad='JALISCO', sistema=2):
+    return CambiosUnidad(clues, leer_lote({'cambios': cambios})[clues], entidad, sistema)
+
+
+@pytest.fixture
+def conexion(tmp_path):
+    with closing(persistencia.conectar(tmp_path / 'capturas.sqlite3')) as conexion:
+        conexion.executescript(persistencia.ESQUEMA)
+        yield conexion
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    almacen = AlmacenCapturas(tmp_path / 'capturas.sqlite3')
+    yield almacen
+    almacen.cerrar()
+
+
+def _resumen(conexion):
+    conexion.row_factory = sqlite3.Row
+    filas = {fila['entidad']: dict(fila) for fila in conexion.execute("SELECT * FROM resumen_capturas")}
+    conexion.row_factory = None
+    # Una entidad que se quedó sin unidades conserva su fila en ceros
+    return {
+        entidad: {campo: fila[campo] for campo in resumenes.CAMPOS_CAPTURAS}
+        for entidad, fila in filas.items() if any(fila[campo] for campo in resumenes.CAMPOS_CAPTURAS)
+    }
+
+
+# Recuento de referencia: los contadores de resumen_capturas desde cero, unidad por unidad
+def _resumen_desde_cero(conexion):
+    filas = conexion.execute(
+        "SELECT entidad, coincide_consultorios, consultorios_real, consultorios_sistema FROM unidades"
+    )
+    resumen = {}
+    for entidad, coincide, real, sistema in filas:
+        aporte = resumenes.aporte_captura(coincide, real, sistema)
+        for llave in (entidad or resumenes.SIN_ENTIDAD, resumenes.NACIONAL):
+            acumulado = resumen.setdefault(llave, dict.fromkeys(resumenes.CAMPOS_CAPTURAS, 0))
+            for campo, valor in zip(resumenes.CAMPOS_CAPTURAS, aporte):
+                acumulado[campo] += valor
+    return resumen
+
+
+# ========== _upsert y resumen_capturas ==========
+
+def test_upsert_suma_la_unidad_a_su_entidad_y_al_nacional(conexion):
+    persistencia._upsert(conexion, _captura('A', coincide='no', real=5, sistema=3), AHORA, 'f1')
+    persistencia._upsert(conexion, _captura('B', entidad='SONORA', sistema=4), AHORA, 'f2')
+
+    resumen = _resumen(conexion)
+    assert resumen['JALISCO'] == {
+        'unidades': 1, 'coinciden': 0, 'no_coinciden': 1, 'consultorios_sistema': 3, 'consultorios_reportados': 5,
+    }
+    assert resumen[resumenes.NACIONAL] == {
+        'unidades': 2, 'coinciden': 1, 'no_coinciden': 1, 'consultorios_sistema': 7, 'consultorios_reportados': 9,
+    }
+    assert resumen == _resumen_desde_cero(conexion)
+
+
+def test_upsert_repetido_reemplaza_la_contribucion_anterior(conexion):
+    persistencia._upsert(conexion, _captura('A', coincide='si', sistema=3), AHORA, 'f1')
+    persistencia._upsert(conexion, _captura('A', coincide='si', sistema=3), AHORA, 'f1')
+    persistencia._upsert(conexion, _captura('A', coincide='no', real=1, sistema=3), AHORA, 'f2')
+
+    resumen = _resumen(conexion)
+    assert resumen['JALISCO']['unidades'] == 1
+    assert resumen['JALISCO']['coinciden'] == 0
+    assert resumen['JALISCO']['consultorios_reportados'] == 1
+    assert resumen == _resumen_desde_cero(conexion)
+
+
+def test_upsert_mueve_la_unidad_de_entidad_y_sin_entidad(conexion):
+    persistencia._upsert(conexion, _captura('A', entidad='JALISCO'), AHORA)
+    persistencia._upsert(conexion, _captura('A', entidad='SONORA'), AHORA)
+    persistencia._upsert(conexion, _captura('B', entidad=None), AHORA)
+
+    resumen = _resumen(conexion)
+    assert 'JALISCO' not in resumen
+    assert resumen['SONORA']['unidades'] == 1
+    assert resumen[resumenes.SIN_ENTIDAD]['unidades'] == 1
+    assert resumen[resumenes.NACIONAL]['unidades'] == 2
+    assert resumen == _resumen_desde_cero(conexion)
+
+
+def test_upsert_reemplaza_y_elimina_consultorios(conexion):
+    consultorio = {'consultorio': 1, 'servicios': ['pediatria'], 'horarios': horarios.matriz_vacia()}
+    persistencia._upsert(conexion, _captura('A', consultorios=[consultorio, {**consultorio, 'consultorio': 2}]), AHORA)
+    persistencia._upsert(conexion, _captura('A', consultorios=[consultorio]), AHORA)
+    assert [c['consultorio'] for c in persistencia._leer_unidad(conexion, 'A')['consultorios']] == [1]
+
+    persistencia._upsert(conexion, _captura('A'), AHORA)
+    assert persistencia._leer_unidad(conexion, 'A')['consultorios'] == []
+
+
+def test_actualizar_resumen_sin_cambio_no_escribe(conexion):
+    fila = ('JALISCO', 'si', None, 3)
+    persistencia._actualizar_resumen(conexion, fila, fila)
+    assert conexion.execute("SELECT COUNT(*) FROM resumen_capturas").fetchone()[0] == 0
+
+
+def test_migracion_llena_el_resumen_desde_las_unidades(conexion):
+    conexion.executemany(
+        "INSERT INTO unidades (clues_imb, entidad, coincide_consultorios, consultorios_real, consultorios_sistema, actualizado_en) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            ('A', 'JALISCO', 'si', None, 3, AHORA),
+            ('B', 'JALISCO', 'no', 5, 2, AHORA),
+            ('C', 'SONORA', 'no', None, None, AHORA),
+            ('D', None, None, None, 4, AHORA),
+        ],
+    )
+    persistencia._migrar(conexion)
+
+    resumen = _resumen(conexion)
+    assert resumen['JALISCO'] == {
+        'unidades': 2, 'coinciden': 1, 'no_coinciden': 1, 'consultorios_sistema': 5, 'consultorios_reportados': 8,
+    }
+    assert resumen[resumenes.NACIONAL]['unidades'] == 4
+    assert resumen == _resumen_desde_cero(conexion)
+
+
+def test_migracion_sin_unidades_no_crea_resumen(conexion):
+    persistencia._migrar(conexion)
+    assert conexion.execute("SELECT COUNT(*) FROM resumen_capturas").fetchone()[0] == 0
+
+
+# ========== Escritor y folios ==========
+
+def test_folios_anteriores_se_reconocen_despues_de_reiniciar(tmp_path):
+    ruta = tmp_path / 'capturas.sqlite3'
+    almacen = AlmacenCapturas(ruta)
+    primero = almacen.enviar(_captura('A'))
+    segundo = almacen.enviar(_captura('A', coincide='no', real=1))
+    primero.result(5)
+    segundo.result(5)
+    almacen.cerrar()
+
+    reiniciado = AlmacenCapturas(ruta)
+    try:
+        assert reiniciado.estado_envio(primero.folio)['estado'] == 'guardada'
+        assert reiniciado.estado_envio(segundo.folio) == {
+            'estado': 'guardada', 'clues_imb': 'A', 'actualizado_en': reiniciado.leer_unidad('A')['actualizado_en'],
+        }
+        assert reiniciado.estado_envio('desconocido') is None
+        assert reiniciado.folio_guardado('A') == segundo.folio
+        assert reiniciado.leer_unidad('A')['folio'] == segundo.folio
+    finally:
+        reiniciado.cerrar()
+
+
+def test_lotes_independientes_en_cualquier_orden_llegan_al_mismo_estado(tmp_path):
+    primero = [['s', 'A', 1, ['pediatria']], ['c', 'A', 1, 0, 0, PEDIATRIA]]
+    segundo = [['u', 'A', 'no', 2], ['s', 'A', 2, ['ginecologia']], ['c', 'A', 2, 1, 1, GINECOLOGIA]]
+
+    estados = []
+    for orden in ((primero, segundo), (segundo, primero)):
+        almacen = AlmacenCapturas(tmp_path / f"capturas_{len(estados)}.sqlite3")
+        try:
+            for cambios in orden:
+                almacen.enviar(_cambios('A', cambios)).result(5)
+            unidad = almacen.leer_unidad('A')
+            estados.append((unidad['coincide_consultorios'], unidad['consultorios_real'], unidad['consultorios']))
+        finally:
+            almacen.cerrar()
+    assert estados[0] == estados[1]
+    assert estados[0][2][0]['horarios'][0][0] == PEDIATRIA
+    assert estados[0][2][1]['horarios'][1][1] == GINECOLOGIA
+
+
+# Sin conexión el orden entre checklist y horario no está garantizado: una celda que llega antes
+# que su servicio se limpia, y la siguiente vez que se envía queda guardada
+def test_celda_que_llega_antes_que_su_servicio_se_limpia(almacen):
+    almacen.enviar(_cambios('A', [['c', 'A', 1, 0, 0, PEDIATRIA]])).result(5)
+    assert almacen.leer_unidad('A')['consultorios'][0]['horarios'][0][0] == horarios.SIN_SERVICIO
+
+    almacen.enviar(_cambios('A', [['s', 'A', 1, ['pediatria']], ['c', 'A', 1, 0, 0, PEDIATRIA]])).result(5)
+    assert almacen.leer_unidad('A')['consultorios'][0]['horarios'][0][0] == PEDIATRIA
+
+
+def test_lote_reenviado_no_cambia_la_captura_ni_el_resumen(almacen):
+    cambios = [['u', 'A', 'no', 1], ['s', 'A', 1, ['pediatria']], ['c', 'A', 1, 0, 0, PEDIATRIA]]
+    almacen.enviar(_cambios('A', cambios)).result(5)
+    antes = almacen.leer_unidad('A')
+    resumen = almacen.leer_resumen('JALISCO')
+
+    almacen.enviar(_cambios('A', cambios)).result(5)
+    despues = almacen.leer_unidad('A')
+    assert despues['consultorios'] == antes['consultorios']
+    assert despues['folio'] != antes['folio']
+    assert almacen.leer_resumen('JALISCO') == resumen
+    assert almacen.estado_envio(antes['folio'])['estado'] == 'guardada'
+
+
+def test_captura_invalida_no_tumba_el_resto_del_lote(almacen):
+    invalida = almacen.enviar(_captura('A', consultorios=[{'consultorio': 0, 'servicios': [], 'horarios': None}]))
+    valida = almacen.enviar(_captura('B'))
+    assert valida.result(5) == 'B'
+    with pytest.raises(ValueError):
+        invalida.result(5)
+    assert almacen.leer_unidad('A') is None
+    assert almacen.estado_envio(invalida.folio)['estado'] == 'error'
+    assert almacen.leer_resumen()['unidades'] == 1
+
+
+def test_almacen_cerrado_se_reporta_como_cola_llena(almacen):
+    almacen.cerrar()
+    with pytest.raises(persistencia.AlmacenCerrado):
+        almacen.enviar(_captura('A'))
+    assert issubclass(persistencia.AlmacenCerrado, persistencia.ColaLlena)
+
+
+def test_migracion_pasa_los_folios_existentes(tmp_path):
+    ruta = tmp_path / 'capturas.sqlite3'
+    almacen = AlmacenCapturas(ruta)
+    folio = almacen.enviar(_captura('A')).folio
+    almacen.cerrar()
+    with closing(persistencia.conectar(ruta)) as conexion:
+        conexion.execute("DROP TABLE folios")
+
+    migrado = AlmacenCapturas(ruta)
+    try:
+        assert migrado.estado_envio(folio)['estado'] == 'guardada'
+    finally:
+        migrado.cerrar()
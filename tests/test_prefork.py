@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+# Lo que hace gunicorn con preload_app: el maestro importa wsgi y hace fork; el worker carga los
+# datos (post_fork) y atiende. Corre en un proceso aparte porque este ya usó Polars en otras pruebas.
+GUION = textwrap.dedent("""
+    import os
+    import sys
+
+    import polars as pl
+
+    import wsgi
+
+    wsgi.crear_app()
+    pid = os.fork()
+    if pid == 0:
+        wsgi.iniciar_worker()
+        df = wsgi.aplicacion.datos.snapshot_actual().df_merged
+        por_entidad = df.group_by('entidad').agg(pl.count().alias('unidades'))
+        assert por_entidad['unidades'].sum() == len(df)
+        # Escritor de capturas: migra la base y llena resumen_capturas en su primera escritura
+        almacen = wsgi.aplicacion.persistencia.obtener_almacen()
+        almacen.enviar({
+            'clues_imb': 'A', 'entidad': 'JALISCO', 'coincide_consultorios': 'si',
+            'consultorios_real': None, 'consultorios_sistema': 2, 'consultorios': [],
+        }).result(30)
+        wsgi.detener_worker()
+        os._exit(0)
+    _, estado = os.waitpid(pid, 0)
+    sys.exit(os.waitstatus_to_exitcode(estado))
+""")
+
+
+def test_worker_consulta_polars_despues_del_fork(tmp_path):
+    entorno = {
+        **os.environ,
+        'INFRA_PREFORK': '1',
+        'INFRA_CARGA_DIFERIDA': '0',
+        'INFRA_CACHE_DIR': str(tmp_path / 'cache'),
+        'INFRA_DB_PATH': str(tmp_path / 'capturas.sqlite3'),
+    }
+    resultado = subprocess.run(
+        [sys.executable, '-c', GUION], cwd=RAIZ, env=entorno, capture_output=True, text=True, timeout=120,
+    )
+    assert resultado.returncode == 0, resultado.stderr
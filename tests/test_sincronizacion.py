@@ -0,0 +1,205 @@
+import pytest
+
+import horarios
+import sincronizacion
+from sincronizacion import CambiosUnidad, aplicar_cambios, leer_lote
+
+CLUES = 'BCIMB000010'
+PEDIATRIA = horarios.codigo_servicio('pediatria')
+GINECOLOGIA = horarios.codigo_servicio('ginecologia')
+
+
+# ========== leer_lote ==========
+
+@pytest.mark.parametrize('cuerpo', [
+    None,
+    [],
+    {},
+    {'cambios': 'u'},
+    {'cambios': [['u']]},
+    {'cambios': [['u', '', 'si', None]]},
+    {'cambios': [['u', 7, 'si', None]]},
+    {'cambios': [('u', CLUES, 'si', None)]},
+    {'cambios': [['x', CLUES, 'si', None]]},
+    {'cambios': [['u', CLUES, 'si']]},
+    {'cambios': [['s', CLUES, 1, 'pediatria']]},
+    {'cambios': [['s', CLUES, 1, ['no_existe']]]},
+    {'cambios': [['s', CLUES, 1, [3]]]},
+    {'cambios': [['s', CLUES, 0, []]]},
+    {'cambios': [['s', CLUES, horarios.MAX_CONSULTORIOS + 1, []]]},
+    {'cambios': [['c', CLUES, 1, 0, 0]]},
+    {'cambios': [['c', CLUES, 1, len(horarios.dias_semana), 0, 0]]},
+    {'cambios': [['c', CLUES, 1, 0, len(horarios.turnos), 0]]},
+    {'cambios': [['c', CLUES, 1, 0, 0, len(horarios.servicios_options) + 1]]},
+    {'cambios': [['c', CLUES, 1, 0, 0, -1]]},
+    {'cambios': [['c', CLUES, True, 0, 0, 1]]},
+])
+def test_leer_lote_rechaza_lotes_mal_formados(cuerpo):
+    with pytest.raises(ValueError):
+        leer_lote(cuerpo)
+
+
+def test_leer_lote_rechaza_mas_de_max_cambios():
+    cambios = [['u', CLUES, 'si', None]] * (sincronizacion.MAX_CAMBIOS + 1)
+    with pytest.raises(ValueError):
+        leer_lote({'cambios': cambios})
+
+
+@pytest.mark.parametrize('consultorios_real', [-5, '7', [3], True, 2.0, {'n': 3}, sincronizacion.MAX_CONSULTORIOS_REAL + 1])
+def test_leer_lote_rechaza_consultorios_real_invalido(consultorios_real):
+    with pytest.raises(ValueError):
+        leer_lote({'cambios': [['u', CLUES, 'no', consultorios_real]]})
+
+
+@pytest.mark.parametrize('coincide', ['sí', 'NO', '', 1, True, ['si']])
+def test_leer_lote_rechaza_coincide_invalido(coincide):
+    with pytest.raises(ValueError):
+        leer_lote({'cambios': [['u', CLUES, coincide, None]]})
+
+
+def test_leer_lote_senala_todos_los_cambios_invalidos():
+    cuerpo = {'cambios': [
+        ['u', CLUES, 'si', None],
+        ['s', CLUES, 1, ['no_existe']],
+        ['c', CLUES, 1, 0, 0, PEDIATRIA],
+        ['u', 'OTRA', 'no', -1],
+    ]}
+    with pytest.raises(sincronizacion.LoteInvalido) as error:
+        leer_lote(cuerpo)
+    assert error.value.indices == [1, 3]
+
+
+def test_lote_sin_lista_de_cambios_no_senala_cambios():
+    with pytest.raises(sincronizacion.LoteInvalido) as error:
+        leer_lote({'cambios': 'u'})
+    assert error.value.indices == []
+
+
+def test_indices_de_una_clues():
+    cuerpo = {'cambios': [['u', CLUES, 'si', None], ['u', 'OTRA', 'si', None], ['c', CLUES, 1, 0, 0, PEDIATRIA]]}
+    assert sincronizacion.indices_de(cuerpo, CLUES) == [0, 2]
+
+
+@pytest.mark.parametrize('coincide, consultorios_real', [('si', None), ('no', 0), ('no', 12), (None, None)])
+def test_leer_lote_acepta_respuestas_validas(coincide, consultorios_real):
+    por_clues = leer_lote({'cambios': [['u', CLUES, coincide, consultorios_real]]})
+    assert por_clues == {CLUES: [{'tipo': 'unidad', 'coincide': coincide, 'consultorios_real': consultorios_real}]}
+
+
+def test_leer_lote_agrupa_por_clues_en_orden_de_llegada():
+    por_clues = leer_lote({'cambios': [
+        ['c', CLUES, 1, 0, 0, PEDIATRIA],
+        ['s', 'OTRA', 2, ['pediatria']],
+        ['s', CLUES, 1, ['pediatria']],
+    ]})
+    assert list(por_clues) == [CLUES, 'OTRA']
+    assert [cambio['tipo'] for cambio in por_clues[CLUES]] == ['celda', 'servicios']
+    assert por_clues['OTRA'] == [{'tipo': 'servicios', 'consultorio': 2, 'servicios': ['pediatria']}]
+
+
+# ========== aplicar_cambios ==========
+
+def _pendientes(cambios, consultorios_sistema=2):
+    return CambiosUnidad(CLUES, leer_lote({'cambios': cambios})[CLUES], 'BAJA CALIFORNIA', consultorios_sistema)
+
+
+def test_aplicar_cambios_sobre_unidad_sin_captura():
+    captura = aplicar_cambios(None, _pendientes([
+        ['u', CLUES, 'si', None],
+        ['s', CLUES, 1, ['pediatria']],
+        ['c', CLUES, 1, 0, 0, PEDIATRIA],
+    ]))
+    assert captura['clues_imb'] == CLUES
+    assert captura['entidad'] == 'BAJA CALIFORNIA'
+    assert captura['coincide_consultorios'] == 'si'
+    assert captura['consultorios_sistema'] == 2
+    assert [c['consultorio'] for c in captura['consultorios']] == [1, 2]
+    assert captura['consultorios'][0]['servicios'] == ['pediatria']
+    assert captura['consultorios'][0]['horarios'][0][0] == PEDIATRIA
+    assert captura['consultorios'][1] == {'consultorio': 2, 'servicios': [], 'horarios': horarios.matriz_vacia()}
+
+
+def test_aplicar_cambios_conserva_lo_guardado_y_el_ultimo_valor_gana():
+    base = aplicar_cambios(None, _pendientes([
+        ['u', CLUES, 'si', None],
+        ['s', CLUES, 1, ['pediatria', 'ginecologia']],
+        ['c', CLUES, 1, 0, 0, PEDIATRIA],
+        ['c', CLUES, 1, 1, 1, GINECOLOGIA],
+    ]))
+    captura = aplicar_cambios(base, _pendientes([
+        ['c', CLUES, 1, 0, 0, GINECOLOGIA],
+        ['c', CLUES, 1, 0, 0, horarios.SIN_SERVICIO],
+        ['c', CLUES, 1, 2, 2, PEDIATRIA],
+    ]))
+    matriz = captura['consultorios'][0]['horarios']
+    assert matriz[0][0] == horarios.SIN_SERVICIO
+    assert matriz[1][1] == GINECOLOGIA
+    assert matriz[2][2] == PEDIATRIA
+    assert captura['coincide_consultorios'] == 'si'
+    # La base no se modifica
+    assert base['consultorios'][0]['horarios'][0][0] == PEDIATRIA
+
+
+def test_aplicar_cambios_limpia_celdas_de_servicios_quitados():
+    captura = aplicar_cambios(None, _pendientes([
+        ['c', CLUES, 1, 0, 0, PEDIATRIA],
+        ['s', CLUES, 1, ['pediatria', 'ginecologia']],
+        ['c', CLUES, 1, 0, 1, GINECOLOGIA],
+        ['s', CLUES, 1, ['ginecologia']],
+    ]))
+    matriz = captura['consultorios'][0]['horarios']
+    assert matriz[0][0] == horarios.SIN_SERVICIO
+    assert matriz[0][1] == GINECOLOGIA
+
+
+def test_aplicar_cambios_sigue_el_numero_real_de_consultorios():
+    captura = aplicar_cambios(None, _pendientes([['u', CLUES, 'no', 3]], consultorios_sistema=5))
+    assert captura['consultorios_real'] == 3
+    assert len(captura['consultorios']) == 3
+
+    captura = aplicar_cambios(captura, _pendientes([['u', CLUES, 'si', 3]], consultorios_sistema=5))
+    assert captura['consultorios_real'] is None
+    assert len(captura['consultorios']) == 5
+
+
+# ========== /api/sincronizar ==========
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    monkeypatch.setenv('INFRA_CARGA_DIFERIDA', '0')
+    import app
+    import datos
+    import persistencia
+
+    datos.esperar_carga(60)
+    almacen = persistencia.AlmacenCapturas(tmp_path / 'capturas.sqlite3')
+    monkeypatch.setattr(persistencia, '_almacen', almacen)
+    yield app.server.test_client()
+    almacen.cerrar()
+
+
+def test_lote_con_clues_desconocida_conserva_solo_sus_cambios(cliente):
+    import datos
+
+    conocida = next(iter(datos.snapshot_actual().registros_por_clues))
+    respuesta = cliente.post('/infraestructura/api/sincronizar', json={'cambios': [
+        ['u', 'NOEXISTE0001', 'si', None],
+        ['u', conocida, 'si', None],
+        ['c', 'NOEXISTE0001', 1, 0, 0, PEDIATRIA],
+    ]})
+    assert respuesta.status_code == 202
+    cuerpo = respuesta.get_json()
+    assert list(cuerpo['folios']) == [conocida]
+    assert cuerpo['errores'] == {'NOEXISTE0001': 'CLUES desconocida'}
+    assert cuerpo['pendientes'] == [0, 2]
+
+
+def test_lote_durante_el_cierre_del_worker_pide_reintentar(cliente):
+    import datos
+    import persistencia
+
+    persistencia.obtener_almacen().cerrar()
+    conocida = next(iter(datos.snapshot_actual().registros_por_clues))
+    respuesta = cliente.post('/infraestructura/api/sincronizar', json={'cambios': [['u', conocida, 'si', None]]})
+    assert respuesta.status_code == 503
+    assert respuesta.headers['Retry-After'] == '2'
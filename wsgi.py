@@ -0,0 +1,38 @@
+import gc
+import os
+
+# ========== PUNTO DE ENTRADA PARA SERVIDORES PRE-FORK ==========
+# gunicorn "wsgi:crear_app()" con preload_app (ver gunicorn.conf.py): el proceso maestro
+# importa app.py una sola vez y los workers lo heredan con el fork. El maestro no ejecuta nada de
+# Polars: su pool de hilos no sobrevive al fork y la primera consulta de un worker (un group_by,
+# una recarga) se quedaría bloqueada para siempre. Cada worker carga los datos después del fork,
+# desde la caché Arrow mapeada en memoria (el sistema comparte esas páginas entre workers). Por
+# defecto en un hilo (el puerto queda abierto de inmediato y /readyz avisa cuando terminó); con
+# INFRA_CARGA_DIFERIDA=0 antes de que el worker acepte conexiones.
+os.environ.setdefault("INFRA_PREFORK", "1")
+
+import app as aplicacion
+
+
+def crear_app():
+    # Los objetos ya cargados pasan a la generación permanente del GC: así las recolecciones
+    # de los workers no los recorren ni escriben en sus páginas (evita copias por copy-on-write)
+    gc.collect()
+    gc.freeze()
+    return aplicacion.server
+
+
+# Se llama en cada worker después del fork
+def iniciar_worker():
+    if aplicacion.CARGA_DIFERIDA:
+        aplicacion.datos.cargar_en_segundo_plano(aplicacion.INTERVALO_VIGILANCIA, inicio=aplicacion.INICIO_ARRANQUE)
+        return
+    aplicacion.datos.cargar_inicial()
+    if aplicacion.INTERVALO_VIGILANCIA > 0:
+        aplicacion.datos.iniciar_vigilancia(aplicacion.INTERVALO_VIGILANCIA)
+
+
+# Se llama cuando un worker termina (apagado o reciclaje por max_requests): las capturas que
+# siguen en la cola se escriben antes de salir
+def detener_worker():
+    aplicacion.persistencia.cerrar_almacen()